@@ -2,8 +2,11 @@ import azure.functions as func
 import json
 import logging
 from azure.data.tables import TableServiceClient, UpdateMode
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
 import os
 
+@instrumented('add_credentials')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request to add credentials.')
 
@@ -21,7 +24,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
         table_client = table_service_client.get_table_client('CloudCredentials')
 
         entity = {
@@ -0,0 +1,80 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from alibabacloud_ecs20140526.client import Client as EcsClient
+from alibabacloud_tea_openapi import models as open_api_models
+from alibabacloud_ecs20140526 import models as ecs_models
+from instrumentation import bind, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION = 'cn-hangzhou'
+
+# DescribeInstances returns at most 100 instances per call
+PAGE_SIZE = 100
+MAX_REGION_WORKERS = 8
+
+def client_factory(access_key_id, access_key_secret):
+    """Returns region_id -> EcsClient; tests pass their own factory instead."""
+    def create(region_id):
+        config = open_api_models.Config(
+            access_key_id=access_key_id,
+            access_key_secret=access_key_secret,
+            region_id=region_id
+        )
+        return EcsClient(config)
+    return create
+
+def list_regions(client):
+    with span('alibaba', 'ecs', 'DescribeRegions'):
+        response = client.describe_regions(ecs_models.DescribeRegionsRequest())
+    return [region.region_id for region in response.body.regions.region]
+
+def iter_instance_pages(client, region_id):
+    """Yield one region's instances a page at a time, following NextToken."""
+    next_token = None
+    while True:
+        request = ecs_models.DescribeInstancesRequest(
+            region_id=region_id,
+            max_results=PAGE_SIZE,
+            next_token=next_token
+        )
+        with span('alibaba', 'ecs', 'DescribeInstances', region_id):
+            body = client.describe_instances(request).body
+        instances = body.instances.instance if body.instances else []
+        if instances:
+            yield instances
+        next_token = body.next_token
+        if not next_token:
+            return
+
+def collect_instances(create_client, on_page, home_region=DEFAULT_REGION):
+    """
+    Scan every region DescribeRegions reports, in parallel, handing each page
+    of instances to on_page(region_id, instances) as it arrives so writes can
+    start before the scan ends. on_page calls never overlap. A region that fails
+    is logged and skipped; returns {region_id: error message} for those.
+    """
+    try:
+        regions = list_regions(create_client(home_region))
+    except Exception as e:
+        logger.warning(f"DescribeRegions failed, scanning only {home_region}: {e}")
+        regions = [home_region]
+    logger.info(f"Scanning {len(regions)} Alibaba Cloud regions.")
+
+    lock = threading.Lock()
+    errors = {}
+
+    def scan(region_id):
+        try:
+            client = create_client(region_id)
+            for instances in iter_instance_pages(client, region_id):
+                with lock:
+                    on_page(region_id, instances)
+        except Exception as e:
+            logger.warning(f"Could not scan Alibaba Cloud region {region_id}: {e}")
+            errors[region_id] = str(e)
+
+    with ThreadPoolExecutor(max_workers=min(len(regions), MAX_REGION_WORKERS)) as executor:
+        list(executor.map(bind(scan), regions))
+    return errors
@@ -0,0 +1,514 @@
+"""
+Local stand-ins for the services the ingestion functions call, used by the
+benchmarks so runs need no cloud account and count every call they make.
+
+- InMemoryTableService: the slice of azure-data-tables the functions use,
+  with single-partition transactions, etags and OData filters of the form
+  "Prop op value [and ...]". AsyncTableService puts the aio face on it for
+  the async functions.
+- FakeAzure: Compute and Monitor client stand-ins serving a synthetic VM
+  fleet and its metrics, sync and aio.
+- AwsStandIn: botocore hooks that count every AWS call and answer the ones
+  moto cannot serve at benchmark scale (CloudWatch, Lightsail).
+"""
+import asyncio
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableTransactionError, UpdateMode
+
+DATAPOINT_PERIOD = timedelta(minutes=5)
+
+def _sleep(latency):
+    if latency:
+        time.sleep(latency)
+
+class FakeEntity(dict):
+    """A stored row as the SDK returns it: a dict plus metadata['etag'/'timestamp']."""
+
+    def __init__(self, values, metadata):
+        super().__init__(values)
+        self.metadata = metadata
+
+_CLAUSE = re.compile(r"^\s*(\w+)\s+(eq|ne|gt|ge|lt|le)\s+(@\w+|'(?:[^']|'')*'|\S+)\s*$")
+_OPERATORS = {
+    'eq': lambda a, b: a == b, 'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a > b, 'ge': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b, 'le': lambda a, b: a <= b
+}
+
+def _parse_literal(token, parameters):
+    if token.startswith('@'):
+        return parameters[token[1:]]
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    if token in ('true', 'false'):
+        return token == 'true'
+    return float(token) if '.' in token else int(token)
+
+def compile_filter(query_filter, parameters=None):
+    """Compile an 'and'-joined OData filter into (partition key or None, predicate)."""
+    if not query_filter:
+        return None, lambda entity: True
+    clauses = []
+    partition_key = None
+    for clause in re.split(r'\s+and\s+', query_filter.strip()):
+        match = _CLAUSE.match(clause)
+        if not match:
+            raise ValueError(f"Unsupported filter clause: {clause}")
+        prop, op, token = match.groups()
+        value = _parse_literal(token, parameters or {})
+        if prop == 'PartitionKey' and op == 'eq':
+            partition_key = value
+        clauses.append((prop, _OPERATORS[op], value))
+
+    def predicate(entity):
+        for prop, compare, value in clauses:
+            actual = entity.get(prop)
+            if actual is None or not compare(actual, value):
+                return False
+        return True
+    return partition_key, predicate
+
+class _Pages:
+    """ItemPaged lookalike: iterate rows, or by_page() with continuation tokens."""
+
+    def __init__(self, rows, per_page):
+        self._rows = rows
+        self._per_page = per_page or 1000
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def by_page(self, continuation_token=None):
+        return _PageIterator(self._rows, self._per_page, continuation_token)
+
+class _PageIterator:
+    def __init__(self, rows, per_page, continuation_token):
+        self._rows = rows
+        self._per_page = per_page
+        self._next = int(continuation_token['offset']) if continuation_token else 0
+        self._started = False
+        self.continuation_token = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._started and self._next >= len(self._rows):
+            raise StopIteration
+        self._started = True
+        page = self._rows[self._next:self._next + self._per_page]
+        self._next += len(page)
+        self.continuation_token = {'offset': self._next} if self._next < len(self._rows) else None
+        return iter(page)
+
+class InMemoryTableService:
+    """
+    Drop-in for TableServiceClient over process memory. `operations` counts the
+    calls by operation name; `latency` (seconds) is slept once per call to stand
+    in for the storage round trip.
+    """
+
+    url = 'memory://tables/'
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}  # name -> {PartitionKey: {RowKey: (values, metadata)}}
+        self.operations = Counter()
+        self.lock = threading.RLock()
+
+    def count(self, operation, n=1):
+        with self.lock:
+            self.operations[operation] += n
+        _sleep(self.latency)
+
+    def get_table_client(self, table_name):
+        return InMemoryTableClient(self, table_name)
+
+    def list_tables(self):
+        self.count('list_tables')
+        return [SimpleNamespace(name=name) for name in list(self.tables)]
+
+    def create_table(self, table_name):
+        self.count('create_table')
+        with self.lock:
+            if table_name in self.tables:
+                raise ResourceExistsError(f"Table {table_name} already exists")
+            self.tables[table_name] = {}
+        return self.get_table_client(table_name)
+
+    def create_table_if_not_exists(self, table_name):
+        self.count('create_table')
+        with self.lock:
+            self.tables.setdefault(table_name, {})
+        return self.get_table_client(table_name)
+
+class InMemoryTableClient:
+    def __init__(self, service, table_name):
+        self.service = service
+        self.table_name = table_name
+
+    def _table(self):
+        try:
+            return self.service.tables[self.table_name]
+        except KeyError:
+            raise ResourceNotFoundError(f"Table {self.table_name} not found")
+
+    def create_table(self):
+        self.service.create_table(self.table_name)
+
+    def _write(self, entity, mode, must_exist=False, must_not_exist=False, etag=None, match_condition=None):
+        """Apply one write; caller holds the service lock."""
+        partition = self._table().setdefault(entity['PartitionKey'], {})
+        current = partition.get(entity['RowKey'])
+        if must_not_exist and current is not None:
+            raise ResourceExistsError(f"Entity {entity['RowKey']} already exists")
+        if (must_exist or match_condition == MatchConditions.IfNotModified) and current is None:
+            raise ResourceNotFoundError(f"Entity {entity['RowKey']} not found")
+        if match_condition == MatchConditions.IfNotModified and current[1]['etag'] != etag:
+            raise ResourceModifiedError(f"Entity {entity['RowKey']} was modified")
+        values = dict(current[0]) if current is not None and mode == UpdateMode.MERGE else {}
+        values.update(entity)
+        partition[entity['RowKey']] = (values, {
+            'etag': f'W/"{uuid.uuid4().hex}"',
+            'timestamp': datetime.now(timezone.utc)
+        })
+
+    def get_entity(self, partition_key, row_key, **kwargs):
+        self.service.count('get_entity')
+        with self.service.lock:
+            row = self._table().get(partition_key, {}).get(row_key)
+        if row is None:
+            raise ResourceNotFoundError(f"Entity {partition_key}/{row_key} not found")
+        return FakeEntity(*row)
+
+    def upsert_entity(self, entity, mode=UpdateMode.MERGE, **kwargs):
+        self.service.count('upsert_entity')
+        with self.service.lock:
+            self._write(entity, mode)
+
+    def create_entity(self, entity, **kwargs):
+        self.service.count('create_entity')
+        with self.service.lock:
+            self._write(entity, UpdateMode.REPLACE, must_not_exist=True)
+
+    def update_entity(self, entity, mode=UpdateMode.MERGE, etag=None, match_condition=None, **kwargs):
+        self.service.count('update_entity')
+        with self.service.lock:
+            self._write(entity, mode, must_exist=True, etag=etag, match_condition=match_condition)
+
+    def delete_entity(self, partition_key=None, row_key=None, **kwargs):
+        self.service.count('delete_entity')
+        with self.service.lock:
+            self._table().get(partition_key, {}).pop(row_key, None)
+
+    def submit_transaction(self, operations, **kwargs):
+        operations = list(operations)
+        self.service.count('submit_transaction')
+        self.service.count('transaction_operations', len(operations))
+        if len(operations) > 100:
+            raise TableTransactionError(message="A transaction may hold at most 100 operations")
+        if len({operation[1]['PartitionKey'] for operation in operations}) > 1:
+            raise TableTransactionError(message="All operations in a transaction must share a PartitionKey")
+        with self.service.lock:
+            table = self._table()
+            partition_key = operations[0][1]['PartitionKey']
+            snapshot = dict(table.get(partition_key, {}))
+            try:
+                for index, operation in enumerate(operations):
+                    kind, entity = operation[0], operation[1]
+                    options = operation[2] if len(operation) > 2 else {}
+                    if kind == 'upsert':
+                        self._write(entity, options.get('mode', UpdateMode.MERGE))
+                    elif kind == 'create':
+                        self._write(entity, UpdateMode.REPLACE, must_not_exist=True)
+                    elif kind == 'update':
+                        self._write(entity, options.get('mode', UpdateMode.MERGE), must_exist=True,
+                                    etag=options.get('etag'), match_condition=options.get('match_condition'))
+                    elif kind == 'delete':
+                        table.get(partition_key, {}).pop(entity['RowKey'], None)
+            except (ResourceExistsError, ResourceModifiedError, ResourceNotFoundError) as e:
+                table[partition_key] = snapshot
+                raise TableTransactionError(message=f"{index}:{e}")
+        return [{} for _ in operations]
+
+    def query_entities(self, query_filter, parameters=None, select=None, results_per_page=None, **kwargs):
+        self.service.count('query_entities')
+        partition_key, predicate = compile_filter(query_filter, parameters)
+        with self.service.lock:
+            table = self._table()
+            partitions = [table.get(partition_key, {})] if partition_key is not None else list(table.values())
+            rows = [FakeEntity(values, metadata)
+                    for partition in partitions for values, metadata in partition.values() if predicate(values)]
+        rows.sort(key=lambda row: (row['PartitionKey'], row['RowKey']))
+        if select:
+            fields = [select] if isinstance(select, str) else select
+            rows = [FakeEntity({key: row[key] for key in fields if key in row}, row.metadata) for row in rows]
+        return _Pages(rows, results_per_page)
+
+    def list_entities(self, select=None, results_per_page=None, **kwargs):
+        return self.query_entities(None, select=select, results_per_page=results_per_page)
+
+async def _aiter(rows):
+    for row in rows:
+        yield row
+
+class AsyncTableService:
+    """
+    azure.data.tables.aio face over a sync table service. Every call runs on
+    the default executor, so latency slept by the backend overlaps the way
+    concurrent round trips would.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.url = service.url
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def close(self):
+        pass
+
+    def get_table_client(self, table_name):
+        return AsyncTableClient(self.service.get_table_client(table_name))
+
+    def list_tables(self):
+        async def tables():
+            for table in await asyncio.to_thread(self.service.list_tables):
+                yield table
+        return tables()
+
+    async def create_table(self, table_name):
+        await asyncio.to_thread(self.service.create_table, table_name)
+        return self.get_table_client(table_name)
+
+class AsyncTableClient:
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return call
+
+    def query_entities(self, *args, **kwargs):
+        async def rows():
+            for row in await asyncio.to_thread(lambda: list(self.client.query_entities(*args, **kwargs))):
+                yield row
+        return rows()
+
+    def list_entities(self, **kwargs):
+        return self.query_entities(None, **kwargs)
+
+class FakeCredential:
+    """Stands in for ClientSecretCredential; never contacts Azure AD."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_token(self, *scopes, **kwargs):
+        return SimpleNamespace(token='fake', expires_on=int(time.time()) + 3600)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def close(self):
+        pass
+
+class FakeAzure:
+    """
+    A synthetic Azure subscription: `vm_count` VMs across resource groups and
+    regions, a fifth of them deallocated. compute_client and monitor_client are
+    the class stand-ins to patch into a function module; `calls` counts
+    operations and `latency` (seconds) is slept per call.
+    """
+
+    REGIONS = ('westeurope', 'eastus', 'southeastasia')
+
+    def __init__(self, vm_count, subscription_id='00000000-0000-0000-0000-000000000000', latency=0.0):
+        self.subscription_id = subscription_id
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.vms = [
+            SimpleNamespace(
+                id=f"/subscriptions/{subscription_id}/resourceGroups/rg-{i % 20}/providers/Microsoft.Compute/virtualMachines/vm-{i}",
+                name=f"vm-{i}",
+                location=self.REGIONS[i % len(self.REGIONS)],
+                hardware_profile=SimpleNamespace(vm_size='Standard_B2s'),
+                provisioning_state='Succeeded',
+                power_state='VM deallocated' if i % 5 == 0 else 'VM running'
+            )
+            for i in range(vm_count)
+        ]
+        self._by_name = {(vm.id.split('/')[4], vm.name): vm for vm in self.vms}
+
+    def _call(self, operation):
+        with self.lock:
+            self.calls[operation] += 1
+        _sleep(self.latency)
+
+    def _list_all(self):
+        self._call('virtual_machines.list_all')
+        return iter(self.vms)
+
+    def _instance_view(self, resource_group, name):
+        self._call('virtual_machines.instance_view')
+        vm = self._by_name[(resource_group, name)]
+        return SimpleNamespace(statuses=[
+            SimpleNamespace(code='ProvisioningState/succeeded', display_status='Provisioning succeeded'),
+            SimpleNamespace(code=f"PowerState/{vm.power_state.split()[-1]}", display_status=vm.power_state)
+        ])
+
+    def _metrics_list(self, resource_uri, timespan=None, interval=None, metricnames=None, aggregation=None, **kwargs):
+        self._call('metrics.list')
+        end = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        hours = int(re.sub(r'\D', '', timespan or 'PT2H') or 2)
+        points = int(timedelta(hours=hours) / DATAPOINT_PERIOD)
+        return SimpleNamespace(value=[
+            SimpleNamespace(
+                name=SimpleNamespace(value=name, localized_value=name),
+                unit='Percent' if 'Percent' in name else 'Bytes',
+                timeseries=[SimpleNamespace(data=[
+                    SimpleNamespace(time_stamp=end - DATAPOINT_PERIOD * (points - i), average=float(i), maximum=float(i + 1))
+                    for i in range(points)
+                ])]
+            )
+            for name in (metricnames or 'Percentage CPU').split(',')
+        ])
+
+    @property
+    def compute_client(self):
+        fake = self
+
+        def create(credential, subscription_id, **kwargs):
+            return SimpleNamespace(virtual_machines=SimpleNamespace(
+                list_all=fake._list_all, instance_view=fake._instance_view
+            ))
+        return create
+
+    @property
+    def monitor_client(self):
+        fake = self
+
+        def create(credential, subscription_id, **kwargs):
+            return SimpleNamespace(metrics=SimpleNamespace(list=fake._metrics_list))
+        return create
+
+    @property
+    def monitor_client_async(self):
+        """The azure.mgmt.monitor.aio stand-in; calls run on the default executor like the tables'."""
+        fake = self
+
+        class Client:
+            def __init__(self, credential, subscription_id, **kwargs):
+                self.metrics = SimpleNamespace(list=self._metrics_list)
+
+            async def _metrics_list(self, *args, **kwargs):
+                return await asyncio.to_thread(fake._metrics_list, *args, **kwargs)
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc_info):
+                pass
+        return Client
+
+class AwsStandIn:
+    """
+    Counts every AWS API call made through a boto3 session and answers
+    CloudWatch GetMetricStatistics and Lightsail calls with synthetic data
+    before they reach the network (or moto). `lightsail` maps region -> number
+    of Lightsail instances to report there.
+    """
+
+    def __init__(self, lightsail=None):
+        self.lightsail = lightsail or {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.responders = {
+            ('cloudwatch', 'GetMetricStatistics'): self._get_metric_statistics,
+            ('lightsail', 'GetInstances'): self._lightsail_instances,
+            ('lightsail', 'GetInstanceMetricData'): self._lightsail_metric_data
+        }
+
+    def install(self, session):
+        """Register on a boto3 session; must run before its clients are created."""
+        session.events.register('before-parameter-build', self._keep_params, unique_id='benchmark-params')
+        session.events.register('before-call', self._before_call, unique_id='benchmark-before-call')
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def _keep_params(self, params, context, **kwargs):
+        context['benchmark_params'] = dict(params)
+
+    def _before_call(self, model, context, **kwargs):
+        from botocore.awsrequest import AWSResponse
+        service = model.service_model.service_name
+        with self.lock:
+            self.calls[f"{service}.{model.name}"] += 1
+        responder = self.responders.get((service, model.name))
+        if responder is None:
+            return None
+        parsed = responder(context.get('benchmark_params', {}), context.get('client_region'))
+        parsed.setdefault('ResponseMetadata', {'HTTPStatusCode': 200, 'RequestId': uuid.uuid4().hex})
+        return AWSResponse('https://benchmark.invalid/', 200, {}, None), parsed
+
+    @staticmethod
+    def _timestamps(start, end, period):
+        start = start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+        step = timedelta(seconds=period)
+        count = max(0, int((end - start) / step))
+        return [start + step * i for i in range(count)]
+
+    def _get_metric_statistics(self, params, region):
+        timestamps = self._timestamps(params['StartTime'], params['EndTime'], params['Period'])
+        return {'Label': params['MetricName'], 'Datapoints': [
+            {'Timestamp': ts, 'Average': float(i), 'Maximum': float(i + 1), 'Unit': 'Percent'}
+            for i, ts in enumerate(timestamps)
+        ]}
+
+    def _lightsail_instances(self, params, region):
+        return {'instances': [
+            {
+                'name': f"ls-{region}-{i}",
+                'arn': f"arn:aws:lightsail:{region}:123456789012:Instance/{uuid.uuid5(uuid.NAMESPACE_URL, f'{region}-{i}')}",
+                'location': {'regionName': region},
+                'state': {'name': 'stopped' if i % 5 == 0 else 'running'},
+                'blueprintName': 'ubuntu_22_04'
+            }
+            for i in range(self.lightsail.get(region, 0))
+        ]}
+
+    def _lightsail_metric_data(self, params, region):
+        timestamps = self._timestamps(params['startTime'], params['endTime'], params['period'])
+        return {'metricName': params['metricName'], 'metricData': [
+            {'timestamp': ts, 'average': float(i), 'unit': params.get('unit', 'Percent')}
+            for i, ts in enumerate(timestamps)
+        ]}
+
+def split_fleet(size, regions):
+    """Spread `size` resources over regions as evenly as possible: {region: count}."""
+    counts = defaultdict(int)
+    for i in range(size):
+        counts[regions[i % len(regions)]] += 1
+    return dict(counts)
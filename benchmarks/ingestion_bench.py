@@ -0,0 +1,300 @@
+"""
+End-to-end ingestion benchmark.
+
+Runs refresh_aws_resources, refresh_azure_resources and refresh_metrics
+(aws and azure) against local stand-ins on synthetic fleets, and reports wall
+time, provider API calls, table operations and peak traced memory per run:
+
+- AWS: moto serves EC2 (DescribeRegions, DescribeInstances). CloudWatch and
+  Lightsail are answered by benchmarks/fakes.AwsStandIn, since moto has no
+  Lightsail and scans every stored datapoint per CloudWatch query.
+- Azure: in-process Compute and Monitor fakes (benchmarks/fakes.FakeAzure).
+- Table Storage: an in-memory fake by default, or Azurite with --tables azurite
+  (AZURITE_CONNECTION_STRING, default UseDevelopmentStorage=true).
+
+Every run happens in its own subprocess so moto state and peak RSS don't leak
+between runs. --save writes the results as JSON; --baseline compares against
+such a file and exits 1 when a metric grows by more than --threshold.
+
+Usage: python benchmarks/ingestion_bench.py [--sizes 100,1000,10000]
+           [--scenarios ...] [--tables memory|azurite] [--latency-ms N]
+           [--save FILE] [--baseline FILE] [--threshold 0.2]
+
+Needs moto (pip install "moto[ec2]") for the AWS scenarios.
+"""
+import argparse
+import asyncio
+import importlib
+import inspect
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ('refresh_aws_resources', 'refresh_azure_resources', 'refresh_metrics_aws', 'refresh_metrics_azure')
+DEFAULT_SIZES = (100, 1000, 10000)
+AWS_REGIONS = ('us-east-1', 'eu-west-1', 'ap-southeast-2')
+# Share of each AWS fleet reported as Lightsail instances
+LIGHTSAIL_SHARE = 0.1
+# Metrics compared against the baseline; all of them are "lower is better"
+COMPARED = ('wall_s', 'api_calls', 'table_ops', 'peak_traced_mib')
+
+def http_request(customer_id, **params):
+    import azure.functions as func
+    return func.HttpRequest(method='GET', url='/api/benchmark', params=dict(customer_id=customer_id, **params), body=b'')
+
+class Tables:
+    """The table service a run uses, counting operations whichever backend is behind it."""
+
+    def __init__(self, backend, latency):
+        from fakes import InMemoryTableService
+        self.backend = backend
+        if backend == 'memory':
+            self.service = InMemoryTableService(latency=latency)
+            return
+        from azure.core.pipeline.policies import SansIOHTTPPolicy
+        from azure.data.tables import TableServiceClient
+        from collections import Counter
+        operations = self.operations = Counter()
+
+        class CountingPolicy(SansIOHTTPPolicy):
+            def on_request(self, request):
+                path = request.http_request.url.split('?')[0].rstrip('/').rsplit('/', 1)[-1].split('(')[0]
+                operations[f"{request.http_request.method.lower()} {path}"] += 1
+
+        self.policy = CountingPolicy()
+        self.service = TableServiceClient.from_connection_string(
+            conn_str=os.getenv('AZURITE_CONNECTION_STRING', 'UseDevelopmentStorage=true'),
+            per_call_policies=[self.policy]
+        )
+
+    def counts(self):
+        return dict(self.service.operations if self.backend == 'memory' else self.operations)
+
+    def reset(self):
+        (self.service.operations if self.backend == 'memory' else self.operations).clear()
+
+    def patch(self, module):
+        """
+        Make module's TableServiceClient.from_connection_string hand out this
+        service, or an aio client on it for modules with an async main.
+        """
+        tables = self
+
+        class TableServiceClient:
+            @staticmethod
+            def from_connection_string(conn_str, **kwargs):
+                if not inspect.iscoroutinefunction(module.main):
+                    return tables.service
+                if tables.backend == 'memory':
+                    from fakes import AsyncTableService
+                    return AsyncTableService(tables.service)
+                from azure.data.tables.aio import TableServiceClient as AsyncTableServiceClient
+                return AsyncTableServiceClient.from_connection_string(
+                    conn_str=os.getenv('AZURITE_CONNECTION_STRING', 'UseDevelopmentStorage=true'),
+                    per_call_policies=[tables.policy]
+                )
+        module.TableServiceClient = TableServiceClient
+
+def seed_credentials(tables, customer_id):
+    client = tables.service.get_table_client('CloudCredentials')
+    try:
+        tables.service.create_table('CloudCredentials')
+    except Exception:
+        pass  # Already there (Azurite keeps tables between runs)
+    client.upsert_entity(entity={"PartitionKey": "aws", "RowKey": customer_id,
+                                 "access_key_id": "testing", "secret_access_key": "testing"})
+    client.upsert_entity(entity={"PartitionKey": "azure", "RowKey": customer_id,
+                                 "subscription_id": "00000000-0000-0000-0000-000000000000",
+                                 "tenant_id": "tenant", "client_id": "client", "client_secret": "secret"})
+
+def seed_ec2(counts):
+    """Launch the EC2 part of the fleet in moto; a fifth of each region's instances are stopped."""
+    import boto3
+    for region, count in counts.items():
+        ec2 = boto3.client('ec2', region_name=region, aws_access_key_id='testing', aws_secret_access_key='testing')
+        image_id = ec2.describe_images(Owners=['amazon'])['Images'][0]['ImageId']
+        launched = []
+        for start in range(0, count, 500):
+            batch = min(500, count - start)
+            response = ec2.run_instances(
+                ImageId=image_id, InstanceType='t3.micro', MinCount=batch, MaxCount=batch,
+                TagSpecifications=[{'ResourceType': 'instance', 'Tags': [{'Key': 'Name', 'Value': f'bench-{region}'}]}]
+            )
+            launched.extend(instance['InstanceId'] for instance in response['Instances'])
+        stopped = launched[::5]
+        for start in range(0, len(stopped), 500):
+            ec2.stop_instances(InstanceIds=stopped[start:start + 500])
+
+def start_moto():
+    try:
+        from moto import mock_aws
+        mock = mock_aws()
+    except ImportError:
+        try:
+            from moto import mock_ec2  # moto < 5
+        except ImportError:
+            raise RuntimeError('moto is not installed (pip install "moto[ec2]")')
+        mock = mock_ec2()
+    mock.start()
+    return mock
+
+def run_scenario(scenario, size, tables_backend, latency):
+    """Seed one scenario, run its function once and return the measurements."""
+    from fakes import AwsStandIn, FakeAzure, FakeCredential, split_fleet
+    os.environ.setdefault('AzureWebJobsStorage', 'UseDevelopmentStorage=true')
+    for key in ('AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'AWS_SESSION_TOKEN'):
+        os.environ[key] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+    customer_id = f"bench-{uuid.uuid4().hex[:8]}"
+    tables = Tables(tables_backend, latency)
+    seed_credentials(tables, customer_id)
+    provider = 'aws' if 'aws' in scenario else 'azure'
+
+    aws = azure = None
+    if provider == 'aws':
+        import boto3
+        start_moto()
+        lightsail = int(size * LIGHTSAIL_SHARE)
+        aws = AwsStandIn(lightsail=split_fleet(lightsail, AWS_REGIONS))
+        aws.install(boto3._get_default_session())
+        seed_ec2(split_fleet(size - lightsail, AWS_REGIONS))
+    else:
+        azure = FakeAzure(size, latency=latency)
+
+    def load(name):
+        module = importlib.import_module(name)
+        tables.patch(module)
+        if azure is not None and hasattr(module, 'ComputeManagementClient'):
+            module.ComputeManagementClient = azure.compute_client
+        if azure is not None and hasattr(module, 'MonitorManagementClient'):
+            is_async = inspect.iscoroutinefunction(module.main)
+            module.MonitorManagementClient = azure.monitor_client_async if is_async else azure.monitor_client
+        if hasattr(module, 'ClientSecretCredential'):
+            module.ClientSecretCredential = FakeCredential
+        return module
+
+    def call(module, request):
+        return asyncio.run(module.main(request)) if inspect.iscoroutinefunction(module.main) else module.main(request)
+
+    inventory = load(f'refresh_{provider}_resources')
+    if scenario.startswith('refresh_metrics'):
+        # The metrics refresh reads the inventory, so build it first, outside the measurement
+        call(inventory, http_request(customer_id))
+        target, params = load('refresh_metrics'), {'provider': provider}
+    else:
+        target, params = inventory, {}
+
+    for counter in (aws, azure):
+        if counter is not None:
+            counter.calls.clear()
+    tables.reset()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = call(target, http_request(customer_id, **params))
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    api_calls = dict((aws or azure).calls)
+    table_ops = tables.counts()
+    return {
+        "scenario": scenario,
+        "size": size,
+        "status": response.status_code,
+        "wall_s": round(wall, 3),
+        "api_calls": sum(api_calls.values()),
+        "table_ops": sum(count for op, count in table_ops.items() if op != 'transaction_operations'),
+        "peak_traced_mib": round(peak / 2 ** 20, 1),
+        "peak_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "api_calls_by_operation": api_calls,
+        "table_ops_by_operation": table_ops
+    }
+
+def run_in_subprocess(scenario, size, args):
+    command = [sys.executable, os.path.abspath(__file__), '--worker', scenario, str(size),
+               '--tables', args.tables, '--latency-ms', str(args.latency_ms)]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        error = (completed.stderr.strip().splitlines() or ['no output'])[-1]
+        return {"scenario": scenario, "size": size, "error": error}
+    return json.loads(lines[-1])
+
+def compare(results, baseline, threshold):
+    """Lines describing each metric that grew beyond the threshold against the baseline."""
+    previous = {(run["scenario"], run["size"]): run for run in baseline}
+    regressions = []
+    for run in results:
+        before = previous.get((run["scenario"], run["size"]))
+        if not before or "error" in run or "error" in before:
+            continue
+        for metric in COMPARED:
+            if before.get(metric) and run[metric] > before[metric] * (1 + threshold):
+                regressions.append(
+                    f"{run['scenario']} @ {run['size']}: {metric} {before[metric]} -> {run[metric]} "
+                    f"(+{(run[metric] / before[metric] - 1) * 100:.0f}%, limit {threshold * 100:.0f}%)"
+                )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)))
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--tables', choices=('memory', 'azurite'), default='memory')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Delay added to every fake Azure and in-memory table call')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved earlier with --save')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed growth per metric (0.2 = 20%%)')
+    parser.add_argument('--worker', nargs=2, metavar=('SCENARIO', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        scenario, size = args.worker
+        print(json.dumps(run_scenario(scenario, int(size), args.tables, args.latency_ms / 1000)))
+        return
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = []
+    print(f"{'scenario':<26}{'size':>7}{'status':>8}{'wall s':>9}{'API calls':>11}{'table ops':>11}{'peak MiB':>10}{'RSS MiB':>9}")
+    for scenario in scenarios:
+        for size in (int(s) for s in args.sizes.split(',')):
+            run = run_in_subprocess(scenario, size, args)
+            results.append(run)
+            if "error" in run:
+                print(f"{scenario:<26}{size:>7}  error: {run['error']}")
+                continue
+            print(f"{scenario:<26}{size:>7}{run['status']:>8}{run['wall_s']:>9.2f}{run['api_calls']:>11}"
+                  f"{run['table_ops']:>11}{run['peak_traced_mib']:>10.1f}{run['peak_rss_mib']:>9.1f}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}.")
+
+if __name__ == '__main__':
+    main()
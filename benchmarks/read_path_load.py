@@ -0,0 +1,231 @@
+"""
+Read-path load test.
+
+Drives get_aws_resources, get_azure_resources, get_customers and
+get_resource_details on a running Functions host at several concurrency
+levels and data sizes. For each combination it reports throughput and
+p50/p95/p99 latency.
+
+Start the dependencies first, with the host pointed at Azurite (the default
+local.settings.json AzureWebJobsStorage of UseDevelopmentStorage=true):
+
+    azurite --silent --location /tmp/azurite &
+    func start
+
+--seed writes the synthetic data into Azurite before the run:
+- an AWS and an Azure inventory of each --sizes size, for customer load-<size>;
+- <size> customers under the provider name load<size>, read via customers/load<size>;
+- fresh 5-minute metrics for --details-pool resources per size, so
+  get_resource_details is served from the ResourceMetrics cache.
+
+The metrics go stale after METRICS_CACHE_MAX_STALENESS_SECONDS (default 600).
+After that, details requests try to reach AWS, so seed again for later runs.
+
+Usage: python benchmarks/read_path_load.py --seed [--base-url URL]
+           [--sizes 100,1000,10000] [--concurrency 1,8,32] [--duration 20]
+           [--endpoints ...] [--save FILE]
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import requests
+
+ENDPOINTS = ('get_aws_resources', 'get_azure_resources', 'get_customers', 'get_resource_details')
+DEFAULT_SIZES = (100, 1000, 10000)
+DEFAULT_CONCURRENCY = (1, 8, 32)
+REGIONS = ('us-east-1', 'eu-west-1', 'ap-southeast-2')
+EC2_METRICS = ('CPUUtilization', 'NetworkIn', 'NetworkOut', 'DiskReadBytes', 'DiskWriteBytes')
+# Table Storage transactions hold at most 100 operations
+BATCH_SIZE = 100
+
+def customer_for(size):
+    return f"load-{size}"
+
+def instance_id(size, i):
+    return f"i-{size:06d}{i:011x}"
+
+def upsert_all(table_service_client, table_name, entities):
+    """Upsert entities (one PartitionKey per call site) in 100-entity transactions."""
+    from azure.core.exceptions import ResourceExistsError
+    try:
+        table_service_client.create_table(table_name)
+    except ResourceExistsError:
+        pass
+    table_client = table_service_client.get_table_client(table_name)
+    batch = []
+    for entity in entities:
+        batch.append(('upsert', entity))
+        if len(batch) == BATCH_SIZE:
+            table_client.submit_transaction(batch)
+            batch = []
+    if batch:
+        table_client.submit_transaction(batch)
+
+def seed_inventories(table_service_client, size):
+    customer_id = customer_for(size)
+    upsert_all(table_service_client, 'CloudCredentials', [
+        {"PartitionKey": "aws", "RowKey": customer_id, "access_key_id": "load", "secret_access_key": "load"}
+    ])
+    upsert_all(table_service_client, 'CloudCredentials', [
+        {"PartitionKey": f"load{size}", "RowKey": f"{customer_id}-{i}", "customer_name": f"Customer {i}"}
+        for i in range(size)
+    ])
+    upsert_all(table_service_client, 'AwsResources', [
+        {
+            "PartitionKey": customer_id, "RowKey": instance_id(size, i), "id": instance_id(size, i),
+            "name": f"web-{i}", "type": "EC2 Instance", "region": REGIONS[i % len(REGIONS)],
+            "status": "stopped" if i % 5 == 0 else "running", "instance_type": "t3.medium"
+        }
+        for i in range(size)
+    ])
+    upsert_all(table_service_client, 'AzureResources', [
+        {
+            "PartitionKey": customer_id,
+            "RowKey": f"_subscriptions_load_resourceGroups_rg-{i % 20}_providers_Microsoft.Compute_virtualMachines_vm-{i}",
+            "id": f"/subscriptions/load/resourceGroups/rg-{i % 20}/providers/Microsoft.Compute/virtualMachines/vm-{i}",
+            "name": f"vm-{i}", "type": "Virtual Machine", "region": "westeurope",
+            "status": "VM deallocated" if i % 5 == 0 else "VM running", "vm_size": "Standard_B2s"
+        }
+        for i in range(size)
+    ])
+
+def seed_metrics(table_service_client, size, pool):
+    """Three hours of 5-minute EC2 averages, ending now, for the first `pool` instances."""
+    customer_id = customer_for(size)
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    timestamps = [now - timedelta(minutes=5 * k) for k in range(36)]
+    upsert_all(table_service_client, 'ResourceMetrics', [
+        {
+            "PartitionKey": customer_id,
+            "RowKey": f"aws_{instance_id(size, i)}_{metric}_avg_{ts.isoformat()}".replace(':', '_').replace('.', '_'),
+            "provider": "aws", "resource_id": instance_id(size, i), "metric_name": metric,
+            "value": float(k), "statistic": "Average", "timestamp": ts.isoformat(),
+            "region": REGIONS[i % len(REGIONS)]
+        }
+        for i in range(min(pool, size)) for metric in EC2_METRICS for k, ts in enumerate(timestamps)
+    ])
+
+def request_factory(endpoint, size, pool):
+    """Return a callable producing (path, params) for the next request to an endpoint."""
+    customer_id = customer_for(size)
+    if endpoint == 'get_customers':
+        return lambda i: (f"customers/load{size}", {})
+    if endpoint == 'get_resource_details':
+        count = min(pool, size)
+        return lambda i: ('get_resource_details', {
+            "customer_id": customer_id, "provider": "aws",
+            "resource_id": instance_id(size, i % count), "region": REGIONS[(i % count) % len(REGIONS)]
+        })
+    return lambda i: (endpoint, {"customer_id": customer_id})
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+def run_load(base_url, headers, next_request, concurrency, duration, warmup):
+    """Closed loop: `concurrency` clients issue requests back to back; returns (latencies, errors, measured seconds)."""
+    latencies = []
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    counter = iter(range(sys.maxsize))
+    started = time.perf_counter()
+    measure_from = started + warmup
+    stop_at = measure_from + duration
+
+    def client():
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            with lock:
+                path, params = next_request(next(counter))
+            sent = time.perf_counter()
+            try:
+                response = session.get(f"{base_url}/{path}", params=params, headers=headers, timeout=60)
+                outcome = None if response.status_code < 400 else str(response.status_code)
+                response.content  # Read the whole body before stopping the clock
+            except requests.RequestException as e:
+                outcome = type(e).__name__
+            elapsed = time.perf_counter() - sent
+            if sent >= measure_from:
+                with lock:
+                    if outcome:
+                        errors[outcome] += 1
+                    else:
+                        latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+    return sorted(latencies), dict(errors), duration
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--base-url', default='http://localhost:7071/api')
+    parser.add_argument('--function-key', default=os.getenv('FUNCTION_KEY'), help='Sent as x-functions-key')
+    parser.add_argument('--storage', default=os.getenv('AZURITE_CONNECTION_STRING', 'UseDevelopmentStorage=true'),
+                        help='Connection string --seed writes to')
+    parser.add_argument('--seed', action='store_true', help='Seed inventories, customers and metrics first')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)))
+    parser.add_argument('--concurrency', default=','.join(map(str, DEFAULT_CONCURRENCY)))
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS))
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds per combination')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds before each measurement')
+    parser.add_argument('--details-pool', type=int, default=200,
+                        help='Distinct resources get_resource_details cycles through per size')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    levels = [int(c) for c in args.concurrency.split(',') if c]
+    endpoints = [e for e in args.endpoints.split(',') if e]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    headers = {'x-functions-key': args.function_key} if args.function_key else {}
+
+    if args.seed:
+        from azure.data.tables import TableServiceClient
+        table_service_client = TableServiceClient.from_connection_string(conn_str=args.storage)
+        for size in sizes:
+            started = time.perf_counter()
+            seed_inventories(table_service_client, size)
+            if 'get_resource_details' in endpoints:
+                seed_metrics(table_service_client, size, args.details_pool)
+            print(f"Seeded size {size} in {time.perf_counter() - started:.1f}s")
+
+    try:
+        requests.get(f"{args.base_url}/customers/aws", headers=headers, timeout=10)
+    except requests.RequestException as e:
+        sys.exit(f"Functions host not reachable at {args.base_url}: {e}")
+
+    results = []
+    print(f"{'endpoint':<22}{'size':>7}{'conc':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ok':>8}  errors")
+    for endpoint in endpoints:
+        for size in sizes:
+            for concurrency in levels:
+                latencies, errors, seconds = run_load(
+                    args.base_url, headers, request_factory(endpoint, size, args.details_pool),
+                    concurrency, args.duration, args.warmup
+                )
+                run = {
+                    "endpoint": endpoint, "size": size, "concurrency": concurrency,
+                    "requests": len(latencies), "errors": errors,
+                    "throughput_rps": round(len(latencies) / seconds, 1),
+                    "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+                    "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+                    "p99_ms": round(percentile(latencies, 0.99) * 1000, 1)
+                }
+                results.append(run)
+                print(f"{endpoint:<22}{size:>7}{concurrency:>6}{run['throughput_rps']:>9.1f}{run['p50_ms']:>9.1f}"
+                      f"{run['p95_ms']:>9.1f}{run['p99_ms']:>9.1f}{run['requests']:>8}  {json.dumps(errors) if errors else ''}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Micro-benchmark for response serialization.
+
+Compares the legacy path (copy each entity to strip keys, pre-format timestamps
+with isoformat, json.dumps(default=str)) against serialization.dumps with the
+stdlib and orjson backends, on a 10k-resource listing and a 100k-datapoint
+metrics payload. Reports best encode time and peak traced allocations.
+
+Usage: python benchmarks/serialization_bench.py [--repeat N]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+
+def make_resources(count):
+    """Entities shaped like AwsResources rows, table keys included."""
+    return [
+        {
+            "PartitionKey": "customer-1",
+            "RowKey": f"i-{i:017x}",
+            "name": f"web-{i}",
+            "type": "EC2 Instance",
+            "region": "eu-west-1" if i % 2 else "us-east-1",
+            "status": "running" if i % 3 else "stopped",
+            "instance_type": "t3.medium"
+        }
+        for i in range(count)
+    ]
+
+def make_datapoints(count, series=5):
+    """Metric series shaped like get_resource_details output, with native datetimes."""
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    per_series = count // series
+    return [
+        {
+            "name": f"Metric{s}",
+            "unit": "Percent",
+            "data": [
+                {"timestamp": start + timedelta(minutes=5 * i), "value": i * 0.5}
+                for i in range(per_series)
+            ]
+        }
+        for s in range(series)
+    ]
+
+def legacy_resources(resources):
+    cleaned = [{k: v for k, v in r.items() if k not in ['PartitionKey', 'RowKey', 'odata.etag']} for r in resources]
+    return json.dumps({"resources": cleaned}).encode('utf-8')
+
+def legacy_metrics(metrics):
+    shaped = [
+        {
+            "name": m["name"],
+            "unit": m["unit"],
+            "data": [{"timestamp": p["timestamp"].isoformat(), "value": p["value"]} for p in m["data"]]
+        }
+        for m in metrics
+    ]
+    return json.dumps({"metrics": shaped}, default=str).encode('utf-8')
+
+def shaped_resources(encoder):
+    def encode(resources):
+        return encoder({"resources": [serialization.shape_entity(r) for r in resources]})
+    return encode
+
+def shaped_metrics(encoder):
+    def encode(metrics):
+        return encoder({"metrics": metrics})
+    return encode
+
+def measure(encode, make_payload, repeat):
+    """Best wall time over `repeat` runs plus peak allocation of one run, payload built outside timing."""
+    times = []
+    for _ in range(repeat):
+        payload = make_payload()
+        times.append(timeit.timeit(lambda: encode(payload), number=1))
+    payload = make_payload()
+    tracemalloc.start()
+    body = encode(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    variants = [
+        ('legacy json.dumps', legacy_resources, legacy_metrics),
+        ('stdlib', shaped_resources(serialization.dumps_stdlib), shaped_metrics(serialization.dumps_stdlib)),
+    ]
+    if serialization.orjson is not None:
+        variants.append(('orjson', shaped_resources(serialization.dumps_orjson), shaped_metrics(serialization.dumps_orjson)))
+    else:
+        print("orjson not installed; skipping the orjson backend.\n")
+
+    payloads = [
+        ('10k resources', lambda: make_resources(10_000), 1),
+        ('100k datapoints', lambda: make_datapoints(100_000), 2),
+    ]
+
+    print(f"{'payload':<18}{'encoder':<20}{'best ms':>10}{'peak KiB':>12}{'bytes':>12}")
+    for payload_name, make_payload, column in payloads:
+        for variant in variants:
+            ms, peak, size = measure(variant[column], make_payload, args.repeat)
+            print(f"{payload_name:<18}{variant[0]:<20}{ms * 1000:>10.1f}{peak / 1024:>12.0f}{size:>12}")
+
+if __name__ == '__main__':
+    main()
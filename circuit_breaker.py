@@ -0,0 +1,298 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from azure.core import MatchConditions
+from azure.core.exceptions import ClientAuthenticationError, HttpResponseError, ResourceNotFoundError
+from azure.data.tables import UpdateMode
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_BREAKERS_TABLE = 'CircuitBreakers'
+
+# Region of the breaker that covers a credential as a whole (region listing, Azure subscriptions)
+GLOBAL = '*'
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_OPEN_SECONDS = 900
+# Each failed probe doubles the wait before the next one, up to this
+MAX_OPEN_SECONDS = 86400
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Errors that retrying cannot fix: revoked or wrong keys, missing permissions, disabled regions
+AUTH_ERROR_CODES = {
+    'AuthFailure', 'UnauthorizedOperation', 'UnrecognizedClientException', 'InvalidClientTokenId',
+    'InvalidAccessKeyId', 'SignatureDoesNotMatch', 'ExpiredToken', 'AccessDenied', 'AccessDeniedException',
+    'OptInRequired'
+}
+
+def failure_threshold():
+    return int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD))
+
+def open_seconds():
+    return float(os.getenv('CIRCUIT_OPEN_SECONDS', DEFAULT_OPEN_SECONDS))
+
+def is_auth_failure(error):
+    """Whether an AWS or Azure error means the credential or region can't be used at all."""
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        return error.response.get('Error', {}).get('Code') in AUTH_ERROR_CODES or status in (401, 403)
+    if isinstance(error, ClientAuthenticationError):
+        return True
+    return isinstance(error, HttpResponseError) and error.status_code in (401, 403)
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class CircuitBreakers:
+    """
+    Persisted circuit breakers of one customer and provider, one per region plus
+    a credential-wide one (GLOBAL). A breaker opens after
+    CIRCUIT_FAILURE_THRESHOLD consecutive auth or permission failures, and its
+    work is skipped for CIRCUIT_OPEN_SECONDS. After that one worker claims a
+    half-open probe: if it succeeds the breaker closes, and if it fails the breaker
+    reopens for twice as long. A success in any region closes the credential-wide
+    breaker too, since the keys evidently work. Storage errors are logged, never
+    raised, so a breaker can't stop a refresh.
+    """
+
+    def __init__(self, table_service_client, customer_id, provider):
+        self.customer_id = customer_id
+        self.provider = provider
+        self.table_client = table_service_client.get_table_client(table_name=CIRCUIT_BREAKERS_TABLE)
+        self._probing = set()  # RowKeys whose half-open probe this instance claimed
+        self.rows = {}
+        try:
+            self.rows = {row['RowKey']: row for row in self.table_client.query_entities(*self._query())}
+        except HttpResponseError as e:
+            self._load_failed(e)
+
+    def _query(self):
+        query = "PartitionKey eq @pk and RowKey ge @lower and RowKey lt @upper"
+        return query, {'pk': self.customer_id, 'lower': f"{self.provider}|", 'upper': f"{self.provider}}}"}
+
+    def _load_failed(self, error):
+        if not isinstance(error, ResourceNotFoundError):
+            logger.warning(f"Could not read circuit breakers of {self.provider} for customer {self.customer_id}: {error}")
+
+    def _row_key(self, region):
+        return f"{self.provider}|{region or GLOBAL}"
+
+    def _keys(self, region):
+        return [self._row_key(GLOBAL)] if (region or GLOBAL) == GLOBAL else [self._row_key(GLOBAL), self._row_key(region)]
+
+    def _entity(self, row_key, **fields):
+        region = row_key.split('|', 1)[1]
+        return {"PartitionKey": self.customer_id, "RowKey": row_key, "provider": self.provider, "region": region, **fields}
+
+    def _save(self, row_key, **fields):
+        entity = self._entity(row_key, **fields)
+        try:
+            self.table_client.upsert_entity(entity=entity, mode=UpdateMode.MERGE)
+        except HttpResponseError as e:
+            logger.warning(f"Could not save circuit breaker {row_key} for customer {self.customer_id}: {e}")
+        self.rows[row_key] = {**self.rows.get(row_key, {}), **entity}
+
+    def _verdict(self, row_key):
+        """CLOSED when the breaker lets work through, 'due' when a probe may be claimed, OPEN otherwise."""
+        row = self.rows.get(row_key)
+        if not row or row.get('state', CLOSED) == CLOSED or row_key in self._probing:
+            return CLOSED
+        # A half-open breaker whose probe never reported back is due again too
+        return 'due' if datetime.fromisoformat(row['probe_at']) <= _now() else OPEN
+
+    def _probe(self, row_key):
+        """The half-open update for a due breaker and the ETag it must still have, or (None, None)."""
+        etag = getattr(self.rows[row_key], 'metadata', {}).get('etag')
+        if not etag:
+            return None, None  # Written by this instance; it was just opened, so no probe is due
+        return {
+            "PartitionKey": self.customer_id, "RowKey": row_key, "state": HALF_OPEN,
+            # Another probe is due only if this one never reports back
+            "probe_at": (_now() + timedelta(seconds=open_seconds())).isoformat()
+        }, etag
+
+    def _probe_claimed(self, row_key, entity):
+        self.rows[row_key] = {**self.rows[row_key], **entity}
+        self._probing.add(row_key)
+        logger.info(f"Circuit breaker {row_key} of customer {self.customer_id} is half-open, probing.")
+
+    def _claim_probe(self, row_key):
+        """Move an open breaker whose wait is over to half-open; only one worker wins the ETag race."""
+        entity, etag = self._probe(row_key)
+        if entity is None:
+            return False
+        try:
+            self.table_client.update_entity(
+                entity=entity, mode=UpdateMode.MERGE, etag=etag, match_condition=MatchConditions.IfNotModified
+            )
+        except HttpResponseError as e:
+            logger.info(f"Circuit breaker {row_key} of customer {self.customer_id} is probed elsewhere: {e}")
+            return False
+        self._probe_claimed(row_key, entity)
+        return True
+
+    def allow(self, region=GLOBAL):
+        """Whether work in a region may run: every breaker covering it is closed, or this caller holds its probe."""
+        for row_key in self._keys(region):
+            verdict = self._verdict(row_key)
+            if verdict == OPEN or (verdict == 'due' and not self._claim_probe(row_key)):
+                return False
+        return True
+
+    def retry_at(self, region=GLOBAL):
+        """When the breakers blocking a region next allow a probe, or None if none is blocking."""
+        times = [
+            self.rows[row_key]['probe_at'] for row_key in self._keys(region)
+            if self.rows.get(row_key, {}).get('state', CLOSED) != CLOSED
+        ]
+        return max(times) if times else None
+
+    def _success_updates(self, region):
+        """(RowKey, fields) to save after a success; ends this instance's probes of the region."""
+        updates = []
+        for row_key in self._keys(region):
+            row = self.rows.get(row_key)
+            if row and (row.get('state', CLOSED) != CLOSED or row.get('failures')):
+                if row.get('state', CLOSED) != CLOSED:
+                    logger.info(f"Circuit breaker {row_key} of customer {self.customer_id} closed.")
+                updates.append((row_key, dict(state=CLOSED, failures=0, opens=0, closed_at=_now().isoformat())))
+            self._probing.discard(row_key)
+        return updates
+
+    def _failure_updates(self, region, error):
+        """(RowKey, fields) to save after an auth failure; ends this instance's probes of the region."""
+        region = region or GLOBAL
+        now = _now()
+        updates = []
+        # A failed probe reopens the breaker it was probing, even when that is the credential-wide one
+        probed = [row_key for row_key in self._keys(region) if row_key in self._probing]
+        for row_key in probed or [self._row_key(region)]:
+            row = self.rows.get(row_key, {})
+            failures = row.get('failures', 0) + 1
+            fields = {"failures": failures, "last_failure_at": now.isoformat(), "last_error": str(error)[:1024]}
+            if row_key in self._probing or failures >= failure_threshold():
+                opens = row.get('opens', 0) + 1
+                wait = min(MAX_OPEN_SECONDS, open_seconds() * 2 ** (opens - 1))
+                fields.update(state=OPEN, opens=opens, opened_at=now.isoformat(),
+                              probe_at=(now + timedelta(seconds=wait)).isoformat())
+                logger.warning(f"Circuit breaker {row_key} of customer {self.customer_id} opened for {wait:.0f}s "
+                               f"after {failures} failures: {error}")
+            updates.append((row_key, fields))
+            self._probing.discard(row_key)
+        return updates
+
+    def _is_open(self, region):
+        return any(self._verdict(row_key) != CLOSED for row_key in self._keys(region))
+
+    def record_success(self, region=GLOBAL):
+        for row_key, fields in self._success_updates(region):
+            self._save(row_key, **fields)
+
+    def record_failure(self, region, error):
+        """Count an auth or permission failure (other errors are ignored); returns True when the breaker is now open."""
+        if not is_auth_failure(error):
+            return False
+        for row_key, fields in self._failure_updates(region, error):
+            self._save(row_key, **fields)
+        return self._is_open(region)
+
+class AsyncCircuitBreakers(CircuitBreakers):
+    """
+    CircuitBreakers over an azure.data.tables.aio client, for the async
+    handlers. Create it with `await AsyncCircuitBreakers.load(...)`; allow,
+    record_success and record_failure are coroutines.
+    """
+
+    def __init__(self, table_service_client, customer_id, provider):
+        self.customer_id = customer_id
+        self.provider = provider
+        self.table_client = table_service_client.get_table_client(table_name=CIRCUIT_BREAKERS_TABLE)
+        self._probing = set()
+        self.rows = {}
+
+    @classmethod
+    async def load(cls, table_service_client, customer_id, provider):
+        breakers = cls(table_service_client, customer_id, provider)
+        try:
+            breakers.rows = {row['RowKey']: row async for row in breakers.table_client.query_entities(*breakers._query())}
+        except HttpResponseError as e:
+            breakers._load_failed(e)
+        return breakers
+
+    async def _save(self, row_key, **fields):
+        entity = self._entity(row_key, **fields)
+        try:
+            await self.table_client.upsert_entity(entity=entity, mode=UpdateMode.MERGE)
+        except HttpResponseError as e:
+            logger.warning(f"Could not save circuit breaker {row_key} for customer {self.customer_id}: {e}")
+        self.rows[row_key] = {**self.rows.get(row_key, {}), **entity}
+
+    async def _claim_probe(self, row_key):
+        entity, etag = self._probe(row_key)
+        if entity is None:
+            return False
+        try:
+            await self.table_client.update_entity(
+                entity=entity, mode=UpdateMode.MERGE, etag=etag, match_condition=MatchConditions.IfNotModified
+            )
+        except HttpResponseError as e:
+            logger.info(f"Circuit breaker {row_key} of customer {self.customer_id} is probed elsewhere: {e}")
+            return False
+        self._probe_claimed(row_key, entity)
+        return True
+
+    async def allow(self, region=GLOBAL):
+        for row_key in self._keys(region):
+            verdict = self._verdict(row_key)
+            if verdict == OPEN or (verdict == 'due' and not await self._claim_probe(row_key)):
+                return False
+        return True
+
+    async def record_success(self, region=GLOBAL):
+        for row_key, fields in self._success_updates(region):
+            await self._save(row_key, **fields)
+
+    async def record_failure(self, region, error):
+        if not is_auth_failure(error):
+            return False
+        for row_key, fields in self._failure_updates(region, error):
+            await self._save(row_key, **fields)
+        return self._is_open(region)
+
+def list_circuit_breakers(table_service_client, customer_id=None, provider=None, state=None):
+    """Breakers of a customer (optionally one provider), or every customer's breakers that aren't closed."""
+    table_client = table_service_client.get_table_client(table_name=CIRCUIT_BREAKERS_TABLE)
+    clauses, parameters = [], {}
+    if customer_id:
+        clauses.append("PartitionKey eq @pk")
+        parameters['pk'] = customer_id
+    if provider:
+        clauses.append("provider eq @provider")
+        parameters['provider'] = provider.lower()
+    if state:
+        clauses.append("state eq @state")
+        parameters['state'] = state
+    elif not customer_id:
+        clauses.append("state ne @closed")
+        parameters['closed'] = CLOSED
+    try:
+        rows = table_client.query_entities(" and ".join(clauses), parameters=parameters)
+        return [
+            {
+                "customer_id": row['PartitionKey'],
+                "provider": row.get('provider'),
+                "region": row.get('region'),
+                "state": row.get('state', CLOSED),
+                "failures": row.get('failures', 0),
+                "opens": row.get('opens', 0),
+                "opened_at": row.get('opened_at'),
+                "probe_at": row.get('probe_at'),
+                "last_failure_at": row.get('last_failure_at'),
+                "last_error": row.get('last_error')
+            }
+            for row in rows
+        ]
+    except ResourceNotFoundError:
+        return []
@@ -1,10 +1,15 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import boto3
+from botocore.config import Config
 from azure.identity import DefaultAzureCredential
 from azure.mgmt.compute import ComputeManagementClient
 from azure.mgmt.resource import ResourceManagementClient
 from azure.mgmt.storage import StorageManagementClient
 from azure.mgmt.sql import SqlManagementClient
 from azure.mgmt.network import NetworkManagementClient
+from .instrumentation import azure_client_options, bind, instrument_boto3
 from .settings import get_cloud_credentials
 import logging
 
@@ -14,146 +19,296 @@ class CloudResourceError(Exception):
     """Custom exception for cloud resource fetching errors"""
     pass
 
-# Fetch AWS resources (EC2 instances, for example)
-def fetch_aws_resources(customer_id):
-    try:
-        aws_credentials = get_cloud_credentials(customer_id, 'aws')
-        if not aws_credentials:
-            return {
-                'ec2_instances': [],
-                'rds_instances': [],
-                's3_buckets': [],
-                'lambda_functions': []
-            }
-        resources = {
-            'ec2_instances': [],
-            'rds_instances': [],
-            's3_buckets': [],
-            'lambda_functions': []
-        }
-        ec2 = boto3.client(
-            'ec2',
-            aws_access_key_id=aws_credentials.get('aws_access_key'),
-            aws_secret_access_key=aws_credentials.get('aws_secret_key'),
-            region_name=aws_credentials.get('region')
-        )
-        response = ec2.describe_instances()
-        for reservation in response['Reservations']:
+# Registry of AWS collectors: result key -> {'service', 'collect', 'global'}
+AWS_COLLECTORS = {}
+
+# A run waits this long; collectors still running then are reported as timed out
+DEFAULT_COLLECTOR_TIMEOUT_SECONDS = 30
+MAX_COLLECTOR_WORKERS = 16
+
+def aws_collector(key, service, global_service=False):
+    """
+    Register collect(client, region) -> list of resources, stored under resources[key].
+    Global services (e.g. S3) are collected once instead of once per region.
+    """
+    def register(collect):
+        AWS_COLLECTORS[key] = {'service': service, 'collect': collect, 'global': global_service}
+        return collect
+    return register
+
+@aws_collector('ec2_instances', 'ec2')
+def collect_ec2_instances(ec2, region):
+    instances = []
+    for page in ec2.get_paginator('describe_instances').paginate():
+        for reservation in page['Reservations']:
             for instance in reservation['Instances']:
-                resources['ec2_instances'].append({
+                instances.append({
                     'id': instance['InstanceId'],
                     'state': instance['State']['Name'],
                     'type': instance['InstanceType'],
-                    'region': aws_credentials.get('region'),
+                    'region': region,
                     'tags': instance.get('Tags', [])
                 })
-        rds = boto3.client(
-            'rds',
-            aws_access_key_id=aws_credentials.get('aws_access_key'),
-            aws_secret_access_key=aws_credentials.get('aws_secret_key'),
-            region_name=aws_credentials.get('region')
-        )
-        rds_instances = rds.describe_db_instances()
-        for instance in rds_instances['DBInstances']:
-            resources['rds_instances'].append({
+    return instances
+
+@aws_collector('rds_instances', 'rds')
+def collect_rds_instances(rds, region):
+    instances = []
+    for page in rds.get_paginator('describe_db_instances').paginate():
+        for instance in page['DBInstances']:
+            instances.append({
                 'id': instance['DBInstanceIdentifier'],
                 'engine': instance['Engine'],
                 'status': instance['DBInstanceStatus'],
-                'size': instance['DBInstanceClass']
+                'size': instance['DBInstanceClass'],
+                'region': region
             })
-        s3 = boto3.client(
-            's3',
-            aws_access_key_id=aws_credentials.get('aws_access_key'),
-            aws_secret_access_key=aws_credentials.get('aws_secret_key'),
-            region_name=aws_credentials.get('region')
-        )
-        buckets = s3.list_buckets()
-        for bucket in buckets['Buckets']:
-            resources['s3_buckets'].append({
-                'name': bucket['Name'],
-                'creation_date': bucket['CreationDate'].isoformat()
-            })
-        lambda_client = boto3.client(
-            'lambda',
-            aws_access_key_id=aws_credentials.get('aws_access_key'),
-            aws_secret_access_key=aws_credentials.get('aws_secret_key'),
-            region_name=aws_credentials.get('region')
-        )
-        functions = lambda_client.list_functions()
-        for function in functions['Functions']:
-            resources['lambda_functions'].append({
+    return instances
+
+@aws_collector('s3_buckets', 's3', global_service=True)
+def collect_s3_buckets(s3, region):
+    return [
+        {'name': bucket['Name'], 'creation_date': bucket['CreationDate'].isoformat()}
+        for bucket in s3.list_buckets()['Buckets']
+    ]
+
+@aws_collector('lambda_functions', 'lambda')
+def collect_lambda_functions(lambda_client, region):
+    functions = []
+    for page in lambda_client.get_paginator('list_functions').paginate():
+        for function in page['Functions']:
+            functions.append({
                 'name': function['FunctionName'],
-                'runtime': function['Runtime'],
+                # Container image functions have no runtime
+                'runtime': function.get('Runtime'),
                 'memory_size': function['MemorySize'],
-                'timeout': function['Timeout']
+                'timeout': function['Timeout'],
+                'region': region
             })
+    return functions
+
+class AwsClientPool:
+    """One boto3 client per (service, region), shared by every collector of a run."""
+
+    def __init__(self, session, timeout):
+        self.session = session
+        self.config = Config(connect_timeout=5, read_timeout=timeout, retries={'mode': 'standard', 'max_attempts': 3})
+        self._clients = {}
+        # boto3 sessions are not thread-safe; clients are, once created
+        self._lock = threading.Lock()
+
+    def client(self, service, region):
+        with self._lock:
+            if (service, region) not in self._clients:
+                self._clients[(service, region)] = self.session.client(service, region_name=region, config=self.config)
+            return self._clients[(service, region)]
+
+def collector_timeout(provider='aws'):
+    return float(os.getenv(f'{provider.upper()}_COLLECTOR_TIMEOUT_SECONDS', DEFAULT_COLLECTOR_TIMEOUT_SECONDS))
+
+def aws_regions(aws_credentials):
+    """Regions to scan: a comma separated 'regions' credential, else the single 'region'."""
+    regions = aws_credentials.get('regions')
+    if regions:
+        return [region.strip() for region in regions.split(',') if region.strip()]
+    return [aws_credentials.get('region')]
+
+class PartialResult(list):
+    """A collector's resources plus messages for the parts of its scope it could not list."""
+
+    def __init__(self, resources, errors):
+        super().__init__(resources)
+        self.errors = errors
+
+def run_collectors(tasks, timeout, label):
+    """
+    Run {(key, scope): callable} concurrently and gather each key's lists. A task
+    that fails or overruns the timeout only loses its own results, which are
+    reported in resources['errors'] with their scope (region or subscription).
+    A PartialResult keeps its resources and reports its errors there too,
+    marked 'partial'.
+    """
+    resources = {key: [] for key, _ in tasks}
+    resources['errors'] = []
+    if not tasks:
         return resources
-    except Exception as e:
-        logger.error(f"Error fetching AWS resources: {str(e)}")
-        raise CloudResourceError(f"Failed to fetch AWS resources: {str(e)}")
 
-# Fetch Azure resources (VMs, for example)
-def fetch_azure_resources(customer_id):
-    try:
-        azure_credentials = get_cloud_credentials(customer_id, 'azure')
-        if not azure_credentials:
-            return {
-                'virtual_machines': [],
-                'storage_accounts': [],
-                'sql_databases': [],
-                'virtual_networks': []
-            }
-        credential = DefaultAzureCredential()
-        subscription_id = azure_credentials.get('subscription_id')
-        resources = {
-            'virtual_machines': [],
-            'storage_accounts': [],
-            'sql_databases': [],
-            'virtual_networks': []
+    executor = ThreadPoolExecutor(max_workers=min(len(tasks), MAX_COLLECTOR_WORKERS))
+    futures = {executor.submit(bind(task)): key_scope for key_scope, task in tasks.items()}
+    done, pending = wait(futures, timeout=timeout)
+    executor.shutdown(wait=False)
+
+    for future, (key, scope) in futures.items():
+        if future in pending:
+            error = f"Timed out after {timeout}s"
+        elif future.exception() is not None:
+            error = str(future.exception())
+        else:
+            result = future.result()
+            resources[key].extend(result)
+            for error in getattr(result, 'errors', ()):
+                resources['errors'].append({'collector': key, 'region': scope, 'error': error, 'partial': True})
+            continue
+        logger.warning(f"{label} collector {key} failed in {scope}: {error}")
+        resources['errors'].append({'collector': key, 'region': scope, 'error': error})
+    return resources
+
+def run_aws_collectors(session, regions, collectors=None, timeout=None):
+    """Run every registered AWS collector for every region concurrently on a shared client pool."""
+    collectors = collectors or AWS_COLLECTORS
+    timeout = collector_timeout() if timeout is None else timeout
+    pool = AwsClientPool(session, timeout)
+
+    def task(key, region):
+        collector = collectors[key]
+        return lambda: collector['collect'](pool.client(collector['service'], region), region)
+
+    tasks = {
+        (key, region): task(key, region)
+        for key, collector in collectors.items()
+        for region in (regions[:1] if collector['global'] else regions)
+    }
+    return run_collectors(tasks, timeout, 'AWS')
+
+# Fetch AWS resources (EC2, RDS, S3, Lambda and any other registered collector)
+def fetch_aws_resources(customer_id):
+    aws_credentials = get_cloud_credentials(customer_id, 'aws')
+    if not aws_credentials:
+        resources = {key: [] for key in AWS_COLLECTORS}
+        resources['errors'] = []
+        return resources
+
+    session = instrument_boto3(boto3.Session(
+        aws_access_key_id=aws_credentials.get('aws_access_key'),
+        aws_secret_access_key=aws_credentials.get('aws_secret_key')
+    ))
+    resources = run_aws_collectors(session, aws_regions(aws_credentials))
+    if {error['collector'] for error in resources['errors'] if not error.get('partial')} == set(AWS_COLLECTORS):
+        # Every collector failed: most likely bad credentials
+        raise CloudResourceError(f"Failed to fetch AWS resources: {resources['errors'][0]['error']}")
+    return resources
+
+# Registry of Azure collectors: result key -> collect(clients)
+AZURE_COLLECTORS = {}
+
+# Per-server database listings of one subscription run this many at a time
+SQL_DATABASE_WORKERS = 8
+
+def azure_collector(key):
+    """Register collect(clients) -> list of resources, stored under resources[key]."""
+    def register(collect):
+        AZURE_COLLECTORS[key] = collect
+        return collect
+    return register
+
+class AzureClientPool:
+    """One management client per SDK class for a subscription, all sharing one credential."""
+
+    def __init__(self, credential, subscription_id):
+        self.credential = credential
+        self.subscription_id = subscription_id
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, client_class):
+        with self._lock:
+            if client_class not in self._clients:
+                service = client_class.__name__.replace('ManagementClient', '').lower()
+                self._clients[client_class] = client_class(
+                    self.credential, self.subscription_id, **azure_client_options(service)
+                )
+            return self._clients[client_class]
+
+@azure_collector('virtual_machines')
+def collect_virtual_machines(clients):
+    return [
+        {
+            'id': vm.id,
+            'name': vm.name,
+            'location': vm.location,
+            'status': vm.provisioning_state,
+            'size': vm.hardware_profile.vm_size if vm.hardware_profile else None
         }
-        compute_client = ComputeManagementClient(credential, subscription_id)
-        vm_list = compute_client.virtual_machines.list_all()
-        for vm in vm_list:
-            resources['virtual_machines'].append({
-                'id': vm.id,
-                'name': vm.name,
-                'location': vm.location,
-                'status': vm.provisioning_state,
-                'size': vm.hardware_profile.vm_size if vm.hardware_profile else None
-            })
-        storage_client = StorageManagementClient(credential, subscription_id)
-        storage_accounts = storage_client.storage_accounts.list()
-        for account in storage_accounts:
-            resources['storage_accounts'].append({
-                'id': account.id,
-                'name': account.name,
-                'location': account.location,
-                'sku': account.sku.name,
-                'kind': account.kind
-            })
-        sql_client = SqlManagementClient(credential, subscription_id)
-        servers = sql_client.servers.list()
-        for server in servers:
-            databases = sql_client.databases.list_by_server(server.resource_group, server.name)
-            for db in databases:
-                resources['sql_databases'].append({
+        for vm in clients.get(ComputeManagementClient).virtual_machines.list_all()
+    ]
+
+@azure_collector('storage_accounts')
+def collect_storage_accounts(clients):
+    return [
+        {
+            'id': account.id,
+            'name': account.name,
+            'location': account.location,
+            'sku': account.sku.name,
+            'kind': account.kind
+        }
+        for account in clients.get(StorageManagementClient).storage_accounts.list()
+    ]
+
+@azure_collector('sql_databases')
+def collect_sql_databases(clients):
+    """
+    List servers once, then their databases in parallel through the same SQL
+    client. Servers whose databases could not be listed are reported as errors.
+    """
+    sql_client = clients.get(SqlManagementClient)
+    servers = list(sql_client.servers.list())
+    errors = []
+
+    def list_databases(server):
+        # Server models carry no resource group; it is part of the resource id
+        resource_group = server.id.split('/')[4]
+        try:
+            return [
+                {
                     'id': db.id,
                     'name': db.name,
                     'server': server.name,
                     'status': db.status,
                     'edition': db.edition
-                })
-        network_client = NetworkManagementClient(credential, subscription_id)
-        vnets = network_client.virtual_networks.list_all()
-        for vnet in vnets:
-            resources['virtual_networks'].append({
-                'id': vnet.id,
-                'name': vnet.name,
-                'location': vnet.location,
-                'address_space': vnet.address_space.address_prefixes
-            })
+                }
+                for db in sql_client.databases.list_by_server(resource_group, server.name)
+            ]
+        except Exception as e:
+            message = f"Could not list databases of SQL server {server.name}: {e}"
+            logger.warning(message)
+            errors.append(message)
+            return []
+
+    if not servers:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(servers), SQL_DATABASE_WORKERS)) as executor:
+        databases = [db for databases in executor.map(bind(list_databases), servers) for db in databases]
+    return PartialResult(databases, errors)
+
+@azure_collector('virtual_networks')
+def collect_virtual_networks(clients):
+    return [
+        {
+            'id': vnet.id,
+            'name': vnet.name,
+            'location': vnet.location,
+            'address_space': vnet.address_space.address_prefixes
+        }
+        for vnet in clients.get(NetworkManagementClient).virtual_networks.list_all()
+    ]
+
+# Fetch Azure resources (VMs, storage, SQL, VNets and any other registered collector)
+def fetch_azure_resources(customer_id):
+    azure_credentials = get_cloud_credentials(customer_id, 'azure')
+    if not azure_credentials:
+        resources = {key: [] for key in AZURE_COLLECTORS}
+        resources['errors'] = []
         return resources
-    except Exception as e:
-        logger.error(f"Error fetching Azure resources: {str(e)}")
-        raise CloudResourceError(f"Failed to fetch Azure resources: {str(e)}")
 
+    subscription_id = azure_credentials.get('subscription_id')
+    clients = AzureClientPool(DefaultAzureCredential(), subscription_id)
+    tasks = {
+        (key, subscription_id): (lambda collect=collect: collect(clients))
+        for key, collect in AZURE_COLLECTORS.items()
+    }
+    resources = run_collectors(tasks, collector_timeout('azure'), 'Azure')
+    if {error['collector'] for error in resources['errors'] if not error.get('partial')} == set(AZURE_COLLECTORS):
+        # Every collector failed: most likely bad credentials
+        raise CloudResourceError(f"Failed to fetch Azure resources: {resources['errors'][0]['error']}")
+    return resources
@@ -0,0 +1,163 @@
+import logging
+from collections import Counter, defaultdict
+from azure.core import MatchConditions
+from azure.data.tables import TableTransactionError, UpdateMode
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+from table_transactions import transaction_batches
+
+logger = logging.getLogger(__name__)
+
+FLEET_SUMMARY_TABLE = 'FleetSummary'
+
+# PartitionKey of the rollup across every customer
+GLOBAL_PARTITION = '__global__'
+
+DIMENSIONS = ('type', 'status', 'region')
+
+MAX_ATTEMPTS = 5
+
+def _counts(values_list, sign=1):
+    """Count resources per (dimension, value), plus a ('total', 'all') row."""
+    counts = Counter()
+    for values in values_list:
+        counts[('total', 'all')] += sign
+        for dimension in DIMENSIONS:
+            counts[(dimension, values[dimension])] += sign
+    return counts
+
+def _row_key(provider, dimension, value):
+    return f"{provider}|{dimension}|{value}"
+
+def _read_provider_rows(table_client, partition_key, provider):
+    """All summary rows for one provider in one partition, keyed by RowKey."""
+    query = "PartitionKey eq @pk and RowKey ge @lower and RowKey lt @upper"
+    parameters = {'pk': partition_key, 'lower': f"{provider}|", 'upper': f"{provider}}}"}
+    try:
+        return {row['RowKey']: row for row in table_client.query_entities(query, parameters=parameters)}
+    except ResourceNotFoundError:
+        return {}
+
+class FleetSummaryError(Exception):
+    """A summary update was abandoned, so the global rollup no longer matches the customers."""
+
+    def __init__(self, message, applied):
+        super().__init__(message)
+        self.applied = applied
+
+def _write_counts(table_client, partition_key, provider, target):
+    """
+    Bring the summary rows of one partition to target(rows) -> {(dimension, value): count}.
+    Each batch is a single transaction guarded by the rows' ETags, so concurrent
+    refreshers never lose an update: on conflict the rows are re-read and the
+    counts whose batches did not commit are recomputed. Returns the change in
+    count of every row actually replaced; raises FleetSummaryError, carrying
+    those changes, after MAX_ATTEMPTS.
+    """
+    rows = _read_provider_rows(table_client, partition_key, provider)
+    applied = Counter()
+    committed = set()
+    for attempt in range(MAX_ATTEMPTS):
+        pending, changes, operations = [], [], []
+        for (dimension, value), count in target(rows).items():
+            row = rows.get(_row_key(provider, dimension, value))
+            previous = row["count"] if row else 0
+            if (dimension, value) in committed or count == previous:
+                continue
+            if count < 0:
+                logger.error(f"{provider} summary {dimension}={value} in partition {partition_key} would drop to {count}; the rollup has drifted.")
+            entity = {
+                "PartitionKey": partition_key,
+                "RowKey": _row_key(provider, dimension, value),
+                "provider": provider,
+                "dimension": dimension,
+                "value": value,
+                "count": count
+            }
+            if row is None:
+                operations.append(('create', entity))
+            else:
+                operations.append(('update', entity, {
+                    'mode': UpdateMode.REPLACE,
+                    'etag': row.metadata['etag'],
+                    'match_condition': MatchConditions.IfNotModified
+                }))
+            pending.append((dimension, value))
+            changes.append(count - previous)
+        try:
+            for keys, deltas, batch in zip(transaction_batches(pending), transaction_batches(changes),
+                                           transaction_batches(operations)):
+                table_client.submit_transaction(batch)
+                # Committed: a retry must not write these again
+                committed.update(keys)
+                applied.update(dict(zip(keys, deltas)))
+            return applied
+        except ResourceNotFoundError:
+            try:
+                table_client.create_table()
+            except ResourceExistsError:
+                pass  # Another refresher created it first
+        except TableTransactionError as e:
+            logger.info(f"Summary partition {partition_key} changed concurrently, retrying ({attempt + 1}/{MAX_ATTEMPTS}): {e}")
+        rows = _read_provider_rows(table_client, partition_key, provider)
+    raise FleetSummaryError(
+        f"Gave up updating {provider} summary in partition {partition_key} after {MAX_ATTEMPTS} attempts", applied
+    )
+
+def update_fleet_summary(table_service_client, customer_id, provider, indexer):
+    """
+    Fold one inventory refresh into the customer's summary and the global rollup.
+
+    The customer's rows are rewritten as absolute counts over the partition's
+    resources, so repeating a refresh changes nothing. The global rollup moves
+    by exactly what the replaced customer rows changed. If either update is
+    abandoned the committed part still reaches the global rollup and
+    FleetSummaryError is raised.
+    """
+    table_client = table_service_client.get_table_client(table_name=FLEET_SUMMARY_TABLE)
+    counts = _counts(indexer.state())
+
+    def customer_target(rows):
+        # Values no resource has any more drop to zero
+        target = {(row["dimension"], row["value"]): 0 for row in rows.values()}
+        target.update(counts)
+        return target
+
+    failure = None
+    try:
+        applied = _write_counts(table_client, customer_id, provider, customer_target)
+    except FleetSummaryError as e:
+        applied, failure = e.applied, e
+    delta = {key: change for key, change in applied.items() if change}
+
+    if delta:
+        def global_target(rows):
+            target = {}
+            for (dimension, value), change in delta.items():
+                row = rows.get(_row_key(provider, dimension, value))
+                target[(dimension, value)] = (row["count"] if row else 0) + change
+            return target
+        _write_counts(table_client, GLOBAL_PARTITION, provider, global_target)
+        logger.info(f"Applied {len(delta)} {provider} summary changes for customer {customer_id}.")
+    if failure:
+        raise failure
+
+def get_fleet_summary(table_service_client, customer_id=None):
+    """Read a customer's summary (or the global rollup) from a single partition."""
+    table_client = table_service_client.get_table_client(table_name=FLEET_SUMMARY_TABLE)
+    providers = defaultdict(lambda: {"total": 0, "by_type": {}, "by_status": {}, "by_region": {}})
+    try:
+        rows = table_client.query_entities(
+            "PartitionKey eq @pk",
+            parameters={'pk': customer_id or GLOBAL_PARTITION}
+        )
+        for row in rows:
+            if not row.get("count"):
+                continue
+            summary = providers[row["provider"]]
+            if row["dimension"] == 'total':
+                summary["total"] = row["count"]
+            else:
+                summary[f"by_{row['dimension']}"][row["value"]] = row["count"]
+    except ResourceNotFoundError:
+        pass  # No refresh has run yet
+    return {"customer_id": customer_id, "providers": dict(providers)}
@@ -1,12 +1,46 @@
 import logging
-import json
 import os
 import azure.functions as func
-from azure.data.tables import TableServiceClient, UpdateMode
-from alibabacloud_ecs20140526.client import Client as EcsClient
-from alibabacloud_tea_openapi import models as open_api_models
-from alibabacloud_ecs20140526 import models as ecs_models
+from azure.data.tables import TableServiceClient
+from inventory_sink import InventorySink
+from http_responses import listing_response
+from alibaba_inventory import DEFAULT_REGION, client_factory, collect_instances
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
 
+def refresh_alibaba_inventory(table_service_client, customer_id, create_client, home_region=DEFAULT_REGION):
+    """Scan all regions through create_client(region_id) and store the instances; returns (resources, region errors)."""
+    resources = []
+    with InventorySink(table_service_client, customer_id, 'alibaba') as sink:
+        def store_page(region_id, instances):
+            for instance in instances:
+                resource = {
+                    "id": instance.instance_id,
+                    "name": instance.instance_name,
+                    "type": "ECS Instance",
+                    "region": instance.region_id,
+                    "status": instance.status,
+                    "details": {"instance_type": instance.instance_type}
+                }
+                resources.append(resource)
+
+                # Save to AlibabaResources table
+                resource_entity = {
+                    "PartitionKey": customer_id,
+                    "RowKey": instance.instance_id,
+                    "id": instance.instance_id,
+                    "name": instance.instance_name,
+                    "type": "ECS Instance",
+                    "region": instance.region_id,
+                    "status": instance.status,
+                    "instance_type": instance.instance_type,
+                }
+                sink.add(resource_entity)
+
+        errors = collect_instances(create_client, store_page, home_region)
+    return resources, errors
+
+@instrumented('get_alibaba_resources')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request for Alibaba Cloud resources.')
 
@@ -16,7 +50,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
 
         # Get credentials from CloudCredentials table
         credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
@@ -24,54 +59,19 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
         access_key_id = credential_entity.get("access_key_id")
         access_key_secret = credential_entity.get("access_key_secret")
-        region_id = credential_entity.get("region", "cn-hangzhou")
+        region_id = credential_entity.get("region", DEFAULT_REGION)
 
         if not access_key_id or not access_key_secret:
             raise ValueError("Alibaba Cloud credentials not found or incomplete for the customer.")
 
-        # Configure Alibaba Cloud client
-        config = open_api_models.Config(
-            access_key_id=access_key_id,
-            access_key_secret=access_key_secret,
-            region_id=region_id
+        resources, errors = refresh_alibaba_inventory(
+            table_service_client, customer_id, client_factory(access_key_id, access_key_secret), region_id
         )
-        ecs_client = EcsClient(config)
-        
-        request = ecs_models.DescribeInstancesRequest(region_id=region_id)
-        response = ecs_client.describe_instances(request)
+        if errors:
+            logging.warning(f"Alibaba Cloud inventory for {customer_id} is missing regions: {sorted(errors)}")
 
-        resources = []
-        resources_client = table_service_client.get_table_client(table_name="AlibabaResources")
-
-        for instance in response.body.instances.instance:
-            resource = {
-                "id": instance.instance_id,
-                "name": instance.instance_name,
-                "type": "ECS Instance",
-                "region": instance.region_id,
-                "status": instance.status,
-                "details": {"instance_type": instance.instance_type}
-            }
-            resources.append(resource)
-
-            # Save to AlibabaResources table
-            resource_entity = {
-                "PartitionKey": customer_id,
-                "RowKey": instance.instance_id,
-                "name": instance.instance_name,
-                "type": "ECS Instance",
-                "region": instance.region_id,
-                "status": instance.status,
-                "instance_type": instance.instance_type,
-            }
-            resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
-            
-        return func.HttpResponse(
-            json.dumps({"resources": resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+        return listing_response(req, resources)
 
     except Exception as e:
         logging.error(f"Error fetching Alibaba Cloud resources: {e}")
-        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500) 
\ No newline at end of file
+        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
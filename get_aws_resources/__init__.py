@@ -2,41 +2,63 @@ import logging
 import json
 import os
 import azure.functions as func
-from azure.data.tables import TableServiceClient
+from azure.data.tables.aio import TableServiceClient
 from azure.core.exceptions import ResourceNotFoundError
+from http_responses import VARY, etag_variants, listing_response
+from serialization import shape_entity
+from inventory_version import get_inventory_version_async, make_etag, etag_matches, parse_since, unchanged_since
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables_async
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+@instrumented('get_aws_resources')
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request to list AWS resources from cache.')
 
     customer_id = req.params.get('customer_id')
     if not customer_id:
         return func.HttpResponse("Please pass a customer_id on the query string", status_code=400)
 
+    since = None
+    if req.params.get('since'):
+        try:
+            since = parse_since(req.params.get('since'))
+        except ValueError:
+            return func.HttpResponse("since must be an ISO 8601 timestamp", status_code=400)
+
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
-        
-        # Get all cached resources for this customer from the AwsResources table
-        resources_client = table_service_client.get_table_client(table_name="AwsResources")
-        filter_query = f"PartitionKey eq '{customer_id}'"
-        
-        cached_resources = list(resources_client.query_entities(filter_query))
-        
-        # Clean up the response to remove Azure-specific metadata
-        cleaned_resources = []
-        for resource in cached_resources:
-            cleaned_resource = {k: v for k, v in resource.items() if k not in ['PartitionKey', 'RowKey', 'odata.etag']}
-            cleaned_resources.append(cleaned_resource)
-            
-        return func.HttpResponse(
-            json.dumps({"resources": cleaned_resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+        async with TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables')) as table_service_client:
+            await ensure_tables_async(table_service_client)
+
+            # A single point read decides whether the client's copy is still current
+            headers = {}
+            version = await get_inventory_version_async(table_service_client, customer_id, 'aws')
+            if version:
+                etags = etag_variants(req, make_etag(customer_id, 'aws', version, since))
+                headers = {"ETag": etags[0], "Cache-Control": "no-cache", "Vary": VARY}
+                matched = next((etag for etag in etags if etag_matches(req.headers.get('If-None-Match'), etag)), None)
+                if matched:
+                    return func.HttpResponse(status_code=304, headers=dict(headers, ETag=matched))
+                if since and unchanged_since(version, since):
+                    # Nothing was written after since: an empty delta, without reading the table
+                    return listing_response(req, [], headers=headers)
+
+            # Get all cached resources for this customer from the AwsResources table
+            resources_client = table_service_client.get_table_client(table_name="AwsResources")
+            filter_query = f"PartitionKey eq '{customer_id}'"
+            parameters = None
+            if since:
+                filter_query += " and Timestamp ge @since"
+                parameters = {"since": since}
+
+            # Strip table keys in place rather than copying every entity
+            cached_resources = [shape_entity(resource) async for resource in resources_client.query_entities(filter_query, parameters=parameters)]
+
+            return listing_response(req, cached_resources, headers=headers)
     except ResourceNotFoundError:
         # The table doesn't exist yet, which is expected before the first refresh.
         logging.info("AwsResources table not found, returning empty list.")
         return func.HttpResponse(json.dumps({"resources": []}), status_code=200, mimetype="application/json")
     except Exception as e:
         logging.error(f"Error fetching cached AWS resources: {e}", exc_info=True)
-        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500) 
\ No newline at end of file
+        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
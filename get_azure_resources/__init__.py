@@ -2,37 +2,58 @@ import logging
 import json
 import os
 import azure.functions as func
-from azure.data.tables import TableServiceClient, UpdateMode
-from azure.identity import ClientSecretCredential
-from azure.mgmt.compute import ComputeManagementClient
+from azure.data.tables.aio import TableServiceClient
 from azure.core.exceptions import ResourceNotFoundError
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
+from http_responses import VARY, etag_variants, listing_response
+from serialization import shape_entity
+from inventory_version import get_inventory_version_async, make_etag, etag_matches, parse_since, unchanged_since
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables_async
+
+@instrumented('get_azure_resources')
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request to list Azure resources from cache.')
 
     customer_id = req.params.get('customer_id')
     if not customer_id:
         return func.HttpResponse("Please pass a customer_id on the query string", status_code=400)
 
+    since = None
+    if req.params.get('since'):
+        try:
+            since = parse_since(req.params.get('since'))
+        except ValueError:
+            return func.HttpResponse("since must be an ISO 8601 timestamp", status_code=400)
+
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
-        
-        resources_client = table_service_client.get_table_client(table_name="AzureResources")
-        filter_query = f"PartitionKey eq '{customer_id}'"
-        
-        cached_resources = list(resources_client.query_entities(filter_query))
-        
-        cleaned_resources = []
-        for resource in cached_resources:
-            cleaned_resource = {k: v for k, v in resource.items() if k not in ['PartitionKey', 'RowKey', 'odata.etag']}
-            cleaned_resources.append(cleaned_resource)
-            
-        return func.HttpResponse(
-            json.dumps({"resources": cleaned_resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+        async with TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables')) as table_service_client:
+            await ensure_tables_async(table_service_client)
+
+            # A single point read decides whether the client's copy is still current
+            headers = {}
+            version = await get_inventory_version_async(table_service_client, customer_id, 'azure')
+            if version:
+                etags = etag_variants(req, make_etag(customer_id, 'azure', version, since))
+                headers = {"ETag": etags[0], "Cache-Control": "no-cache", "Vary": VARY}
+                matched = next((etag for etag in etags if etag_matches(req.headers.get('If-None-Match'), etag)), None)
+                if matched:
+                    return func.HttpResponse(status_code=304, headers=dict(headers, ETag=matched))
+                if since and unchanged_since(version, since):
+                    # Nothing was written after since: an empty delta, without reading the table
+                    return listing_response(req, [], headers=headers)
+
+            resources_client = table_service_client.get_table_client(table_name="AzureResources")
+            filter_query = f"PartitionKey eq '{customer_id}'"
+            parameters = None
+            if since:
+                filter_query += " and Timestamp ge @since"
+                parameters = {"since": since}
+
+            # Strip table keys in place rather than copying every entity
+            cached_resources = [shape_entity(resource) async for resource in resources_client.query_entities(filter_query, parameters=parameters)]
+
+            return listing_response(req, cached_resources, headers=headers)
     except ResourceNotFoundError:
         # The table doesn't exist yet, which is expected before the first refresh.
         logging.info("AzureResources table not found, returning empty list.")
@@ -40,77 +61,3 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
     except Exception as e:
         logging.error(f"Error fetching cached Azure resources: {e}", exc_info=True)
         return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info('Python HTTP trigger function processed a request for Azure resources.')
-
-    customer_id = req.params.get('customer_id')
-    if not customer_id:
-        return func.HttpResponse("Please pass a customer_id on the query string", status_code=400)
-
-    try:
-        connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
-
-        # Get credentials from CloudCredentials table
-        credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
-        credential_entity = credentials_client.get_entity(partition_key="azure", row_key=customer_id)
-
-        subscription_id = credential_entity.get("subscription_id")
-        tenant_id = credential_entity.get("tenant_id")
-        client_id = credential_entity.get("client_id")
-        client_secret = credential_entity.get("client_secret")
-
-        if not all([subscription_id, tenant_id, client_id, client_secret]):
-            raise ValueError("Azure credentials not found or incomplete for the customer.")
-
-        # Authenticate with Azure
-        credential = ClientSecretCredential(
-            tenant_id=tenant_id,
-            client_id=client_id,
-            client_secret=client_secret
-        )
-        compute_client = ComputeManagementClient(credential, subscription_id)
-
-        resources = []
-        resources_client = table_service_client.get_table_client(table_name="AzureResources")
-
-        for vm in compute_client.virtual_machines.list_all():
-            status = "unknown"
-            # Getting instance view to find the status is an extra call per VM
-            # vm_view = compute_client.virtual_machines.instance_view(vm.id.split('/')[4], vm.name)
-            # statuses = [s for s in vm_view.statuses if s.code.startswith('PowerState/')]
-            # if statuses:
-            #     status = statuses[0].display_status
-
-            resource = {
-                "id": vm.id,
-                "name": vm.name,
-                "type": "Virtual Machine",
-                "region": vm.location,
-                "status": status,
-                "details": {"vm_size": vm.hardware_profile.vm_size}
-            }
-            resources.append(resource)
-
-            # Save to AzureResources table
-            resource_entity = {
-                "PartitionKey": customer_id,
-                "RowKey": vm.id.replace("/", "_"), # RowKey can't have slashes
-                "name": vm.name,
-                "type": "Virtual Machine",
-                "region": vm.location,
-                "status": status,
-                "vm_size": vm.hardware_profile.vm_size
-            }
-            resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
-            
-        return func.HttpResponse(
-            json.dumps({"resources": resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
-
-    except Exception as e:
-        logging.error(f"Error fetching Azure resources: {e}")
-        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500) 
\ No newline at end of file
@@ -0,0 +1,36 @@
+import json
+import logging
+import os
+import azure.functions as func
+from azure.data.tables import TableServiceClient
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, list_circuit_breakers
+from http_responses import json_response
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
+
+@instrumented('get_circuit_breakers')
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for circuit breakers.')
+
+    # Without a customer_id every customer's breakers that aren't closed are returned
+    customer_id = req.params.get('customer_id')
+    provider = req.params.get('provider')
+    state = req.params.get('state')
+
+    if state and state not in (CLOSED, OPEN, HALF_OPEN):
+        return func.HttpResponse(
+            json.dumps({"error": f"state must be one of {CLOSED}, {OPEN}, {HALF_OPEN}"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        connect_str = os.environ["AzureWebJobsStorage"]
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
+
+        breakers = list_circuit_breakers(table_service_client, customer_id, provider, state)
+        return json_response(req, {"breakers": breakers, "count": len(breakers)})
+    except Exception as e:
+        logging.error(f"Error fetching circuit breakers: {e}", exc_info=True)
+        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
@@ -3,7 +3,10 @@ import json
 import os
 import azure.functions as func
 from azure.data.tables import TableServiceClient
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
 
+@instrumented('get_customers')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request to get customers.')
 
@@ -17,7 +20,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
         table_client = table_service_client.get_table_client(table_name="CloudCredentials")
 
         filter_query = f"PartitionKey eq '{provider}'"
@@ -1,10 +1,14 @@
 import logging
-import json
 import os
 import digitalocean
 import azure.functions as func
-from azure.data.tables import TableServiceClient, UpdateMode
+from azure.data.tables import TableServiceClient
+from inventory_sink import InventorySink
+from http_responses import listing_response
+from instrumentation import azure_client_options, instrumented, span
+from table_schema import ensure_tables
 
+@instrumented('get_digitalocean_resources')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request for DigitalOcean resources.')
 
@@ -14,7 +18,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
 
         # Get credentials from CloudCredentials table
         credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
@@ -25,45 +30,42 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             raise ValueError("DigitalOcean token not found for the customer.")
 
         manager = digitalocean.Manager(token=token)
-        droplets = manager.get_all_droplets()
+        with span('digitalocean', 'droplets', 'get_all_droplets'):
+            droplets = manager.get_all_droplets()
 
         resources = []
-        resources_client = table_service_client.get_table_client(table_name="DigitalOceanResources")
+        with InventorySink(table_service_client, customer_id, 'digitalocean') as sink:
+            for droplet in droplets:
+                resource = {
+                    "id": droplet.id,
+                    "name": droplet.name,
+                    "type": "Droplet",
+                    "region": droplet.region['slug'],
+                    "status": droplet.status,
+                    "details": {
+                        "memory": droplet.memory,
+                        "disk": droplet.disk,
+                        "vcpus": droplet.vcpus
+                    }
+                }
+                resources.append(resource)
 
-        for droplet in droplets:
-            resource = {
-                "id": droplet.id,
-                "name": droplet.name,
-                "type": "Droplet",
-                "region": droplet.region['slug'],
-                "status": droplet.status,
-                "details": {
+                # Save to DigitalOceanResources table
+                resource_entity = {
+                    "PartitionKey": customer_id,
+                    "RowKey": str(droplet.id),
+                    "id": droplet.id,
+                    "name": droplet.name,
+                    "type": "Droplet",
+                    "region": droplet.region['slug'],
+                    "status": droplet.status,
                     "memory": droplet.memory,
                     "disk": droplet.disk,
                     "vcpus": droplet.vcpus
                 }
-            }
-            resources.append(resource)
-
-            # Save to DigitalOceanResources table
-            resource_entity = {
-                "PartitionKey": customer_id,
-                "RowKey": str(droplet.id),
-                "name": droplet.name,
-                "type": "Droplet",
-                "region": droplet.region['slug'],
-                "status": droplet.status,
-                "memory": droplet.memory,
-                "disk": droplet.disk,
-                "vcpus": droplet.vcpus
-            }
-            resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
+                sink.add(resource_entity)
 
-        return func.HttpResponse(
-            json.dumps({"resources": resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+        return listing_response(req, resources)
 
     except Exception as e:
         logging.error(f"Error fetching DigitalOcean resources: {e}")
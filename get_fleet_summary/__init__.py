@@ -0,0 +1,25 @@
+import logging
+import os
+import azure.functions as func
+from azure.data.tables import TableServiceClient
+from fleet_summary import get_fleet_summary
+from http_responses import json_response
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
+
+@instrumented('get_fleet_summary')
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for the fleet summary.')
+
+    # Without a customer_id the global rollup across all customers is returned
+    customer_id = req.params.get('customer_id')
+
+    try:
+        connect_str = os.environ["AzureWebJobsStorage"]
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
+
+        return json_response(req, get_fleet_summary(table_service_client, customer_id))
+    except Exception as e:
+        logging.error(f"Error fetching fleet summary: {e}", exc_info=True)
+        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
@@ -0,0 +1,184 @@
+import logging
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import azure.functions as func
+import boto3
+from azure.data.tables import TableServiceClient
+from http_responses import json_response, summarize_metrics, wants_summary
+from metric_cache import METRICS_TABLE
+from metric_windows import window_from_params, window_json
+from provider_metrics import collect_aws_metrics_bulk, collect_azure_metrics_bulk
+from instrumentation import azure_client_options, bind, instrument_boto3, instrumented
+from table_schema import ensure_tables
+
+# Keeps one request within the Functions timeout and a single GetMetricData call per region
+MAX_BULK_RESOURCES = 100
+
+SUPPORTED_PROVIDERS = ('aws', 'azure')
+
+REQUIRED_CREDENTIALS = {
+    'aws': ('access_key_id', 'secret_access_key'),
+    'azure': ('subscription_id', 'tenant_id', 'client_id', 'client_secret')
+}
+
+def error_message(error):
+    code = getattr(error, 'response', None) and error.response.get('Error', {}).get('Code')
+    return f"{code}: {error}" if code else str(error)
+
+@instrumented('get_resource_details_bulk')
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request for bulk resource details.')
+
+    try:
+        req_body = req.get_json()
+    except ValueError:
+        req_body = {}
+    if not isinstance(req_body, dict):
+        return func.HttpResponse(
+            json.dumps({"error": "Invalid request body", "message": "The body must be a JSON object"}),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    customer_id = req.params.get('customer_id') or req_body.get('customer_id')
+    requested = req_body.get('resources')
+
+    if not customer_id or not isinstance(requested, list) or not requested:
+        return func.HttpResponse(
+            json.dumps({
+                "error": "Missing required parameters",
+                "required": ["customer_id", "resources"]
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+    if not all(isinstance(item, dict) for item in requested):
+        return func.HttpResponse(
+            json.dumps({
+                "error": "Invalid resources",
+                "message": "resources must be a list of objects with provider, resource_id and region"
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+    if len(requested) > MAX_BULK_RESOURCES:
+        return func.HttpResponse(
+            json.dumps({
+                "error": "Too many resources",
+                "message": f"At most {MAX_BULK_RESOURCES} resources per request"
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    # One window per provider, since each aligns to its own granularities and retention
+    range_params = {key: req.params.get(key) or req_body.get(key) for key in ('start', 'end', 'max_points')}
+    windows = {}
+    for provider in SUPPORTED_PROVIDERS:
+        try:
+            windows[provider] = window_from_params(provider, range_params)
+        except ValueError as e:
+            windows[provider] = e
+    if all(isinstance(window, Exception) for window in windows.values()):
+        return func.HttpResponse(
+            json.dumps({
+                "error": "Invalid time range",
+                "message": str(windows['aws'])
+            }),
+            status_code=400,
+            mimetype="application/json"
+        )
+
+    try:
+        connect_str = os.environ["AzureWebJobsStorage"]
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
+        credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
+        metrics_client = table_service_client.get_table_client(table_name=METRICS_TABLE)
+        resources_client = table_service_client.get_table_client(table_name="AwsResources")
+
+        # One entry per requested resource, in request order; failures stay in place
+        entries = []
+        groups = defaultdict(list)  # (provider, region) -> resource ids
+        for item in requested:
+            provider = str(item.get('provider') or '').lower()
+            entry = {"id": item.get('resource_id'), "provider": provider, "region": item.get('region')}
+            entries.append(entry)
+            if not all(entry.values()):
+                entry["error"] = "Each resource needs provider, resource_id and region"
+            elif provider not in SUPPORTED_PROVIDERS:
+                entry["error"] = f"Metric fetching not implemented for provider: {provider}"
+            else:
+                groups[(provider, entry["region"])].append(entry["id"])
+
+        # Credentials are read once per provider, not once per resource
+        credentials = {}
+        for provider in {provider for provider, _ in groups}:
+            try:
+                credential_entity = credentials_client.get_entity(partition_key=provider, row_key=customer_id)
+                if all(credential_entity.get(field) for field in REQUIRED_CREDENTIALS[provider]):
+                    credentials[provider] = credential_entity
+                else:
+                    credentials[provider] = ValueError(f"{provider} credentials incomplete")
+            except Exception as e:
+                logging.error(f"Failed to get credentials for customer {customer_id} and provider {provider}: {e}")
+                credentials[provider] = ValueError(f"Could not retrieve {provider} credentials for customer {customer_id}")
+
+        sessions = {}
+        if isinstance(credentials.get('aws'), dict):
+            sessions['aws'] = instrument_boto3(boto3.Session(
+                aws_access_key_id=credentials['aws'].get("access_key_id"),
+                aws_secret_access_key=credentials['aws'].get("secret_access_key")
+            ))
+
+        def collect(provider, region, resource_ids):
+            for failure in (credentials[provider], windows[provider]):
+                if isinstance(failure, Exception):
+                    return {resource_id: failure for resource_id in resource_ids}
+            if provider == 'aws':
+                return collect_aws_metrics_bulk(
+                    metrics_client, resources_client, customer_id, resource_ids, region, sessions['aws'], windows['aws']
+                )
+            results = collect_azure_metrics_bulk(
+                metrics_client, customer_id, resource_ids, credentials[provider], windows['azure']
+            )
+            return {resource_id: ('azure', metrics) if not isinstance(metrics, Exception) else metrics
+                    for resource_id, metrics in results.items()}
+
+        results = {}
+        if groups:
+            with ThreadPoolExecutor(max_workers=min(len(groups), 8)) as executor:
+                futures = {key: executor.submit(bind(collect), key[0], key[1], list(dict.fromkeys(ids)))
+                           for key, ids in groups.items()}
+                for key, future in futures.items():
+                    for resource_id, result in future.result().items():
+                        results[(key[0], key[1], resource_id)] = result
+
+        summary = wants_summary(req)
+        failed = 0
+        for entry in entries:
+            result = results.get((entry["provider"], entry["region"], entry["id"]))
+            if isinstance(result, Exception):
+                entry["error"] = error_message(result)
+            elif result is not None:
+                entry["type"], metrics = result
+                entry["window"] = window_json(windows[entry["provider"]])
+                entry["metrics"] = summarize_metrics(metrics) if summary and metrics else metrics
+            if "error" in entry:
+                failed += 1
+
+        logging.info(f"Bulk details for customer {customer_id}: {len(entries)} resources in {len(groups)} groups, {failed} failed.")
+        return json_response(req, {"customer_id": customer_id, "resources": entries, "failed": failed})
+
+    except Exception as e:
+        logging.error(f"Unexpected error fetching bulk resource details: {e}", exc_info=True)
+        return func.HttpResponse(
+            json.dumps({
+                "error": "Internal server error",
+                "message": f"An unexpected error occurred: {str(e)}"
+            }),
+            status_code=500,
+            mimetype="application/json"
+        )
@@ -1,21 +1,27 @@
 import azure.functions as func
-import json
 import logging
-from azure.data.tables import TableServiceClient, UpdateMode
+from azure.data.tables import TableServiceClient
+from inventory_sink import InventorySink
+from http_responses import listing_response
+from instrumentation import azure_client_options, instrument_boto3, instrumented
+from table_schema import ensure_tables
 import os
 import boto3
 from azure.identity import ClientSecretCredential
 from azure.mgmt.compute import ComputeManagementClient
 
+# boto3.client() below builds its clients from the default session
+instrument_boto3()
+
 
 def fetch_aws_resources(cred):
     try:
-        session = boto3.Session(
+        session = instrument_boto3(boto3.Session(
             aws_access_key_id=cred.get('ClientId'),
             aws_secret_access_key=cred.get('ClientSecret'),
             aws_session_token=cred.get('SessionToken'),  # Optional
             region_name=cred.get('Region', 'us-east-1')
-        )
+        ))
         ec2 = session.resource('ec2')
         instances = ec2.instances.all()
         resources = []
@@ -40,7 +46,7 @@ def fetch_azure_resources(cred):
             client_secret=cred.get('ClientSecret')
         )
         subscription_id = cred.get('SubscriptionId')
-        compute_client = ComputeManagementClient(credential, subscription_id)
+        compute_client = ComputeManagementClient(credential, subscription_id, **azure_client_options('compute'))
         vms = compute_client.virtual_machines.list_all()
         resources = []
         for vm in vms:
@@ -56,6 +62,7 @@ def fetch_azure_resources(cred):
         logging.error(f"Azure fetch error: {e}")
         return []
 
+@instrumented('get_resources')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request for AWS resources.')
 
@@ -65,7 +72,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
         
         # Get credentials from CloudCredentials table
         credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
@@ -89,47 +97,44 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         response = ec2_client.describe_instances()
 
         resources = []
-        for reservation in response["Reservations"]:
-            for instance in reservation["Instances"]:
-                instance_id = instance["InstanceId"]
-                instance_type = instance["InstanceType"]
-                status = instance["State"]["Name"]
-                name_tag = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), 'N/A')
-
-                resource = {
-                    "id": instance_id,
-                    "name": name_tag,
-                    "type": "EC2 Instance",
-                    "region": aws_region,
-                    "status": status,
-                    "details": {
+        with InventorySink(table_service_client, customer_id, 'aws') as sink:
+            for reservation in response["Reservations"]:
+                for instance in reservation["Instances"]:
+                    instance_id = instance["InstanceId"]
+                    instance_type = instance["InstanceType"]
+                    status = instance["State"]["Name"]
+                    name_tag = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), 'N/A')
+
+                    resource = {
+                        "id": instance_id,
+                        "name": name_tag,
+                        "type": "EC2 Instance",
+                        "region": aws_region,
+                        "status": status,
+                        "details": {
+                            "instance_type": instance_type,
+                            "private_ip": instance.get("PrivateIpAddress"),
+                            "public_ip": instance.get("PublicIpAddress")
+                        }
+                    }
+                    resources.append(resource)
+
+                    # Save to AwsResources table
+                    resource_entity = {
+                        "PartitionKey": customer_id,
+                        "RowKey": instance_id,
+                        "id": instance_id,
+                        "name": name_tag,
+                        "type": "EC2 Instance",
+                        "region": aws_region,
+                        "status": status,
                         "instance_type": instance_type,
                         "private_ip": instance.get("PrivateIpAddress"),
-                        "public_ip": instance.get("PublicIpAddress")
+                        "public_ip": instance.get("PublicIpAddress"),
                     }
-                }
-                resources.append(resource)
-
-                # Save to AwsResources table
-                resources_client = table_service_client.get_table_client(table_name="AwsResources")
-                resource_entity = {
-                    "PartitionKey": customer_id,
-                    "RowKey": instance_id,
-                    "name": name_tag,
-                    "type": "EC2 Instance",
-                    "region": aws_region,
-                    "status": status,
-                    "instance_type": instance_type,
-                    "private_ip": instance.get("PrivateIpAddress"),
-                    "public_ip": instance.get("PublicIpAddress"),
-                }
-                resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
-        
-        return func.HttpResponse(
-            json.dumps({"resources": resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+                    sink.add(resource_entity)
+
+        return listing_response(req, resources)
 
     except Exception as e:
         logging.error(f"Error fetching AWS resources: {e}")
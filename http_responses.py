@@ -0,0 +1,192 @@
+import logging
+import zlib
+from collections import Counter
+import azure.functions as func
+from serialization import dumps
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are sent as-is; compressing them costs more than it saves
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5  # Dynamic content: quality 11 is far too slow per request
+NDJSON_MIMETYPE = "application/x-ndjson"
+# Request headers that pick the body: its shape (Accept, Prefer) and content-coding
+VARY = "Accept, Accept-Encoding, Prefer"
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br', 'gzip' or None from an Accept-Encoding header, honouring q-values."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    wildcard = weights.get('*', 0.0)
+    supported = ['br', 'gzip'] if brotli else ['gzip']
+    best = None
+    for coding in supported:
+        q = weights.get(coding, wildcard)
+        if q > 0 and (best is None or q > weights.get(best, wildcard)):
+            best = coding
+    return best
+
+class _Compressor:
+    """Incremental compressor so chunks can be encoded without joining them first."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == 'gzip':
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            self._obj = None
+
+    def compress(self, chunk):
+        if self._obj is None:
+            return chunk
+        if self.encoding == 'br':
+            return self._obj.process(chunk)
+        return self._obj.compress(chunk)
+
+    def flush(self):
+        if self._obj is None:
+            return b''
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+def wants_summary(req):
+    """Clients opt into a summary-only body with ?summary=true or 'Prefer: return=minimal'."""
+    if (req.params.get('summary') or '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'return=minimal' in (req.headers.get('Prefer') or '').lower()
+
+def wants_ndjson(req):
+    """Clients opt into NDJSON with ?format=ndjson or an Accept header naming it."""
+    if (req.params.get('format') or '').lower() == 'ndjson':
+        return True
+    return NDJSON_MIMETYPE in (req.headers.get('Accept') or '').lower()
+
+def _tagged(etag, suffix):
+    opaque = etag.strip('"')
+    return f'"{opaque}-{suffix}"'
+
+def representation_etag(req, etag):
+    """
+    Strong ETag of the listing shape this request gets, derived from the
+    listing's ETag: summary and NDJSON bodies are different bytes, so each gets
+    its own validator. _encode_chunks adds the content-coding when it applies one.
+    """
+    shape = 'summary' if wants_summary(req) else 'ndjson' if wants_ndjson(req) else 'json'
+    return etag if shape == 'json' else _tagged(etag, shape)
+
+def etag_variants(req, etag):
+    """
+    The ETags this request's body can carry: uncompressed first, then in the
+    negotiated content-coding, which only bodies over MIN_COMPRESS_BYTES get.
+    """
+    etag = representation_etag(req, etag)
+    encoding = negotiate_encoding(req.headers.get('Accept-Encoding'))
+    return [etag, _tagged(etag, encoding)] if encoding else [etag]
+
+def summarize_resources(resources):
+    """Counts by type, status and region for a list of resource dicts."""
+    by_type, by_status, by_region = Counter(), Counter(), Counter()
+    for resource in resources:
+        by_type[resource.get('type') or 'unknown'] += 1
+        by_status[resource.get('status') or 'unknown'] += 1
+        by_region[resource.get('region') or 'unknown'] += 1
+    return {
+        "count": len(resources),
+        "by_type": dict(by_type),
+        "by_status": dict(by_status),
+        "by_region": dict(by_region)
+    }
+
+def summarize_metrics(metrics):
+    """Replace each metric's datapoints with their count and latest value."""
+    summary = []
+    for metric in metrics:
+        data = metric.get("data") or []
+        summary.append({
+            "name": metric.get("name"),
+            "unit": metric.get("unit"),
+            "points": len(data),
+            "latest": data[-1] if data else None
+        })
+    return summary
+
+def _encode_chunks(req, chunks, mimetype, status_code, headers):
+    """Encode byte chunks into one (optionally compressed) HttpResponse."""
+    encoding = negotiate_encoding(req.headers.get('Accept-Encoding'))
+    headers = dict(headers or {})
+    headers['Vary'] = VARY
+
+    compressor = None
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if compressor is None:
+            size += len(chunk)
+            parts.append(chunk)
+            if encoding and size >= MIN_COMPRESS_BYTES:
+                # Large enough: switch to compressing, feeding what was buffered so far
+                compressor = _Compressor(encoding)
+                parts = [compressor.compress(b''.join(parts))]
+        else:
+            parts.append(compressor.compress(chunk))
+    if compressor is not None:
+        parts.append(compressor.flush())
+        headers['Content-Encoding'] = encoding
+        if 'ETag' in headers:
+            # Only compressed bodies get the coding in their validator
+            headers['ETag'] = _tagged(headers['ETag'], encoding)
+
+    return func.HttpResponse(
+        b''.join(parts),
+        status_code=status_code,
+        mimetype=mimetype,
+        headers=headers
+    )
+
+def json_response(req, payload, status_code=200, headers=None):
+    """Serialize a payload as JSON, compressed when the client accepts it."""
+    body = dumps(payload)
+    return _encode_chunks(req, [body], "application/json", status_code, headers)
+
+def _ndjson_chunks(items):
+    for item in items:
+        yield dumps(item) + b'\n'
+
+def listing_response(req, resources, extra=None, status_code=200, headers=None):
+    """
+    Respond with a resource listing in the shape the client asked for:
+    a summary-only body, NDJSON (one resource per line, encoded and compressed
+    incrementally), or the usual {"resources": [...]} JSON document.
+    """
+    if wants_summary(req):
+        payload = summarize_resources(resources)
+        if extra:
+            payload.update(extra)
+        return json_response(req, payload, status_code=status_code, headers=headers)
+    if wants_ndjson(req):
+        return _encode_chunks(req, _ndjson_chunks(resources), NDJSON_MIMETYPE, status_code, headers)
+    payload = {"resources": resources}
+    if extra:
+        payload.update(extra)
+    return json_response(req, payload, status_code=status_code, headers=headers)
@@ -0,0 +1,229 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from azure.core.pipeline.policies import SansIOHTTPPolicy
+
+try:
+    from opentelemetry import metrics as otel_metrics
+except ImportError:  # OpenTelemetry is optional; structured logs are always emitted
+    otel_metrics = None
+
+logger = logging.getLogger(__name__)
+
+# Decided once at import: when off, every hook below hands back what it was given
+ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
+_otel_histogram = None
+if ENABLED and otel_metrics is not None and os.getenv('INSTRUMENTATION_EXPORTER', 'log').lower() == 'otel':
+    _otel_histogram = otel_metrics.get_meter(__name__).create_histogram(
+        'cloud_api.call.duration', unit='s', description='Provider SDK and table call latency'
+    )
+
+_current = contextvars.ContextVar('instrumentation_invocation', default=None)
+
+THROTTLE_STATUSES = (429, 503)
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Invocation:
+    """Spans recorded during one function invocation, aggregated per call site."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._durations = defaultdict(list)  # (provider, service, operation, region) -> seconds
+        self._outcomes = defaultdict(lambda: defaultdict(int))
+        self._bytes = defaultdict(int)
+
+    def record(self, provider, service, operation, region, outcome, seconds, size=None):
+        key = (provider, service, operation, region)
+        with self._lock:
+            self._durations[key].append(seconds)
+            self._outcomes[key][outcome] += 1
+            if size:
+                self._bytes[key] += size
+
+    def summary(self):
+        """Per call site count, outcomes, bytes and p50/p95/p99 in milliseconds, slowest total first."""
+        calls = []
+        with self._lock:
+            for key, durations in self._durations.items():
+                ordered = sorted(durations)
+                calls.append({
+                    "provider": key[0], "service": key[1], "operation": key[2], "region": key[3],
+                    "count": len(ordered),
+                    "outcomes": dict(self._outcomes[key]),
+                    "bytes": self._bytes[key],
+                    "total_ms": round(sum(ordered) * 1000, 1),
+                    "p50_ms": round(_percentile(ordered, 0.50) * 1000, 1),
+                    "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+                    "p99_ms": round(_percentile(ordered, 0.99) * 1000, 1)
+                })
+        calls.sort(key=lambda call: call["total_ms"], reverse=True)
+        return {
+            "invocation": self.name,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "calls": calls
+        }
+
+def record(provider, service, operation, region, outcome, seconds, size=None):
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.record(provider, service, operation, region, outcome, seconds, size)
+    if _otel_histogram is not None:
+        _otel_histogram.record(seconds, {
+            "provider": provider, "service": service, "operation": operation,
+            "region": region or "", "outcome": outcome
+        })
+
+def instrumented(name):
+    """Decorate a function's main so its spans are aggregated and logged as one line when it returns."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        if inspect.iscoroutinefunction(fn):
+            # Tasks and asyncio.to_thread copy the context, so spans of the whole invocation land here
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                invocation = Invocation(name)
+                token = _current.set(invocation)
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _current.reset(token)
+                    logger.info(f"Invocation metrics: {json.dumps(invocation.summary())}")
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            invocation = Invocation(name)
+            token = _current.set(invocation)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+                logger.info(f"Invocation metrics: {json.dumps(invocation.summary())}")
+        return wrapper
+    return decorate
+
+def bind(fn):
+    """Carry the current invocation into worker threads; wrap what goes to executor.submit/map with this."""
+    invocation = _current.get()
+    if invocation is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(invocation)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+@contextmanager
+def span(provider, service, operation, region=None):
+    """Time a call made through an SDK without hooks (Alibaba Cloud, DigitalOcean)."""
+    if not ENABLED:
+        yield
+        return
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        record(provider, service, operation, region, outcome, time.perf_counter() - started)
+
+def _outcome(status):
+    if status in THROTTLE_STATUSES:
+        return 'throttled'
+    return 'ok' if status < 400 else 'error'
+
+def _before_aws_call(context, **kwargs):
+    context['instrumentation_started'] = time.perf_counter()
+
+def _after_aws_call(http_response, model, context, **kwargs):
+    started = context.get('instrumentation_started')
+    if started is not None:
+        size = http_response.headers.get('content-length')
+        record('aws', model.service_model.endpoint_prefix, model.name, context.get('client_region'),
+               _outcome(http_response.status_code), time.perf_counter() - started, int(size) if size else None)
+
+def _after_aws_call_error(model, context, **kwargs):
+    started = context.get('instrumentation_started')
+    if started is not None:
+        record('aws', model.service_model.endpoint_prefix, model.name, context.get('client_region'),
+               'error', time.perf_counter() - started)
+
+def instrument_boto3(session=None):
+    """
+    Time every API call of clients created from this boto3 session afterwards
+    (the default session when None, which is what boto3.client uses). Clients
+    copy the session's hooks when created, so call this before creating them.
+    """
+    if not ENABLED:
+        return session
+    import boto3
+    target = session or boto3._get_default_session()
+    target.events.register('before-call', _before_aws_call, unique_id='instrumentation-before-call')
+    target.events.register('after-call', _after_aws_call, unique_id='instrumentation-after-call')
+    target.events.register('after-call-error', _after_aws_call_error, unique_id='instrumentation-after-call-error')
+    return session
+
+def _arm_operation(method, path):
+    """'get virtualMachines' for ARM paths, which alternate collection and instance segments."""
+    segments = [segment for segment in path.split('/') if segment]
+    collection = segments[-1] if len(segments) % 2 else segments[-2] if segments else ''
+    return f"{method.lower()} {collection}"
+
+def _table_operation(method, path):
+    """'get AwsResources', 'post $batch': the table (or Tables/$batch) from the first path segment."""
+    table = path.strip('/').split('/')[0].split('(')[0]
+    return f"{method.lower()} {table}"
+
+class AzureCallPolicy(SansIOHTTPPolicy):
+    """Per-call pipeline policy timing each Azure SDK operation, retries included."""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def _operation(self, request):
+        http_request = request.http_request
+        path = http_request.url.split('://', 1)[-1].split('?')[0].partition('/')[2]
+        if self.service == 'tables':
+            return _table_operation(http_request.method, path)
+        return _arm_operation(http_request.method, path)
+
+    def on_request(self, request):
+        request.context['instrumentation_started'] = time.perf_counter()
+
+    def on_response(self, request, response):
+        started = request.context.get('instrumentation_started')
+        if started is not None:
+            size = response.http_response.headers.get('Content-Length')
+            record('azure', self.service, self._operation(request), None,
+                   _outcome(response.http_response.status_code), time.perf_counter() - started,
+                   int(size) if size else None)
+
+    def on_exception(self, request):
+        started = request.context.get('instrumentation_started')
+        if started is not None:
+            record('azure', self.service, self._operation(request), None, 'error', time.perf_counter() - started)
+
+def azure_client_options(service):
+    """Keyword arguments for an Azure SDK client constructor; empty when instrumentation is off."""
+    if not ENABLED:
+        return {}
+    return {'per_call_policies': [AzureCallPolicy(service)]}
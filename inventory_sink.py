@@ -0,0 +1,118 @@
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from azure.data.tables import UpdateMode
+from azure.core.exceptions import HttpResponseError, ResourceNotFoundError, ResourceExistsError
+from fleet_summary import update_fleet_summary
+from instrumentation import bind
+from inventory_version import bump_inventory_version
+from resource_index import ResourceIndexer
+from resource_listing import RESOURCE_TABLES
+from table_transactions import MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.5
+# Batches written in the background while the collector keeps fetching
+FLUSH_WORKERS = 2
+
+class InventorySink:
+    """
+    Batched writes of one provider inventory refresh.
+
+    add() buffers entities per PartitionKey. Each time a partition reaches 100
+    entities, its batch is submitted as one MERGE-upsert transaction on a
+    background thread, so storage writes overlap with fetching. A failed batch
+    is retried, then written entity by entity so one bad row cannot sink the
+    rest. close() flushes what is left, waits for every batch and runs the
+    refresh hooks: index rows, fleet summary and the inventory version bump.
+
+    Use it as a context manager so close() also runs when the collector
+    raises: batches already written then still reach the index, the summary
+    and the version, and the flush threads are shut down.
+    """
+
+    def __init__(self, table_service_client, customer_id, provider):
+        self.table_service_client = table_service_client
+        self.customer_id = customer_id
+        self.provider = provider
+        self.table_client = table_service_client.get_table_client(table_name=RESOURCE_TABLES[provider])
+        # Created before any write so it snapshots the inventory as it was
+        self.indexer = ResourceIndexer(table_service_client, customer_id, provider)
+        self._buffers = defaultdict(OrderedDict)  # PartitionKey -> RowKey -> entity
+        self._executor = ThreadPoolExecutor(max_workers=FLUSH_WORKERS)
+        self._futures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        try:
+            self.close()
+        except Exception as e:
+            # Don't mask the collector's error with the cleanup's
+            logger.error(f"Failed to close {self.provider} inventory sink for customer {self.customer_id}: {e}")
+
+    def add(self, entity):
+        buffer = self._buffers[entity['PartitionKey']]
+        # A transaction may touch each entity once; merge repeats instead
+        buffer[entity['RowKey']] = dict(buffer.get(entity['RowKey'], {}), **entity)
+        self.indexer.add(entity)
+        if len(buffer) >= MAX_BATCH_SIZE:
+            self._submit(self._buffers.pop(entity['PartitionKey']))
+
+    def _submit(self, buffer):
+        self._futures.append(self._executor.submit(bind(self._write_batch), list(buffer.values())))
+
+    def _write_batch(self, entities):
+        """Write one batch; returns the RowKeys that could not be written."""
+        operations = [('upsert', entity, {'mode': UpdateMode.MERGE}) for entity in entities]
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                self.table_client.submit_transaction(operations)
+                return []
+            except ResourceNotFoundError:
+                try:
+                    self.table_client.create_table()
+                except ResourceExistsError:
+                    pass  # Another writer created it first
+            except HttpResponseError as e:
+                logger.warning(f"{self.provider} inventory batch of {len(entities)} failed ({attempt + 1}/{MAX_ATTEMPTS}): {e}")
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+        failed = []
+        for entity in entities:
+            try:
+                self.table_client.upsert_entity(entity=entity, mode=UpdateMode.MERGE)
+            except HttpResponseError as e:
+                logger.error(f"Failed to write {self.provider} resource {entity['RowKey']}: {e}")
+                failed.append(entity['RowKey'])
+        return failed
+
+    def close(self):
+        """Flush, wait for all batches, then update index, summary and version; returns entities written."""
+        for partition_key in list(self._buffers):
+            self._submit(self._buffers.pop(partition_key))
+        try:
+            failed = [row_key for future in self._futures for row_key in future.result()]
+        finally:
+            self._executor.shutdown(wait=True)
+
+        # Rows that never reached the table must not be indexed or counted
+        for row_key in failed:
+            self.indexer.discard(row_key)
+        written = len(self.indexer.changes())
+
+        self.indexer.flush()
+        try:
+            update_fleet_summary(self.table_service_client, self.customer_id, self.provider, self.indexer)
+        finally:
+            # The inventory itself was written; listings must see the new version either way
+            bump_inventory_version(self.table_service_client, self.customer_id, self.provider)
+        logger.info(f"Wrote {written} {self.provider} resources for customer {self.customer_id} in batches, {len(failed)} failed.")
+        return written
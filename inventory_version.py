@@ -0,0 +1,80 @@
+import hashlib
+import logging
+import uuid
+from datetime import datetime, timezone
+from azure.data.tables import UpdateMode
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_VERSIONS_TABLE = 'InventoryVersions'
+
+async def get_inventory_version_async(table_service_client, customer_id, provider):
+    """
+    Fetch the inventory version entity for a customer and provider.
+    Table: InventoryVersions
+    PartitionKey: customer_id
+    RowKey: provider (e.g., 'aws', 'azure')
+    Returns None if the inventory has never been refreshed.
+    """
+    table_client = table_service_client.get_table_client(table_name=INVENTORY_VERSIONS_TABLE)
+    try:
+        return await table_client.get_entity(partition_key=customer_id, row_key=provider)
+    except ResourceNotFoundError:
+        return None
+
+def bump_inventory_version(table_service_client, customer_id, provider):
+    """Record that a customer's cached inventory for a provider has changed."""
+    table_client = table_service_client.get_table_client(table_name=INVENTORY_VERSIONS_TABLE)
+    entity = {
+        "PartitionKey": customer_id,
+        "RowKey": provider,
+        "version": uuid.uuid4().hex,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    try:
+        table_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
+    except ResourceNotFoundError:
+        try:
+            table_client.create_table()
+        except ResourceExistsError:
+            pass  # Another refresh created it first
+        table_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
+    logger.info(f"Bumped {provider} inventory version for customer {customer_id} to {entity['version']}.")
+    return entity
+
+def make_etag(customer_id, provider, version_entity, since=None):
+    """
+    Build a strong ETag for a cached listing from its inventory version. A
+    since-filtered listing is a different body, so its since is part of the tag.
+    """
+    key = f"{customer_id}:{provider}:{version_entity['version']}"
+    if since:
+        key += f":since={since.isoformat()}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(if_none_match, etag):
+    """Evaluate an If-None-Match header against our ETag (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == '*' or candidate == etag:
+            return True
+    return False
+
+def parse_since(value):
+    """Parse an ISO 8601 'since' value into an aware UTC datetime; raises ValueError."""
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since
+
+def unchanged_since(version_entity, since):
+    """True if the inventory has not been refreshed after the given time."""
+    return datetime.fromisoformat(version_entity['updated_at']) <= since
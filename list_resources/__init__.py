@@ -0,0 +1,58 @@
+import logging
+import os
+import azure.functions as func
+from azure.data.tables import TableServiceClient
+from http_responses import listing_response
+from resource_listing import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, list_resources_page, parse_providers, parse_select
+)
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
+
+@instrumented('list_resources')
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request to list cached resources across providers.')
+
+    customer_id = req.params.get('customer_id')
+    if not customer_id:
+        return func.HttpResponse("Please pass a customer_id on the query string", status_code=400)
+
+    try:
+        providers = parse_providers(req.params.get('provider'))
+        select = parse_select(req.params.get('select'))
+        page_size = int(req.params.get('page_size', DEFAULT_PAGE_SIZE))
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    try:
+        connect_str = os.environ["AzureWebJobsStorage"]
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
+
+        try:
+            page = list_resources_page(
+                table_service_client,
+                customer_id,
+                providers,
+                select=select,
+                page_size=page_size,
+                continuation_token=req.params.get('continuation_token')
+            )
+        except ValueError as e:
+            return func.HttpResponse(str(e), status_code=400)
+
+        headers = {}
+        if page['continuation_token']:
+            # NDJSON bodies have no envelope, so the token also travels as a header
+            headers['X-Continuation-Token'] = page['continuation_token']
+        return listing_response(
+            req,
+            page['resources'],
+            extra={'continuation_token': page['continuation_token']},
+            headers=headers
+        )
+    except Exception as e:
+        logging.error(f"Error listing cached resources: {e}", exc_info=True)
+        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
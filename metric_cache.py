@@ -0,0 +1,146 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+METRICS_TABLE = 'ResourceMetrics'
+
+# refresh_metrics stores 5-minute averages
+STORED_PERIOD_SECONDS = 300
+
+# Stored series newer than this are served without calling the provider
+DEFAULT_MAX_STALENESS_SECONDS = 600
+
+STORED_COLUMNS = ['metric_name', 'value', 'timestamp', 'unit', 'display_name']
+
+def max_staleness():
+    return timedelta(seconds=int(os.getenv('METRICS_CACHE_MAX_STALENESS_SECONDS', DEFAULT_MAX_STALENESS_SECONDS)))
+
+def metric_row_key(provider, resource_id, *parts):
+    """RowKey of a stored datapoint; Table keys may not contain / \\ # or ?, and : and . are replaced too."""
+    row_key = '_'.join((provider, resource_id) + parts)
+    for ch in '/\\#?:.':
+        row_key = row_key.replace(ch, '_')
+    return row_key
+
+def _row_key_prefix(provider, resource_id):
+    """RowKey prefix refresh_metrics uses for every datapoint of a resource."""
+    return metric_row_key(provider, resource_id, '')
+
+def _stored_series_query(customer_id, provider, resource_id, start_time, end_time):
+    prefix = _row_key_prefix(provider, resource_id)
+    query = (
+        "PartitionKey eq @customer_id and RowKey ge @lower and RowKey lt @upper"
+        " and resource_id eq @resource_id and statistic eq @statistic and timestamp ge @start"
+    )
+    parameters = {
+        'customer_id': customer_id,
+        'lower': prefix,
+        'upper': prefix[:-1] + chr(ord(prefix[-1]) + 1),
+        'resource_id': resource_id,
+        'statistic': 'Average',
+        # Stored timestamps are isoformat() strings, which sort chronologically
+        'start': start_time.isoformat()
+    }
+    if end_time:
+        query += " and timestamp lt @end"
+        parameters['end'] = end_time.isoformat()
+    return query, parameters
+
+def _add_row(series, row):
+    entry = series.setdefault(row['metric_name'], {
+        "unit": row.get('unit'),
+        "display_name": row.get('display_name'),
+        "data": []
+    })
+    entry["data"].append({"timestamp": datetime.fromisoformat(row['timestamp']), "value": row['value']})
+
+def _sorted(series):
+    for entry in series.values():
+        entry["data"].sort(key=lambda p: p["timestamp"])
+    return series
+
+def load_stored_series(metrics_client, customer_id, provider, resource_id, start_time, end_time=None):
+    """
+    Read the stored Average datapoints of one resource since start_time (and before end_time).
+    Returns {metric_name: {"unit", "display_name", "data": [...]}} with points
+    sorted by timestamp. A RowKey range keeps this to one slice of the partition.
+    """
+    query, parameters = _stored_series_query(customer_id, provider, resource_id, start_time, end_time)
+    series = {}
+    try:
+        rows = metrics_client.query_entities(query, parameters=parameters, select=STORED_COLUMNS)
+        for row in rows:
+            _add_row(series, row)
+    except ResourceNotFoundError:
+        logger.info(f"{METRICS_TABLE} table not found, serving {resource_id} live.")
+        return {}
+    return _sorted(series)
+
+async def load_stored_series_async(metrics_client, customer_id, provider, resource_id, start_time, end_time=None):
+    """load_stored_series for azure.data.tables.aio clients."""
+    query, parameters = _stored_series_query(customer_id, provider, resource_id, start_time, end_time)
+    series = {}
+    try:
+        async for row in metrics_client.query_entities(query, parameters=parameters, select=STORED_COLUMNS):
+            _add_row(series, row)
+    except ResourceNotFoundError:
+        logger.info(f"{METRICS_TABLE} table not found, serving {resource_id} live.")
+        return {}
+    return _sorted(series)
+
+def plan_live_fetch(metric_names, stored, window_start, now, staleness=None):
+    """
+    Decide, per metric, what must come from the provider: nothing when the
+    newest stored point is within the staleness bound, only the gap since that
+    point when it is older, or the whole window when nothing is stored.
+    Returns {metric_name: live_start_time} for the metrics that need a live call.
+    """
+    staleness = staleness if staleness is not None else max_staleness()
+    plan = {}
+    for name in metric_names:
+        data = stored.get(name, {}).get("data")
+        if not data:
+            plan[name] = window_start
+        elif now - data[-1]["timestamp"] > staleness:
+            plan[name] = data[-1]["timestamp"]
+    return plan
+
+def merge_series(metric_names, stored, live, plan, unit_for):
+    """
+    Combine stored and live series in metric_names order, tagging each with the
+    source that served it ('cache', 'live' or 'cache+live'). live maps metric
+    name to a series as returned by the provider fetchers.
+    """
+    metrics = []
+    for name in metric_names:
+        cached = stored.get(name)
+        fetched = live.get(name)
+        data = list(cached["data"]) if cached else []
+        if fetched and fetched["data"]:
+            newest = data[-1]["timestamp"] if data else None
+            data.extend(sorted(
+                (p for p in fetched["data"] if newest is None or p["timestamp"] > newest),
+                key=lambda p: p["timestamp"]
+            ))
+
+        if not data:
+            continue
+        if name not in plan:
+            source = "cache"
+        elif cached and fetched and len(data) > len(cached["data"]):
+            source = "cache+live"
+        elif cached:
+            source = "cache"
+        else:
+            source = "live"
+
+        metrics.append({
+            "name": fetched["name"] if fetched else (cached.get("display_name") or name),
+            "unit": fetched["unit"] if fetched else (cached.get("unit") or unit_for(name)),
+            "data": data,
+            "source": source
+        })
+    return metrics
@@ -0,0 +1,84 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from azure.data.tables import UpdateMode
+from azure.core.exceptions import ResourceNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Inventory statuses (lowercased, Azure's "VM " prefix dropped) that produce no metrics
+IDLE_STATUSES = {'stopped', 'stopping', 'deallocated', 'deallocating', 'off', 'archive'}
+GONE_STATUSES = {'terminated', 'shutting-down', 'deleted', 'deleting'}
+
+# Idle resources are still polled this often, in case something reports while stopped
+DEFAULT_IDLE_INTERVAL_SECONDS = 6 * 3600
+
+def idle_interval():
+    """0 (METRICS_IDLE_INTERVAL_SECONDS=0) skips idle resources entirely."""
+    return timedelta(seconds=int(os.getenv('METRICS_IDLE_INTERVAL_SECONDS', DEFAULT_IDLE_INTERVAL_SECONDS)))
+
+def normalize_status(status):
+    status = str(status or 'unknown').strip().lower()
+    return status[3:] if status.startswith('vm ') else status
+
+def plan_collection(resource, now=None):
+    """
+    Decide whether refresh_metrics should collect a resource this run; returns
+    (collect, reason). Resources in an unrecognised state are treated as active.
+    Whenever the status differs from the one recorded at the last collection,
+    one more collection runs, capturing the tail before a stop and resuming
+    collection right after a start.
+    """
+    now = now or datetime.now(timezone.utc)
+    status = normalize_status(resource.get('status'))
+    if status not in IDLE_STATUSES and status not in GONE_STATUSES:
+        return True, 'active'
+
+    last_status = resource.get('metrics_collected_status')
+    if last_status is None or normalize_status(last_status) != status:
+        return True, 'state-change'
+    if status in GONE_STATUSES:
+        return False, 'gone'
+
+    interval = idle_interval()
+    last_at = resource.get('metrics_collected_at')
+    if interval and (not last_at or now - datetime.fromisoformat(last_at) >= interval):
+        return True, 'idle-poll'
+    return False, 'idle'
+
+def _collection_update(resource, reason, now=None):
+    """The MERGE entity that records this collection, or None when there is nothing new to remember."""
+    if reason == 'active' and resource.get('metrics_collected_status') == resource.get('status'):
+        return None  # Saves a write per running resource per run
+    now = now or datetime.now(timezone.utc)
+    return {
+        "PartitionKey": resource['PartitionKey'],
+        "RowKey": resource['RowKey'],
+        "metrics_collected_status": resource.get('status') or 'unknown',
+        "metrics_collected_at": now.isoformat()
+    }
+
+def record_collection(resources_client, resource, reason, now=None):
+    """Remember the status and time of this collection on the inventory row (MERGE keeps the rest)."""
+    entity = _collection_update(resource, reason, now)
+    if entity is None:
+        return
+    try:
+        resources_client.update_entity(entity=entity, mode=UpdateMode.MERGE)
+    except ResourceNotFoundError:
+        pass  # Removed from the inventory since it was read
+
+async def record_collection_async(resources_client, resource, reason, now=None):
+    """record_collection for azure.data.tables.aio clients."""
+    entity = _collection_update(resource, reason, now)
+    if entity is None:
+        return
+    try:
+        await resources_client.update_entity(entity=entity, mode=UpdateMode.MERGE)
+    except ResourceNotFoundError:
+        pass  # Removed from the inventory since it was read
+
+def log_schedule(provider, customer_id, reasons):
+    """reasons counts plan_collection reasons; 'idle', 'gone' and 'circuit_open' are the skipped resources."""
+    skipped = reasons['idle'] + reasons['gone'] + reasons['circuit_open']
+    logger.info(f"Skipped metrics for {skipped} of {sum(reasons.values())} {provider} resources of customer {customer_id}: {dict(reasons)}")
@@ -0,0 +1,97 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+# Time range shown on the details page when the caller does not pass one
+DEFAULT_RANGE = timedelta(hours=3)
+
+DEFAULT_MAX_POINTS = 300
+# GetMetricStatistics returns at most 1440 datapoints per call
+MAX_POINTS_LIMIT = 1440
+
+# Periods (seconds) each provider aggregates to; 5 minutes is the basic-monitoring resolution
+GRANULARITIES = {
+    'aws': (300, 900, 1800, 3600, 21600, 86400),
+    'azure': (300, 900, 1800, 3600, 21600, 43200, 86400)
+}
+
+AZURE_INTERVALS = {
+    300: 'PT5M', 900: 'PT15M', 1800: 'PT30M', 3600: 'PT1H',
+    21600: 'PT6H', 43200: 'PT12H', 86400: 'P1D'
+}
+
+# How far back each provider keeps data
+MAX_LOOKBACK = {
+    'aws': timedelta(days=455),
+    'azure': timedelta(days=93)
+}
+
+# CloudWatch keeps 5-minute data for 63 days, then only hourly aggregates
+AWS_FIVE_MINUTE_RETENTION = timedelta(days=63)
+
+MetricWindow = namedtuple('MetricWindow', ['start', 'end', 'period'])
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp into an aware UTC datetime; raises ValueError."""
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def _align(moment, period, up=False):
+    seconds = int(moment.timestamp())
+    aligned = seconds - seconds % period
+    if up and aligned < moment.timestamp():
+        aligned += period
+    return datetime.fromtimestamp(aligned, tz=timezone.utc)
+
+def resolve_window(provider, start=None, end=None, max_points=None, now=None):
+    """
+    Pick the finest period the provider supports that keeps [start, end) within
+    max_points, with both edges aligned to that period. Aligned windows make
+    requests issued within the same period identical, so they share cache and
+    single-flight keys. Raises ValueError for ranges that cannot be served.
+    """
+    now = now or datetime.now(timezone.utc)
+    end = min(end or now, now)
+    start = start or end - DEFAULT_RANGE
+    max_points = DEFAULT_MAX_POINTS if max_points is None else max_points
+
+    if start >= end:
+        raise ValueError("start must be before end")
+    if not 1 <= max_points <= MAX_POINTS_LIMIT:
+        raise ValueError(f"max_points must be between 1 and {MAX_POINTS_LIMIT}")
+    if now - start > MAX_LOOKBACK[provider]:
+        raise ValueError(f"{provider} keeps metrics for {MAX_LOOKBACK[provider].days} days")
+
+    minimum = 3600 if provider == 'aws' and now - start > AWS_FIVE_MINUTE_RETENTION else 0
+    for period in GRANULARITIES[provider]:
+        if period < minimum:
+            continue
+        aligned_start = _align(start, period)
+        aligned_end = _align(end, period, up=True)
+        if (aligned_end - aligned_start).total_seconds() / period <= max_points:
+            return MetricWindow(aligned_start, aligned_end, period)
+    raise ValueError(f"Range too long for max_points={max_points}; widen max_points or narrow the range")
+
+def window_from_params(provider, params):
+    """resolve_window from 'start', 'end' and 'max_points' request values; raises ValueError."""
+    start = params.get('start')
+    end = params.get('end')
+    max_points = params.get('max_points')
+    try:
+        return resolve_window(
+            provider,
+            start=parse_timestamp(start) if start else None,
+            end=parse_timestamp(end) if end else None,
+            max_points=int(max_points) if max_points is not None and max_points != '' else None
+        )
+    except (TypeError, AttributeError):
+        raise ValueError("start and end must be ISO 8601 timestamps and max_points an integer")
+
+def azure_interval(period):
+    return AZURE_INTERVALS[period]
+
+def window_json(window):
+    return {"start": window.start, "end": window.end, "period": window.period}
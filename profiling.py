@@ -0,0 +1,179 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from azure.data.tables import TableServiceClient
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+
+logger = logging.getLogger(__name__)
+
+PROFILES_TABLE = 'Profiles'
+
+DEFAULT_INTERVAL_MS = 5
+TOP_FUNCTIONS = 20
+# Table Storage string properties hold 32K characters; rarer stacks are dropped beyond that
+MAX_COLLAPSED_CHARS = 32000
+
+# Innermost frames of threads that are waiting for work rather than doing it
+IDLE_LEAVES = {('thread.py', '_worker'), ('selectors.py', 'select')}
+
+def allowed_customers():
+    """Customers that may be profiled (PROFILING_ALLOWED_CUSTOMERS, comma separated); empty disables profiling."""
+    return {c.strip() for c in os.getenv('PROFILING_ALLOWED_CUSTOMERS', '').split(',') if c.strip()}
+
+def wants_profile(req):
+    flag = req.params.get('profile') or req.headers.get('X-Profile') or ''
+    return flag.lower() in ('1', 'true')
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread in the worker at a fixed interval,
+    so time spent in SDK calls on pool threads is seen as well as the handler's.
+    Idle pool and event-loop threads are left out. Invocations running on the
+    same worker at the same time appear in each other's profiles.
+    """
+
+    def __init__(self, interval_ms=DEFAULT_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks = Counter()  # (outermost, ..., innermost) labels -> samples
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if tuple(stack[0].split(':', 1)) not in IDLE_LEAVES:
+                    self.stacks[tuple(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def collapsed(self, max_chars=MAX_COLLAPSED_CHARS):
+        """Folded stacks ('a;b;c 12' per line), as flamegraph.pl and speedscope read them; most sampled first."""
+        lines = []
+        size = 0
+        for stack, count in self.stacks.most_common():
+            line = f"{';'.join(stack)} {count}"
+            size += len(line) + 1
+            if size > max_chars:
+                break
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        """Functions by samples spent in them (self) and under them (total), by self first."""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        return [
+            {"function": label, "self": own[label], "total": total[label]}
+            for label, _ in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:limit]
+        ]
+
+def store_profile(name, customer_id, profiler):
+    """Save a profile to the Profiles table; returns its id (function/RowKey)."""
+    table_service_client = TableServiceClient.from_connection_string(conn_str=os.environ["AzureWebJobsStorage"])
+    table_client = table_service_client.get_table_client(table_name=PROFILES_TABLE)
+    now = datetime.now(timezone.utc)
+    entity = {
+        "PartitionKey": name,
+        "RowKey": f"{now.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        "customer_id": customer_id,
+        "created_at": now.isoformat(),
+        "duration_ms": round(profiler.duration * 1000, 1),
+        "interval_ms": profiler.interval * 1000,
+        "samples": profiler.samples,
+        "top_functions": json.dumps(profiler.top_functions()),
+        "collapsed": profiler.collapsed()
+    }
+    try:
+        table_client.create_entity(entity=entity)
+    except ResourceNotFoundError:
+        try:
+            table_client.create_table()
+        except ResourceExistsError:
+            pass  # Another profiled request created it first
+        table_client.create_entity(entity=entity)
+    return f"{name}/{entity['RowKey']}"
+
+def profiled(name):
+    """
+    Decorate a function's main so a request with ?profile=1 or an X-Profile: 1
+    header runs under the sampling profiler, if its customer_id is on the
+    PROFILING_ALLOWED_CUSTOMERS allow-list. The profile is stored in the Profiles
+    table, its id returned in the X-Profile-Id response header and its hottest
+    functions logged. Any other request runs the handler untouched.
+    """
+    def decorate(fn):
+        def should_profile(req):
+            if not wants_profile(req):
+                return False
+            if req.params.get('customer_id') not in allowed_customers():
+                logger.warning(f"Profiling requested for {name} by customer {req.params.get('customer_id')}, who is not on the allow-list.")
+                return False
+            return True
+
+        def finish(req, response, profiler):
+            customer_id = req.params.get('customer_id')
+            logger.info(f"Profile of {name} for customer {customer_id}: {profiler.samples} samples over "
+                        f"{profiler.duration:.2f}s, top functions: {json.dumps(profiler.top_functions(10))}")
+            try:
+                response.headers['X-Profile-Id'] = store_profile(name, customer_id, profiler)
+            except Exception as e:
+                logger.error(f"Failed to store profile of {name}: {e}")
+            return response
+
+        def interval_ms():
+            return float(os.getenv('PROFILING_INTERVAL_MS', DEFAULT_INTERVAL_MS))
+
+        if inspect.iscoroutinefunction(fn):
+            # Requests sharing the event loop show up in the profile too
+            @functools.wraps(fn)
+            async def async_wrapper(req, *args, **kwargs):
+                if not should_profile(req):
+                    return await fn(req, *args, **kwargs)
+                with SamplingProfiler(interval_ms()) as profiler:
+                    response = await fn(req, *args, **kwargs)
+                return await asyncio.to_thread(finish, req, response, profiler)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(req, *args, **kwargs):
+            if not should_profile(req):
+                return fn(req, *args, **kwargs)
+            with SamplingProfiler(interval_ms()) as profiler:
+                response = fn(req, *args, **kwargs)
+            return finish(req, response, profiler)
+        return wrapper
+    return decorate
@@ -0,0 +1,478 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from azure.identity import ClientSecretCredential
+from azure.identity.aio import ClientSecretCredential as AsyncClientSecretCredential
+from azure.mgmt.monitor import MonitorManagementClient
+from azure.mgmt.monitor.aio import MonitorManagementClient as AsyncMonitorManagementClient
+from azure.core.exceptions import ResourceNotFoundError
+from botocore.exceptions import ClientError
+from instrumentation import azure_client_options, bind
+from metric_cache import STORED_PERIOD_SECONDS, load_stored_series, load_stored_series_async, merge_series, plan_live_fetch
+from metric_windows import azure_interval, resolve_window
+from rate_limit import AWS_CLIENT_CONFIG, AZURE_CLIENT_OPTIONS, aws_key, azure_key, limited_call, limited_call_async
+
+# Series refresh_metrics stores and the detail lookups serve
+LIGHTSAIL_METRICS = ['CPUUtilization', 'NetworkIn', 'NetworkOut', 'StatusCheckFailed']
+EC2_METRICS = ['CPUUtilization', 'NetworkIn', 'NetworkOut', 'DiskReadBytes', 'DiskWriteBytes']
+
+# Per-metric provider calls of one detail lookup run this many at a time
+METRIC_FETCH_WORKERS = 5
+DEFAULT_FETCH_DEADLINE_SECONDS = 10
+
+# GetMetricData accepts at most 500 queries per call
+MAX_METRIC_DATA_QUERIES = 500
+
+def metric_fetch_deadline():
+    return float(os.getenv('DETAILS_FETCH_DEADLINE_SECONDS', DEFAULT_FETCH_DEADLINE_SECONDS))
+
+def lightsail_unit(metric_name):
+    return 'Percent' if 'CPU' in metric_name else 'Bytes' if 'Network' in metric_name else 'Count'
+
+def ec2_unit(metric_name):
+    return 'Percent' if 'CPU' in metric_name else 'Bytes'
+
+def azure_metric_names(resource_id):
+    """Determine metric names based on resource type."""
+    if "virtualMachines" in resource_id:
+        return ['Percentage CPU', 'Network In', 'Network Out', 'Disk Read Bytes', 'Disk Write Bytes']
+    elif "storageAccounts" in resource_id:
+        return ['UsedCapacity', 'Transactions']
+    elif "databases" in resource_id:
+        return ['cpu_percent', 'connection_successful']
+    return ['Percentage CPU']
+
+def is_lightsail_resource(resource_id):
+    return resource_id.startswith('ls-') or 'lightsail' in resource_id.lower()
+
+def lightsail_inventory_key(resource_id):
+    """AwsResources RowKey of a Lightsail instance, as refresh_aws_resources writes it."""
+    return resource_id.replace(':', '_').replace('/', '_')
+
+def _missing_lightsail_instance(customer_id, resource_id):
+    logging.warning(f"Lightsail instance {resource_id} is not in the inventory of customer {customer_id}, serving stored metrics only.")
+
+def lightsail_instance_name(resources_client, customer_id, resource_id):
+    """
+    Lightsail calls take the instance name, while instances are identified by
+    their ARN, the inventory id refresh_metrics stores their metrics under. An
+    ARN is resolved through the customer's AwsResources row; anything else is
+    taken to be a name already. None when the inventory doesn't hold the ARN.
+    """
+    if not resource_id.startswith('arn:'):
+        return resource_id
+    try:
+        return resources_client.get_entity(partition_key=customer_id, row_key=lightsail_inventory_key(resource_id)).get('name')
+    except ResourceNotFoundError:
+        _missing_lightsail_instance(customer_id, resource_id)
+        return None
+
+async def lightsail_instance_name_async(resources_client, customer_id, resource_id):
+    """lightsail_instance_name for azure.data.tables.aio clients."""
+    if not resource_id.startswith('arn:'):
+        return resource_id
+    try:
+        entity = await resources_client.get_entity(partition_key=customer_id, row_key=lightsail_inventory_key(resource_id))
+        return entity.get('name')
+    except ResourceNotFoundError:
+        _missing_lightsail_instance(customer_id, resource_id)
+        return None
+
+def fetch_concurrently(metric_names, fetch_metric, deadline=None):
+    """
+    Run fetch_metric(name) for every metric on a bounded pool and return the
+    series that arrived within the deadline, in metric_names order. Calls still
+    running at the deadline are abandoned; their metrics are left out.
+    """
+    deadline = metric_fetch_deadline() if deadline is None else deadline
+    if not metric_names:
+        return []
+    
+    executor = ThreadPoolExecutor(max_workers=min(len(metric_names), METRIC_FETCH_WORKERS))
+    futures = {executor.submit(bind(fetch_metric), name): name for name in metric_names}
+    done, pending = wait(futures, timeout=deadline)
+    # Don't hold the response for stragglers; their threads finish in the background
+    executor.shutdown(wait=False)
+    if pending:
+        logging.warning(f"Metric fetch deadline of {deadline}s passed, returning without: {sorted(futures[f] for f in pending)}")
+    
+    arrived = {futures[future]: future.result() for future in done}
+    return [arrived[name] for name in metric_names if arrived.get(name)]
+
+def fetch_lightsail_metric(lightsail_client, instance_name, metric_name, start_times, window):
+    """One Lightsail metric series, or None when it has no data or could not be fetched."""
+    try:
+        result = limited_call(
+            aws_key(lightsail_client), lightsail_client.get_instance_metric_data,
+            deadline=metric_fetch_deadline(),
+            instanceName=instance_name,
+            metricName=metric_name,
+            period=window.period,
+            startTime=(start_times or {}).get(metric_name, window.start),
+            endTime=window.end,
+            unit=lightsail_unit(metric_name),
+            statistics=['Average']
+        )
+        
+        metric_data = {
+            "name": result['metricName'],
+            "unit": result['unit'],
+            "data": [
+                {
+                    "timestamp": p['timestamp'],
+                    "value": p.get('average') or p.get('sum') or p.get('maximum') or 0
+                }
+                for p in result['metricData']
+                if p.get('average') is not None or p.get('sum') is not None or p.get('maximum') is not None
+            ]
+        }
+        
+        if metric_data["data"]:  # Only add if we have data
+            return metric_data
+            
+    except ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+        logging.warning(f"AWS error fetching metric '{metric_name}' for instance '{instance_name}': {error_code} - {e}")
+    except Exception as e:
+        logging.warning(f"Could not fetch metric '{metric_name}' for instance '{instance_name}': {e}")
+    return None
+
+def get_lightsail_metrics(lightsail_client, instance_name, metric_names=LIGHTSAIL_METRICS, start_times=None, window=None):
+    """Fetches key metrics for a given Lightsail instance concurrently, optionally from a per-metric start time."""
+    window = window or resolve_window('aws')
+    return fetch_concurrently(
+        list(metric_names),
+        lambda metric_name: fetch_lightsail_metric(lightsail_client, instance_name, metric_name, start_times, window)
+    )
+
+def fetch_ec2_metric(cloudwatch_client, instance_id, metric_name, start_times, window):
+    """One EC2 metric series, or None when it has no data or could not be fetched."""
+    try:
+        result = limited_call(
+            aws_key(cloudwatch_client), cloudwatch_client.get_metric_statistics,
+            deadline=metric_fetch_deadline(),
+            Namespace='AWS/EC2',
+            MetricName=metric_name,
+            Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
+            StartTime=(start_times or {}).get(metric_name, window.start),
+            EndTime=window.end,
+            Period=window.period,
+            Statistics=['Average']
+        )
+        
+        metric_data = {
+            "name": metric_name,
+            "unit": ec2_unit(metric_name),
+            "data": [
+                {"timestamp": dp['Timestamp'], "value": dp['Average']}
+                for dp in sorted(result['Datapoints'], key=lambda x: x['Timestamp']) 
+                if 'Average' in dp
+            ]
+        }
+        
+        if metric_data["data"]:  # Only add if we have data
+            return metric_data
+            
+    except ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', 'Unknown')
+        logging.warning(f"AWS error fetching EC2 metric '{metric_name}' for instance '{instance_id}': {error_code} - {e}")
+    except Exception as e:
+        logging.warning(f"Could not fetch EC2 metric '{metric_name}' for instance '{instance_id}': {e}")
+    return None
+
+def get_ec2_metrics_batch(cloudwatch_client, plans, window=None):
+    """
+    Fetches EC2 metrics for many instances with GetMetricData, up to 500 series per call.
+    plans maps instance_id -> {metric_name: start_time}; each call starts at the
+    earliest of them and merge_series drops points that are already stored.
+    Returns {instance_id: [series]}. Errors propagate to the caller.
+    """
+    window = window or resolve_window('aws')
+    queries = []
+    lookup = {}  # query Id -> (instance_id, metric_name, start_time)
+    for instance_id, plan in plans.items():
+        for metric_name, start_time in plan.items():
+            query_id = f"m{len(queries)}"
+            lookup[query_id] = (instance_id, metric_name, start_time)
+            queries.append({
+                'Id': query_id,
+                'MetricStat': {
+                    'Metric': {
+                        'Namespace': 'AWS/EC2',
+                        'MetricName': metric_name,
+                        'Dimensions': [{'Name': 'InstanceId', 'Value': instance_id}]
+                    },
+                    'Period': window.period,
+                    'Stat': 'Average'
+                },
+                'ReturnData': True
+            })
+    
+    series = defaultdict(dict)  # instance_id -> metric_name -> series
+    for start in range(0, len(queries), MAX_METRIC_DATA_QUERIES):
+        chunk = queries[start:start + MAX_METRIC_DATA_QUERIES]
+        request = {
+            'MetricDataQueries': chunk,
+            'StartTime': min(lookup[query['Id']][2] for query in chunk),
+            'EndTime': window.end,
+            'ScanBy': 'TimestampAscending'
+        }
+        while True:
+            response = limited_call(aws_key(cloudwatch_client), cloudwatch_client.get_metric_data, **request)
+            for result in response['MetricDataResults']:
+                instance_id, metric_name, _ = lookup[result['Id']]
+                entry = series[instance_id].setdefault(metric_name, {
+                    "name": metric_name,
+                    "unit": ec2_unit(metric_name),
+                    "data": []
+                })
+                entry["data"].extend(
+                    {"timestamp": ts, "value": value}
+                    for ts, value in zip(result['Timestamps'], result['Values'])
+                )
+            if not response.get('NextToken'):
+                break
+            request['NextToken'] = response['NextToken']
+    
+    return {
+        instance_id: [entry for entry in by_metric.values() if entry["data"]]
+        for instance_id, by_metric in series.items()
+    }
+
+def fetch_azure_metrics(monitor_client, resource_id, metric_names=None, start_time=None, window=None):
+    """
+    Fetches key metrics for a given Azure resource, optionally only since start_time.
+    Each series carries the requested metric name as "metric_id", since "name" is localized.
+    Errors propagate to the caller.
+    """
+    window = window or resolve_window('azure')
+    timespan = f"{(start_time or window.start).isoformat()}/{window.end.isoformat()}"
+    
+    metrics_data = limited_call(
+        azure_key(resource_id), monitor_client.metrics.list,
+        resource_id,
+        timespan=timespan,
+        interval=azure_interval(window.period),
+        metricnames=",".join(metric_names or azure_metric_names(resource_id)),
+        aggregation="Average"
+    )
+    return azure_series(metrics_data)
+
+def azure_series(metrics_data):
+    """Series with data from an Azure Monitor metrics.list response, points sorted by timestamp."""
+    metrics = []
+    for item in metrics_data.value:
+        metric_data = {
+            "name": item.name.localized_value or item.name.value,
+            "metric_id": item.name.value,
+            "unit": str(item.unit),
+            "data": []
+        }
+        
+        for timeseries in item.timeseries:
+            for data in timeseries.data:
+                if data.average is not None:
+                    metric_data["data"].append({
+                        "timestamp": data.time_stamp,
+                        "value": data.average
+                    })
+        
+        # Sort by timestamp
+        metric_data["data"].sort(key=lambda x: x["timestamp"])
+        
+        if metric_data["data"]:  # Only add if we have data
+            metrics.append(metric_data)
+    
+    return metrics
+
+def azure_monitor_client(credential_entity):
+    credential = ClientSecretCredential(
+        tenant_id=credential_entity.get("tenant_id"),
+        client_id=credential_entity.get("client_id"),
+        client_secret=credential_entity.get("client_secret")
+    )
+    return MonitorManagementClient(credential, credential_entity.get("subscription_id"), **azure_client_options('monitor'), **AZURE_CLIENT_OPTIONS)
+
+@asynccontextmanager
+async def azure_monitor_client_async(credential_entity):
+    """An aio Monitor client and its credential, both closed on exit."""
+    credential = AsyncClientSecretCredential(
+        tenant_id=credential_entity.get("tenant_id"),
+        client_id=credential_entity.get("client_id"),
+        client_secret=credential_entity.get("client_secret")
+    )
+    async with credential, AsyncMonitorManagementClient(
+        credential, credential_entity.get("subscription_id"), **azure_client_options('monitor'), **AZURE_CLIENT_OPTIONS
+    ) as monitor_client:
+        yield monitor_client
+
+def stored_and_plan(metrics_client, customer_id, provider, resource_id, metric_names, window):
+    """Stored series for the window and the live fetch plan that completes them."""
+    if window.period != STORED_PERIOD_SECONDS:
+        # Only 5-minute averages are stored; coarser windows come straight from the provider
+        return {}, {name: window.start for name in metric_names}
+    stored = load_stored_series(metrics_client, customer_id, provider, resource_id, window.start, window.end)
+    now = min(window.end, datetime.now(timezone.utc))
+    return stored, plan_live_fetch(metric_names, stored, window.start, now)
+
+async def fetch_concurrently_async(metric_names, fetch_metric, deadline=None):
+    """
+    fetch_concurrently for the async handlers. boto3 has no async client, so
+    each blocking fetch runs on the event loop's default executor, a fixed pool
+    shared by every request, and the handler awaits them without holding a thread.
+    """
+    deadline = metric_fetch_deadline() if deadline is None else deadline
+    if not metric_names:
+        return []
+    
+    tasks = {asyncio.ensure_future(asyncio.to_thread(fetch_metric, name)): name for name in metric_names}
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()  # Stops waiting; the executor thread finishes in the background
+    if pending:
+        logging.warning(f"Metric fetch deadline of {deadline}s passed, returning without: {sorted(tasks[t] for t in pending)}")
+    
+    arrived = {tasks[task]: task.result() for task in done}
+    return [arrived[name] for name in metric_names if arrived.get(name)]
+
+async def fetch_azure_metrics_async(monitor_client, resource_id, metric_names=None, start_time=None, window=None):
+    """fetch_azure_metrics for aio Monitor clients."""
+    window = window or resolve_window('azure')
+    timespan = f"{(start_time or window.start).isoformat()}/{window.end.isoformat()}"
+    
+    metrics_data = await limited_call_async(
+        azure_key(resource_id), monitor_client.metrics.list,
+        resource_id,
+        timespan=timespan,
+        interval=azure_interval(window.period),
+        metricnames=",".join(metric_names or azure_metric_names(resource_id)),
+        aggregation="Average"
+    )
+    return azure_series(metrics_data)
+
+async def stored_and_plan_async(metrics_client, customer_id, provider, resource_id, metric_names, window):
+    """stored_and_plan for azure.data.tables.aio clients."""
+    if window.period != STORED_PERIOD_SECONDS:
+        return {}, {name: window.start for name in metric_names}
+    stored = await load_stored_series_async(metrics_client, customer_id, provider, resource_id, window.start, window.end)
+    now = min(window.end, datetime.now(timezone.utc))
+    return stored, plan_live_fetch(metric_names, stored, window.start, now)
+
+async def collect_aws_metrics_async(metrics_client, resources_client, customer_id, resource_id, region, session, window):
+    """
+    Serve what refresh_metrics already stored and fetch only the rest off the
+    loop; returns (resource_type, metrics). resources_client reads AwsResources,
+    where Lightsail ARNs are resolved to instance names.
+    """
+    is_lightsail = is_lightsail_resource(resource_id)
+    metric_names = LIGHTSAIL_METRICS if is_lightsail else EC2_METRICS
+    stored, plan = await stored_and_plan_async(metrics_client, customer_id, 'aws', resource_id, metric_names, window)
+    
+    live = []
+    if plan and is_lightsail:
+        instance_name = await lightsail_instance_name_async(resources_client, customer_id, resource_id)
+        if instance_name:
+            # Building a boto3 client loads its service model from disk, so that happens off the loop too
+            lightsail_client = await asyncio.to_thread(session.client, 'lightsail', region_name=region, config=AWS_CLIENT_CONFIG)
+            live = await fetch_concurrently_async(
+                list(plan), lambda metric_name: fetch_lightsail_metric(lightsail_client, instance_name, metric_name, plan, window)
+            )
+    elif plan:
+        cloudwatch_client = await asyncio.to_thread(session.client, 'cloudwatch', region_name=region, config=AWS_CLIENT_CONFIG)
+        live = await fetch_concurrently_async(
+            list(plan), lambda metric_name: fetch_ec2_metric(cloudwatch_client, resource_id, metric_name, plan, window)
+        )
+    
+    metrics = merge_series(
+        metric_names, stored, {m["name"]: m for m in live}, plan,
+        lightsail_unit if is_lightsail else ec2_unit
+    )
+    return ('lightsail' if is_lightsail else 'ec2'), metrics
+
+async def collect_azure_metrics_async(metrics_client, customer_id, resource_id, credential_entity, window):
+    """Serve what refresh_metrics already stored and fetch only the rest from Azure Monitor, with aio clients."""
+    metric_names = azure_metric_names(resource_id)
+    stored, plan = await stored_and_plan_async(metrics_client, customer_id, 'azure', resource_id, metric_names, window)
+    
+    live = []
+    if plan:
+        try:
+            async with azure_monitor_client_async(credential_entity) as monitor_client:
+                live = await fetch_azure_metrics_async(monitor_client, resource_id, list(plan), min(plan.values()), window)
+        except Exception as e:
+            logging.error(f"Error fetching Azure metrics for {resource_id}: {e}")
+    
+    return merge_series(metric_names, stored, {m["metric_id"]: m for m in live}, plan, lambda name: None)
+
+def collect_aws_metrics_bulk(metrics_client, resources_client, customer_id, resource_ids, region, session, window):
+    """
+    Details for many AWS resources in one region. EC2 gaps are filled with
+    batched GetMetricData calls; Lightsail has no batch API, so its instances
+    share one client. Returns {resource_id: (resource_type, metrics) or the exception}.
+    """
+    results, stored, plans = {}, {}, {}
+    for resource_id in resource_ids:
+        metric_names = LIGHTSAIL_METRICS if is_lightsail_resource(resource_id) else EC2_METRICS
+        try:
+            stored[resource_id], plans[resource_id] = stored_and_plan(
+                metrics_client, customer_id, 'aws', resource_id, metric_names, window
+            )
+        except Exception as e:
+            results[resource_id] = e
+    
+    live = {}
+    ec2_plans = {rid: plan for rid, plan in plans.items() if plan and not is_lightsail_resource(rid)}
+    if ec2_plans:
+        try:
+            cloudwatch_client = session.client('cloudwatch', region_name=region, config=AWS_CLIENT_CONFIG)
+            live.update(get_ec2_metrics_batch(cloudwatch_client, ec2_plans, window))
+        except Exception as e:
+            logging.warning(f"GetMetricData failed for {len(ec2_plans)} EC2 instances in {region}: {e}")
+            results.update((rid, e) for rid in ec2_plans)
+    
+    lightsail_plans = {rid: plan for rid, plan in plans.items() if plan and is_lightsail_resource(rid)}
+    if lightsail_plans:
+        lightsail_client = session.client('lightsail', region_name=region, config=AWS_CLIENT_CONFIG)
+        for resource_id, plan in lightsail_plans.items():
+            instance_name = lightsail_instance_name(resources_client, customer_id, resource_id)
+            if instance_name:
+                live[resource_id] = get_lightsail_metrics(lightsail_client, instance_name, list(plan), plan, window)
+    
+    for resource_id, plan in plans.items():
+        if resource_id in results:
+            continue
+        is_lightsail = is_lightsail_resource(resource_id)
+        metrics = merge_series(
+            LIGHTSAIL_METRICS if is_lightsail else EC2_METRICS, stored[resource_id],
+            {m["name"]: m for m in live.get(resource_id, [])}, plan,
+            lightsail_unit if is_lightsail else ec2_unit
+        )
+        results[resource_id] = ('lightsail' if is_lightsail else 'ec2', metrics)
+    return results
+
+def collect_azure_metrics_bulk(metrics_client, customer_id, resource_ids, credential_entity, window):
+    """
+    Details for many Azure resources through one shared Monitor client, one
+    metrics.list call per resource that has gaps. Returns {resource_id: metrics or the exception}.
+    """
+    results = {}
+    monitor_client = None
+    for resource_id in resource_ids:
+        try:
+            metric_names = azure_metric_names(resource_id)
+            stored, plan = stored_and_plan(metrics_client, customer_id, 'azure', resource_id, metric_names, window)
+            live = []
+            if plan:
+                monitor_client = monitor_client or azure_monitor_client(credential_entity)
+                live = fetch_azure_metrics(monitor_client, resource_id, list(plan), min(plan.values()), window)
+            results[resource_id] = merge_series(
+                metric_names, stored, {m["metric_id"]: m for m in live}, plan, lambda name: None
+            )
+        except Exception as e:
+            logging.warning(f"Could not fetch Azure metrics for {resource_id}: {e}")
+            results[resource_id] = e
+    return results
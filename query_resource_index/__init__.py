@@ -0,0 +1,51 @@
+import logging
+import os
+import azure.functions as func
+from azure.data.tables import TableServiceClient
+from http_responses import listing_response
+from resource_index import query_index
+from resource_listing import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from instrumentation import azure_client_options, instrumented
+from table_schema import ensure_tables
+
+@instrumented('query_resource_index')
+def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info('Python HTTP trigger function processed a request to query the resource index.')
+
+    try:
+        page_size = int(req.params.get('page_size', DEFAULT_PAGE_SIZE))
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    except ValueError as e:
+        return func.HttpResponse(str(e), status_code=400)
+
+    try:
+        connect_str = os.environ["AzureWebJobsStorage"]
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
+
+        try:
+            page = query_index(
+                table_service_client,
+                provider=req.params.get('provider'),
+                region=req.params.get('region'),
+                type=req.params.get('type'),
+                status=req.params.get('status'),
+                page_size=page_size,
+                continuation_token=req.params.get('continuation_token')
+            )
+        except ValueError as e:
+            return func.HttpResponse(str(e), status_code=400)
+
+        headers = {}
+        if page['continuation_token']:
+            headers['X-Continuation-Token'] = page['continuation_token']
+        return listing_response(
+            req,
+            page['resources'],
+            extra={'continuation_token': page['continuation_token']},
+            headers=headers
+        )
+    except Exception as e:
+        logging.error(f"Error querying resource index: {e}", exc_info=True)
+        return func.HttpResponse(f"An error occurred: {str(e)}", status_code=500)
@@ -0,0 +1,228 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError
+
+logger = logging.getLogger(__name__)
+
+# (provider, service) -> (starting rate, ceiling) in calls per second. The rate
+# adapts between MIN_RATE and the ceiling from what the provider answers.
+RATES = {
+    ('aws', 'cloudwatch'): (50.0, 400.0),
+    ('aws', 'lightsail'): (10.0, 50.0),
+    ('azure', 'monitor'): (20.0, 100.0)
+}
+DEFAULT_RATE = (10.0, 100.0)
+MIN_RATE = 0.2
+# AIMD: a throttle halves the rate; successes add back about this many calls/s per second
+MULTIPLICATIVE_DECREASE = 0.5
+ADDITIVE_INCREASE = 1.0
+# Throttles landing within this long of a decrease belong to the same burst and don't halve again
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+DEFAULT_DEADLINE_SECONDS = 30
+BACKOFF_BASE_SECONDS = 0.2
+BACKOFF_MAX_SECONDS = 10
+MAX_LIMITERS = 1024
+
+THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottled', 'RequestThrottledException',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown', 'ProvisionedThroughputExceededException'
+}
+
+# Clients whose calls go through limited_call: the SDKs' own retries would
+# sleep and retry throttles out of the limiter's sight, so they are turned off.
+AWS_CLIENT_CONFIG = Config(retries={'mode': 'standard', 'max_attempts': 1})
+AZURE_CLIENT_OPTIONS = {'retry_total': 0}
+
+def rate_limit_deadline():
+    return float(os.getenv('RATE_LIMIT_DEADLINE_SECONDS', DEFAULT_DEADLINE_SECONDS))
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose rate follows the provider's throttling (AIMD): every
+    success raises it a little, a throttle halves it, and a Retry-After pauses
+    every caller of the bucket until it has passed. Holds one second of burst.
+    """
+
+    def __init__(self, rate, ceiling):
+        self.rate = rate
+        self.ceiling = ceiling
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, deadline):
+        """Take a token; returns how long to wait before using it, or None if that would pass the deadline."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max((1 - self.tokens) / self.rate, self.paused_until - now, 0)
+            if now + wait > deadline:
+                return None
+            # Reserve the token now so callers queue up instead of racing for it
+            self.tokens -= 1
+            return wait
+
+    def acquire(self, deadline):
+        """Wait for a token; returns False, without taking one, if it would come after the deadline."""
+        wait = self.reserve(deadline)
+        if wait is None:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+    def succeeded(self):
+        with self._lock:
+            self.rate = min(self.ceiling, self.rate + ADDITIVE_INCREASE / self.rate)
+
+    def throttled(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            if now - self.last_decrease >= DECREASE_COOLDOWN_SECONDS:
+                self.rate = max(MIN_RATE, self.rate * MULTIPLICATIVE_DECREASE)
+                self.last_decrease = now
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+
+_limiters = OrderedDict()  # (credential, provider, service, region) -> AdaptiveTokenBucket
+_limiters_lock = threading.Lock()
+
+def limiter(key):
+    """The process-wide bucket for a (credential, provider, service, region) key, shared by every collector."""
+    with _limiters_lock:
+        bucket = _limiters.get(key)
+        if bucket is None:
+            bucket = _limiters[key] = AdaptiveTokenBucket(*RATES.get(key[1:3], DEFAULT_RATE))
+            while len(_limiters) > MAX_LIMITERS:
+                _limiters.popitem(last=False)
+        _limiters.move_to_end(key)
+        return bucket
+
+def aws_key(client):
+    """Limiter key of a boto3 client: its access key id, service and region."""
+    credentials = getattr(getattr(client, '_request_signer', None), '_credentials', None)
+    return (getattr(credentials, 'access_key', None), 'aws', client.meta.service_model.service_name, client.meta.region_name)
+
+def azure_key(resource_id, service='monitor'):
+    """
+    Limiter key of an Azure call on a resource. Azure Monitor throttles per
+    subscription rather than per region, so the region is left out.
+    """
+    parts = resource_id.strip('/').split('/')
+    subscription_id = parts[1] if len(parts) > 1 and parts[0].lower() == 'subscriptions' else None
+    return (subscription_id, 'azure', service, None)
+
+def _retry_after(value):
+    """Seconds from a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def classify(error):
+    """('throttled' or 'transient', Retry-After seconds) for errors worth retrying, (None, None) otherwise."""
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code')
+        metadata = error.response.get('ResponseMetadata', {})
+        status = metadata.get('HTTPStatusCode') or 0
+        retry_after = _retry_after(metadata.get('HTTPHeaders', {}).get('retry-after'))
+        if code in THROTTLE_CODES or status == 429:
+            return 'throttled', retry_after
+        return ('transient', retry_after) if status >= 500 else (None, None)
+    if isinstance(error, HttpResponseError) and error.status_code:
+        headers = error.response.headers if error.response is not None else {}
+        retry_after = _retry_after(headers.get('Retry-After'))
+        if error.status_code == 429:
+            return 'throttled', retry_after
+        return ('transient', retry_after) if error.status_code >= 500 else (None, None)
+    if isinstance(error, (BotocoreConnectionError, ServiceRequestError, ServiceResponseError)):
+        return 'transient', None
+    return None, None
+
+def _retry_delay(key, bucket, error, attempt, give_up_at):
+    """Backoff before retrying a failed call, or None when the error is final or the deadline too close."""
+    kind, retry_after = classify(error)
+    if kind is None:
+        return None
+    if kind == 'throttled':
+        bucket.throttled(retry_after)
+    backoff = max(random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)), retry_after or 0)
+    if time.monotonic() + backoff > give_up_at:
+        return None
+    logger.info(f"{key[1]} {key[2]} call {kind} in {key[3] or 'any region'}, retry {attempt + 1} in {backoff:.2f}s "
+                f"(rate now {bucket.rate:.1f}/s): {error}")
+    return backoff
+
+def _no_slot(key):
+    return TimeoutError(f"No call slot for {key[1]} {key[2]} in {key[3] or 'any region'} before the deadline")
+
+def limited_call(key, fn, *args, deadline=None, **kwargs):
+    """
+    Call fn through the key's limiter. Throttles and transient errors are
+    retried after a full-jitter exponential backoff, waiting at least as long as
+    the Retry-After the provider sent, for as long as the next attempt can start
+    within the deadline (seconds from now; RATE_LIMIT_DEADLINE_SECONDS by
+    default). After that the last error is raised.
+    """
+    bucket = limiter(key)
+    give_up_at = time.monotonic() + (rate_limit_deadline() if deadline is None else deadline)
+    attempt = 0
+    while True:
+        if not bucket.acquire(give_up_at):
+            raise _no_slot(key)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            backoff = _retry_delay(key, bucket, e, attempt, give_up_at)
+            if backoff is None:
+                raise
+            attempt += 1
+            time.sleep(backoff)
+            continue
+        bucket.succeeded()
+        return result
+
+async def limited_call_async(key, fn, *args, deadline=None, **kwargs):
+    """limited_call for coroutine functions (aio SDK clients); waits without blocking the event loop."""
+    bucket = limiter(key)
+    give_up_at = time.monotonic() + (rate_limit_deadline() if deadline is None else deadline)
+    attempt = 0
+    while True:
+        wait = bucket.reserve(give_up_at)
+        if wait is None:
+            raise _no_slot(key)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            backoff = _retry_delay(key, bucket, e, attempt, give_up_at)
+            if backoff is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(backoff)
+            continue
+        bucket.succeeded()
+        return result
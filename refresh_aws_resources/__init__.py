@@ -1,10 +1,21 @@
-import logging
 import json
+import logging
 import os
 import boto3
 import azure.functions as func
-from azure.data.tables import TableServiceClient, UpdateMode
+from azure.data.tables import TableServiceClient
+from circuit_breaker import GLOBAL, CircuitBreakers
+from inventory_sink import InventorySink
+from http_responses import listing_response
+from instrumentation import azure_client_options, instrument_boto3, instrumented
+from profiling import profiled
+from table_schema import ensure_tables
+
+# boto3.client() below builds its clients from the default session
+instrument_boto3()
 
+@instrumented('refresh_aws_resources')
+@profiled('refresh_aws_resources')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request for AWS resources.')
 
@@ -22,7 +33,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
         
         # Get credentials from CloudCredentials table
         credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
@@ -34,50 +46,65 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         if not aws_access_key_id or not aws_secret_access_key:
             raise ValueError("AWS credentials not found or incomplete for the customer.")
 
+        # Revoked or under-privileged keys fail everywhere; don't spend the run finding that out again
+        breakers = CircuitBreakers(table_service_client, customer_id, 'aws')
+        if not breakers.allow(GLOBAL):
+            return func.HttpResponse(
+                json.dumps({"error": f"AWS credentials of customer {customer_id} keep failing; refresh skipped until {breakers.retry_at(GLOBAL)}"}),
+                status_code=503,
+                mimetype="application/json"
+            )
+
         # Get a list of all available AWS regions
         base_ec2_client = boto3.client('ec2', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name='us-east-1')
-        available_regions = [region['RegionName'] for region in base_ec2_client.describe_regions()['Regions']]
+        try:
+            available_regions = [region['RegionName'] for region in base_ec2_client.describe_regions()['Regions']]
+        except Exception as e:
+            breakers.record_failure(GLOBAL, e)
+            raise
+        breakers.record_success(GLOBAL)
         logging.info(f"Scanning {len(available_regions)} AWS regions.")
 
         all_resources = []
-        resources_client = table_service_client.get_table_client(table_name="AwsResources")
-
-        for region in available_regions:
-            try:
-                logging.info(f"Scanning region: {region}")
-                
-                # Create clients for the specific region
-                ec2_client = boto3.client('ec2', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region)
-                lightsail_client = boto3.client('lightsail', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region)
-
-                # --- Fetch EC2 Instances ---
-                ec2_response = ec2_client.describe_instances()
-                for reservation in ec2_response["Reservations"]:
-                    for instance in reservation["Instances"]:
-                        instance_id = instance["InstanceId"]
-                        name_tag = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), instance_id)
-                        resource = { "id": instance_id, "name": name_tag, "type": "EC2 Instance", "region": region, "status": instance["State"]["Name"], "details": { "instance_type": instance["InstanceType"] } }
+        with InventorySink(table_service_client, customer_id, 'aws') as sink:
+            for region in available_regions:
+                if not breakers.allow(region):
+                    logging.info(f"Skipping region {region}: its circuit breaker is open until {breakers.retry_at(region)}.")
+                    continue
+                try:
+                    logging.info(f"Scanning region: {region}")
+
+                    # Create clients for the specific region
+                    ec2_client = boto3.client('ec2', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region)
+                    lightsail_client = boto3.client('lightsail', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region)
+
+                    # --- Fetch EC2 Instances ---
+                    ec2_response = ec2_client.describe_instances()
+                    for reservation in ec2_response["Reservations"]:
+                        for instance in reservation["Instances"]:
+                            instance_id = instance["InstanceId"]
+                            name_tag = next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'), instance_id)
+                            resource = { "id": instance_id, "name": name_tag, "type": "EC2 Instance", "region": region, "status": instance["State"]["Name"], "details": { "instance_type": instance["InstanceType"] } }
+                            all_resources.append(resource)
+                            resource_entity = { "PartitionKey": customer_id, "RowKey": instance_id, "id": instance_id, "name": name_tag, "type": "EC2 Instance", "region": region, "status": instance["State"]["Name"], "instance_type": instance["InstanceType"] }
+                            sink.add(resource_entity)
+
+                    # --- Fetch Lightsail Instances ---
+                    lightsail_response = lightsail_client.get_instances()
+                    for instance in lightsail_response['instances']:
+                        instance_arn = instance['arn']
+                        resource = { "id": instance_arn, "name": instance['name'], "type": "Lightsail Instance", "region": instance['location']['regionName'], "status": instance['state']['name'], "details": { "blueprint": instance['blueprintName'] } }
                         all_resources.append(resource)
-                        resource_entity = { "PartitionKey": customer_id, "RowKey": instance_id, "name": name_tag, "type": "EC2 Instance", "region": region, "status": instance["State"]["Name"], "instance_type": instance["InstanceType"] }
-                        resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
-                
-                # --- Fetch Lightsail Instances ---
-                lightsail_response = lightsail_client.get_instances()
-                for instance in lightsail_response['instances']:
-                    instance_arn = instance['arn']
-                    resource = { "id": instance_arn, "name": instance['name'], "type": "Lightsail Instance", "region": instance['location']['regionName'], "status": instance['state']['name'], "details": { "blueprint": instance['blueprintName'] } }
-                    all_resources.append(resource)
-                    resource_entity = { "PartitionKey": customer_id, "RowKey": instance_arn.replace(":", "_").replace("/", "_"), "name": instance['name'], "type": "Lightsail Instance", "region": instance['location']['regionName'], "status": instance['state']['name'], "blueprint": instance['blueprintName'] }
-                    resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
-                    
-            except Exception as region_error:
-                logging.warning(f"Could not scan region {region}. It might be disabled for this account. Error: {str(region_error)}")
-
-        return func.HttpResponse(
-            json.dumps({"resources": all_resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+                        resource_entity = { "PartitionKey": customer_id, "RowKey": instance_arn.replace(":", "_").replace("/", "_"), "id": instance_arn, "name": instance['name'], "type": "Lightsail Instance", "region": instance['location']['regionName'], "status": instance['state']['name'], "blueprint": instance['blueprintName'] }
+                        sink.add(resource_entity)
+
+                    breakers.record_success(region)
+
+                except Exception as region_error:
+                    logging.warning(f"Could not scan region {region}. It might be disabled for this account. Error: {str(region_error)}")
+                    breakers.record_failure(region, region_error)
+
+        return listing_response(req, all_resources)
 
     except Exception as e:
         logging.error(f"Error fetching AWS resources: {e}", exc_info=True)
@@ -1,11 +1,17 @@
 import logging
-import json
 import os
 import azure.functions as func
-from azure.data.tables import TableServiceClient, UpdateMode
+from azure.data.tables import TableServiceClient
+from inventory_sink import InventorySink
+from http_responses import listing_response
+from instrumentation import azure_client_options, instrumented
+from profiling import profiled
+from table_schema import ensure_tables
 from azure.identity import ClientSecretCredential
 from azure.mgmt.compute import ComputeManagementClient
 
+@instrumented('refresh_azure_resources')
+@profiled('refresh_azure_resources')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request to refresh Azure resources.')
 
@@ -23,7 +29,8 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
+        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables'))
+        ensure_tables(table_service_client)
         
         # Get credentials from CloudCredentials table
         credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
@@ -43,46 +50,42 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             client_id=client_id,
             client_secret=client_secret
         )
-        compute_client = ComputeManagementClient(credential, subscription_id)
+        compute_client = ComputeManagementClient(credential, subscription_id, **azure_client_options('compute'))
 
         all_resources = []
-        resources_client = table_service_client.get_table_client(table_name="AzureResources")
+        with InventorySink(table_service_client, customer_id, 'azure') as sink:
+            for vm in compute_client.virtual_machines.list_all():
+                resource_group = vm.id.split("/")[4]
+                logging.info(f"Resource group for VM {vm.name}: {resource_group}")
+                try:
+                    instance_view = compute_client.virtual_machines.instance_view(resource_group, vm.name)
+                    statuses = [s for s in instance_view.statuses if s.code.startswith('PowerState/')]
+                    status = statuses[0].display_status if statuses else "unknown"
+                except Exception as e:
+                    logging.error(f"Failed to fetch instance_view for VM {vm.name}: {e}")
+                    status = "unknown"
+                resource = {
+                    "id": vm.id,
+                    "name": vm.name,
+                    "type": "Virtual Machine",
+                    "region": vm.location,
+                    "status": status,
+                    "details": {"vm_size": vm.hardware_profile.vm_size}
+                }
+                all_resources.append(resource)
+                resource_entity = {
+                    "PartitionKey": customer_id,
+                    "RowKey": vm.id.replace("/", "_"),
+                    "id": vm.id,
+                    "name": vm.name,
+                    "type": "Virtual Machine",
+                    "region": vm.location,
+                    "status": status,
+                    "vm_size": vm.hardware_profile.vm_size
+                }
+                sink.add(resource_entity)
 
-        for vm in compute_client.virtual_machines.list_all():
-            resource_group = vm.id.split("/")[4]
-            logging.info(f"Resource group for VM {vm.name}: {resource_group}")
-            try:
-                instance_view = compute_client.virtual_machines.instance_view(resource_group, vm.name)
-                statuses = [s for s in instance_view.statuses if s.code.startswith('PowerState/')]
-                status = statuses[0].display_status if statuses else "unknown"
-            except Exception as e:
-                logging.error(f"Failed to fetch instance_view for VM {vm.name}: {e}")
-                status = "unknown"
-            resource = {
-                "id": vm.id,
-                "name": vm.name,
-                "type": "Virtual Machine",
-                "region": vm.location,
-                "status": status,
-                "details": {"vm_size": vm.hardware_profile.vm_size}
-            }
-            all_resources.append(resource)
-            resource_entity = {
-                "PartitionKey": customer_id,
-                "RowKey": vm.id.replace("/", "_"),
-                "name": vm.name,
-                "type": "Virtual Machine",
-                "region": vm.location,
-                "status": status,
-                "vm_size": vm.hardware_profile.vm_size
-            }
-            resources_client.upsert_entity(entity=resource_entity, mode=UpdateMode.MERGE)
-        
-        return func.HttpResponse(
-            json.dumps({"resources": all_resources}),
-            status_code=200,
-            mimetype="application/json"
-        )
+        return listing_response(req, all_resources)
 
     except Exception as e:
         logging.error(f"Error fetching Azure resources: {e}", exc_info=True)
@@ -1,15 +1,42 @@
+import asyncio
 import logging
 import json
 import os
+import threading
+from collections import Counter
 from datetime import datetime, timedelta
 import azure.functions as func
-from azure.data.tables import TableServiceClient, UpdateMode
-from azure.identity import ClientSecretCredential
-from azure.mgmt.monitor import MonitorManagementClient
+from azure.data.tables import UpdateMode
+from azure.data.tables.aio import TableServiceClient
+from azure.identity.aio import ClientSecretCredential
+from azure.mgmt.monitor.aio import MonitorManagementClient
 import boto3
 from botocore.exceptions import ClientError, NoCredentialsError
+from circuit_breaker import GLOBAL, AsyncCircuitBreakers, is_auth_failure
+from metric_cache import STORED_PERIOD_SECONDS, metric_row_key
+from metric_schedule import log_schedule, plan_collection, record_collection_async
+from metric_windows import azure_interval
+from instrumentation import azure_client_options, instrument_boto3, instrumented
+from profiling import profiled
+from provider_metrics import EC2_METRICS, LIGHTSAIL_METRICS, azure_metric_names, lightsail_unit
+from rate_limit import AWS_CLIENT_CONFIG, AZURE_CLIENT_OPTIONS, aws_key, azure_key, limited_call, limited_call_async
+from table_schema import ensure_tables_async
+from table_transactions import submit_in_batches_async
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
+# boto3.client() below builds its clients from the default session
+instrument_boto3()
+# Creating clients from one session isn't thread-safe; using them is
+_aws_clients_lock = threading.Lock()
+
+DEFAULT_CONCURRENCY = 8
+
+def refresh_concurrency():
+    """Resources whose metrics are fetched and written at the same time (METRICS_REFRESH_CONCURRENCY)."""
+    return max(1, int(os.getenv('METRICS_REFRESH_CONCURRENCY', DEFAULT_CONCURRENCY)))
+
+@instrumented('refresh_metrics')
+@profiled('refresh_metrics')
+async def main(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Python HTTP trigger function processed a request to refresh metrics.')
 
     customer_id = req.params.get('customer_id')
@@ -24,44 +51,45 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
 
     try:
         connect_str = os.environ["AzureWebJobsStorage"]
-        table_service_client = TableServiceClient.from_connection_string(conn_str=connect_str)
-        metrics_client = table_service_client.get_table_client(table_name="ResourceMetrics")
-        credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
-        
-        # Get credentials for the provider
-        try:
-            credential_entity = credentials_client.get_entity(partition_key=provider.lower(), row_key=customer_id)
-        except Exception as e:
-            logging.error(f"Failed to get credentials for customer {customer_id} and provider {provider}: {e}")
-            return func.HttpResponse(
-                json.dumps({"error": f"Credentials not found for customer {customer_id} and provider {provider}"}),
-                status_code=404,
-                mimetype="application/json"
-            )
-        
-        metrics_written = 0
-        
-        if provider.lower() == 'aws':
-            metrics_written = refresh_aws_metrics(customer_id, credential_entity, table_service_client, metrics_client)
-        elif provider.lower() == 'azure':
-            metrics_written = refresh_azure_metrics(customer_id, credential_entity, table_service_client, metrics_client)
-        elif provider.lower() == 'digitalocean':
-            metrics_written = refresh_digitalocean_metrics(customer_id, credential_entity, table_service_client, metrics_client)
-        elif provider.lower() == 'alibaba':
-            metrics_written = refresh_alibaba_metrics(customer_id, credential_entity, table_service_client, metrics_client)
-        else:
+        async with TableServiceClient.from_connection_string(conn_str=connect_str, **azure_client_options('tables')) as table_service_client:
+            await ensure_tables_async(table_service_client)
+            metrics_client = table_service_client.get_table_client(table_name="ResourceMetrics")
+            credentials_client = table_service_client.get_table_client(table_name="CloudCredentials")
+
+            # Get credentials for the provider
+            try:
+                credential_entity = await credentials_client.get_entity(partition_key=provider.lower(), row_key=customer_id)
+            except Exception as e:
+                logging.error(f"Failed to get credentials for customer {customer_id} and provider {provider}: {e}")
+                return func.HttpResponse(
+                    json.dumps({"error": f"Credentials not found for customer {customer_id} and provider {provider}"}),
+                    status_code=404,
+                    mimetype="application/json"
+                )
+
+            metrics_written = 0
+
+            if provider.lower() == 'aws':
+                metrics_written = await refresh_aws_metrics(customer_id, credential_entity, table_service_client, metrics_client)
+            elif provider.lower() == 'azure':
+                metrics_written = await refresh_azure_metrics(customer_id, credential_entity, table_service_client, metrics_client)
+            elif provider.lower() == 'digitalocean':
+                metrics_written = refresh_digitalocean_metrics(customer_id, credential_entity, table_service_client, metrics_client)
+            elif provider.lower() == 'alibaba':
+                metrics_written = refresh_alibaba_metrics(customer_id, credential_entity, table_service_client, metrics_client)
+            else:
+                return func.HttpResponse(
+                    json.dumps({"error": f"Provider {provider} not supported for metrics refresh."}),
+                    status_code=400,
+                    mimetype="application/json"
+                )
+
             return func.HttpResponse(
-                json.dumps({"error": f"Provider {provider} not supported for metrics refresh."}),
-                status_code=400,
+                json.dumps({"status": "success", "metrics_written": metrics_written}),
+                status_code=200,
                 mimetype="application/json"
             )
-        
-        return func.HttpResponse(
-            json.dumps({"status": "success", "metrics_written": metrics_written}), 
-            status_code=200, 
-            mimetype="application/json"
-        )
-        
+
     except Exception as e:
         logging.error(f"Error refreshing metrics: {e}", exc_info=True)
         return func.HttpResponse(
@@ -70,10 +98,36 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json"
         )
 
-def refresh_aws_metrics(customer_id, credential_entity, table_service_client, metrics_client):
+async def write_metrics(metrics_client, entities):
+    """REPLACE-upsert one customer's metric rows in 100-entity transactions; returns how many were written."""
+    rows = list({entity["RowKey"]: entity for entity in entities}.values())  # A transaction touches each row once
+    await submit_in_batches_async(metrics_client, [('upsert', entity, {'mode': UpdateMode.REPLACE}) for entity in rows])
+    return len(rows)
+
+async def for_each_resource(resources, refresh_resource):
+    """Run refresh_resource over the resources, at most refresh_concurrency() at a time; returns the sum."""
+    semaphore = asyncio.Semaphore(refresh_concurrency())
+
+    async def bounded(resource):
+        async with semaphore:
+            return await refresh_resource(resource)
+    return sum(await asyncio.gather(*(bounded(resource) for resource in resources)))
+
+def aws_client(clients, service, aws_access_key_id, aws_secret_access_key, region):
+    """One boto3 client per service and region for a refresh, shared by its worker threads."""
+    with _aws_clients_lock:
+        if (service, region) not in clients:
+            clients[(service, region)] = boto3.client(
+                service,
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                region_name=region,
+                config=AWS_CLIENT_CONFIG
+            )
+        return clients[(service, region)]
+
+async def refresh_aws_metrics(customer_id, credential_entity, table_service_client, metrics_client):
     """Refresh AWS metrics for a customer"""
-    metrics_written = 0
-    
     aws_access_key_id = credential_entity.get("access_key_id")
     aws_secret_access_key = credential_entity.get("secret_access_key")
     
@@ -83,63 +137,81 @@ def refresh_aws_metrics(customer_id, credential_entity, table_service_client, me
     # Fetch all AWS resources for this customer
     resources_client = table_service_client.get_table_client(table_name="AwsResources")
     filter_query = f"PartitionKey eq '{customer_id}'"
-    resources = list(resources_client.query_entities(filter_query))
+    resources = [resource async for resource in resources_client.query_entities(filter_query)]
     
     # Set time range - last 2 hours to ensure we get data
     end_time = datetime.utcnow()
     start_time = end_time - timedelta(hours=2)
-    
-    for resource in resources:
+    reasons = Counter()
+    breakers = await AsyncCircuitBreakers.load(table_service_client, customer_id, 'aws')
+    clients = {}
+
+    def client(service, region):
+        return aws_client(clients, service, aws_access_key_id, aws_secret_access_key, region)
+
+    async def refresh_resource(resource):
+        # Stopped and terminated instances report nothing; skip them after one last pass
+        collect, reason = plan_collection(resource)
         region = resource.get("region")
-        resource_id = resource.get("id")
+        if collect and not await breakers.allow(region):
+            # Keys or region keep failing auth; the next probe is due at breakers.retry_at(region)
+            collect, reason = False, 'circuit_open'
+        reasons[reason] += 1
+        if not collect:
+            return 0
+        
+        # Rows written before the id property existed use the instance id as RowKey
+        resource_id = resource.get("id") or resource.get("RowKey")
         resource_type = resource.get("type", "").lower()
         resource_name = resource.get("name", "")
         
         try:
-            if "ec2" in resource_type or "instance" in resource_type:
-                metrics_written += fetch_ec2_metrics(
-                    aws_access_key_id, aws_secret_access_key, region,
-                    resource_id, customer_id, start_time, end_time, metrics_client
+            # boto3 has no asyncio client, so its blocking calls run on the default executor
+            entities = []
+            # Lightsail first: "Lightsail Instance" would also match the EC2 check
+            if "lightsail" in resource_type:
+                entities = await asyncio.to_thread(
+                    fetch_lightsail_metrics, client, region, resource_name, resource_id, customer_id, start_time, end_time
                 )
-            elif "lightsail" in resource_type:
-                metrics_written += fetch_lightsail_metrics(
-                    aws_access_key_id, aws_secret_access_key, region,
-                    resource_name, resource_id, customer_id, start_time, end_time, metrics_client
+            elif "ec2" in resource_type or "instance" in resource_type:
+                entities = await asyncio.to_thread(
+                    fetch_ec2_metrics, client, region, resource_id, customer_id, start_time, end_time
                 )
             elif "rds" in resource_type:
-                metrics_written += fetch_rds_metrics(
-                    aws_access_key_id, aws_secret_access_key, region,
-                    resource_id, customer_id, start_time, end_time, metrics_client
+                entities = await asyncio.to_thread(
+                    fetch_rds_metrics, client, region, resource_id, customer_id, start_time, end_time
                 )
+            written = await write_metrics(metrics_client, entities)
+            await record_collection_async(resources_client, resource, reason)
+            await breakers.record_success(region)
+            return written
         except Exception as e:
             logging.warning(f"Failed to fetch metrics for AWS resource {resource_id}: {e}")
-    
+            await breakers.record_failure(region, e)
+            return 0
+
+    metrics_written = await for_each_resource(resources, refresh_resource)
+    log_schedule('aws', customer_id, reasons)
     return metrics_written
 
-def fetch_ec2_metrics(aws_access_key_id, aws_secret_access_key, region, instance_id, customer_id, start_time, end_time, metrics_client):
-    """Fetch EC2 instance metrics"""
-    metrics_written = 0
+def fetch_ec2_metrics(client, region, instance_id, customer_id, start_time, end_time):
+    """Fetch EC2 instance metrics as ResourceMetrics entities"""
+    entities = []
     
     try:
-        cloudwatch_client = boto3.client(
-            'cloudwatch',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region
-        )
+        cloudwatch_client = client('cloudwatch', region)
         
-        # Fetch multiple metrics for EC2
-        metrics_to_fetch = ['CPUUtilization', 'NetworkIn', 'NetworkOut', 'DiskReadOps', 'DiskWriteOps']
-        
-        for metric_name in metrics_to_fetch:
+        # The series get_resource_details serves, so it finds them stored
+        for metric_name in EC2_METRICS:
             try:
-                result = cloudwatch_client.get_metric_statistics(
+                result = limited_call(
+                    aws_key(cloudwatch_client), cloudwatch_client.get_metric_statistics,
                     Namespace='AWS/EC2',
                     MetricName=metric_name,
                     Dimensions=[{'Name': 'InstanceId', 'Value': instance_id}],
                     StartTime=start_time,
                     EndTime=end_time,
-                    Period=300,  # 5 minutes
+                    Period=STORED_PERIOD_SECONDS,
                     Statistics=['Average', 'Maximum']
                 )
                 
@@ -148,7 +220,7 @@ def fetch_ec2_metrics(aws_access_key_id, aws_secret_access_key, region, instance
                     if 'Average' in dp:
                         entity = {
                             "PartitionKey": customer_id,
-                            "RowKey": f"aws_{instance_id}_{metric_name}_avg_{dp['Timestamp'].isoformat()}".replace(':', '_').replace('.', '_'),
+                            "RowKey": metric_row_key('aws', instance_id, metric_name, 'avg', dp['Timestamp'].isoformat()),
                             "provider": "aws",
                             "resource_id": instance_id,
                             "metric_name": metric_name,
@@ -157,14 +229,13 @@ def fetch_ec2_metrics(aws_access_key_id, aws_secret_access_key, region, instance
                             "timestamp": dp['Timestamp'].isoformat(),
                             "region": region
                         }
-                        metrics_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
-                        metrics_written += 1
+                        entities.append(entity)
                     
                     # Store maximum value
                     if 'Maximum' in dp:
                         entity = {
                             "PartitionKey": customer_id,
-                            "RowKey": f"aws_{instance_id}_{metric_name}_max_{dp['Timestamp'].isoformat()}".replace(':', '_').replace('.', '_'),
+                            "RowKey": metric_row_key('aws', instance_id, metric_name, 'max', dp['Timestamp'].isoformat()),
                             "provider": "aws",
                             "resource_id": instance_id,
                             "metric_name": metric_name,
@@ -173,47 +244,45 @@ def fetch_ec2_metrics(aws_access_key_id, aws_secret_access_key, region, instance
                             "timestamp": dp['Timestamp'].isoformat(),
                             "region": region
                         }
-                        metrics_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
-                        metrics_written += 1
+                        entities.append(entity)
                         
             except ClientError as e:
+                if is_auth_failure(e):
+                    raise  # Every other metric fails the same way; let the circuit breaker count it
                 logging.warning(f"Failed to fetch {metric_name} for EC2 instance {instance_id}: {e}")
                 
     except Exception as e:
+        if is_auth_failure(e):
+            raise
         logging.error(f"Error setting up CloudWatch client for region {region}: {e}")
         
-    return metrics_written
+    return entities
 
-def fetch_lightsail_metrics(aws_access_key_id, aws_secret_access_key, region, instance_name, resource_id, customer_id, start_time, end_time, metrics_client):
-    """Fetch Lightsail instance metrics"""
-    metrics_written = 0
+def fetch_lightsail_metrics(client, region, instance_name, resource_id, customer_id, start_time, end_time):
+    """Fetch Lightsail instance metrics as ResourceMetrics entities, stored under the inventory id (the ARN)"""
+    entities = []
     
     try:
-        lightsail_client = boto3.client(
-            'lightsail',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region
-        )
-        
-        metrics_to_fetch = ['CPUUtilization', 'NetworkIn', 'NetworkOut']
+        lightsail_client = client('lightsail', region)
         
-        for metric_name in metrics_to_fetch:
+        for metric_name in LIGHTSAIL_METRICS:
             try:
-                result = lightsail_client.get_instance_metric_data(
+                result = limited_call(
+                    aws_key(lightsail_client), lightsail_client.get_instance_metric_data,
                     instanceName=instance_name,
                     metricName=metric_name,
-                    period=300,
+                    period=STORED_PERIOD_SECONDS,
                     startTime=start_time,
                     endTime=end_time,
-                    unit='Percent' if metric_name == 'CPUUtilization' else 'Bytes'
+                    unit=lightsail_unit(metric_name),
+                    statistics=['Average']
                 )
                 
                 for dp in result.get('metricData', []):
                     if dp.get('average') is not None:
                         entity = {
                             "PartitionKey": customer_id,
-                            "RowKey": f"aws_{resource_id}_{metric_name}_{dp['timestamp'].isoformat()}".replace(':', '_').replace('.', '_'),
+                            "RowKey": metric_row_key('aws', resource_id, metric_name, dp['timestamp'].isoformat()),
                             "provider": "aws",
                             "resource_id": resource_id,
                             "metric_name": metric_name,
@@ -222,40 +291,39 @@ def fetch_lightsail_metrics(aws_access_key_id, aws_secret_access_key, region, in
                             "timestamp": dp['timestamp'].isoformat(),
                             "region": region
                         }
-                        metrics_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
-                        metrics_written += 1
+                        entities.append(entity)
                         
             except ClientError as e:
+                if is_auth_failure(e):
+                    raise  # Every other metric fails the same way; let the circuit breaker count it
                 logging.warning(f"Failed to fetch {metric_name} for Lightsail instance {instance_name}: {e}")
                 
     except Exception as e:
+        if is_auth_failure(e):
+            raise
         logging.error(f"Error setting up Lightsail client for region {region}: {e}")
         
-    return metrics_written
+    return entities
 
-def fetch_rds_metrics(aws_access_key_id, aws_secret_access_key, region, db_instance_id, customer_id, start_time, end_time, metrics_client):
-    """Fetch RDS instance metrics"""
-    metrics_written = 0
+def fetch_rds_metrics(client, region, db_instance_id, customer_id, start_time, end_time):
+    """Fetch RDS instance metrics as ResourceMetrics entities"""
+    entities = []
     
     try:
-        cloudwatch_client = boto3.client(
-            'cloudwatch',
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=region
-        )
+        cloudwatch_client = client('cloudwatch', region)
         
         metrics_to_fetch = ['CPUUtilization', 'DatabaseConnections', 'FreeableMemory', 'ReadLatency', 'WriteLatency']
         
         for metric_name in metrics_to_fetch:
             try:
-                result = cloudwatch_client.get_metric_statistics(
+                result = limited_call(
+                    aws_key(cloudwatch_client), cloudwatch_client.get_metric_statistics,
                     Namespace='AWS/RDS',
                     MetricName=metric_name,
                     Dimensions=[{'Name': 'DBInstanceIdentifier', 'Value': db_instance_id}],
                     StartTime=start_time,
                     EndTime=end_time,
-                    Period=300,
+                    Period=STORED_PERIOD_SECONDS,
                     Statistics=['Average']
                 )
                 
@@ -263,7 +331,7 @@ def fetch_rds_metrics(aws_access_key_id, aws_secret_access_key, region, db_insta
                     if 'Average' in dp:
                         entity = {
                             "PartitionKey": customer_id,
-                            "RowKey": f"aws_{db_instance_id}_{metric_name}_{dp['Timestamp'].isoformat()}".replace(':', '_').replace('.', '_'),
+                            "RowKey": metric_row_key('aws', db_instance_id, metric_name, dp['Timestamp'].isoformat()),
                             "provider": "aws",
                             "resource_id": db_instance_id,
                             "metric_name": metric_name,
@@ -272,18 +340,21 @@ def fetch_rds_metrics(aws_access_key_id, aws_secret_access_key, region, db_insta
                             "timestamp": dp['Timestamp'].isoformat(),
                             "region": region
                         }
-                        metrics_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
-                        metrics_written += 1
+                        entities.append(entity)
                         
             except ClientError as e:
+                if is_auth_failure(e):
+                    raise  # Every other metric fails the same way; let the circuit breaker count it
                 logging.warning(f"Failed to fetch {metric_name} for RDS instance {db_instance_id}: {e}")
                 
     except Exception as e:
+        if is_auth_failure(e):
+            raise
         logging.error(f"Error setting up CloudWatch client for RDS in region {region}: {e}")
         
-    return metrics_written
+    return entities
 
-def refresh_azure_metrics(customer_id, credential_entity, table_service_client, metrics_client):
+async def refresh_azure_metrics(customer_id, credential_entity, table_service_client, metrics_client):
     """Refresh Azure metrics for a customer"""
     metrics_written = 0
     
@@ -301,75 +372,86 @@ def refresh_azure_metrics(customer_id, credential_entity, table_service_client,
             client_id=client_id,
             client_secret=client_secret
         )
-        monitor_client = MonitorManagementClient(credential, subscription_id)
-        
-        # Fetch all Azure resources for this customer
-        resources_client = table_service_client.get_table_client(table_name="AzureResources")
-        filter_query = f"PartitionKey eq '{customer_id}'"
-        resources = list(resources_client.query_entities(filter_query))
-        
-        for resource in resources:
-            resource_id = resource.get("id")
-            region = resource.get("region")
-            resource_type = resource.get("type", "").lower()
-            
-            try:
-                # Determine metrics to fetch based on resource type
-                if "virtualmachine" in resource_type or "vm" in resource_type:
-                    metric_names = "Percentage CPU,Network In,Network Out,Disk Read Bytes,Disk Write Bytes"
-                elif "storage" in resource_type:
-                    metric_names = "UsedCapacity,Transactions"
-                elif "sql" in resource_type:
-                    metric_names = "cpu_percent,connection_successful,blocked_by_firewall"
-                else:
-                    metric_names = "Percentage CPU"  # Default metric
-                
-                metrics_data = monitor_client.metrics.list(
-                    resource_id,
-                    timespan="PT2H",  # Last 2 hours
-                    interval="PT5M",  # 5-minute intervals
-                    metricnames=metric_names,
-                    aggregation="Average,Maximum"
-                )
-                
-                for item in metrics_data.value:
-                    metric_name = item.name.value
-                    for timeseries in item.timeseries:
-                        for data in timeseries.data:
-                            # Store average value
-                            if data.average is not None:
-                                entity = {
-                                    "PartitionKey": customer_id,
-                                    "RowKey": f"azure_{resource_id.replace('/', '_')}_avg_{metric_name}_{data.time_stamp.isoformat()}".replace(':', '_').replace('.', '_'),
-                                    "provider": "azure",
-                                    "resource_id": resource_id,
-                                    "metric_name": metric_name,
-                                    "value": data.average,
-                                    "statistic": "Average",
-                                    "timestamp": data.time_stamp.isoformat(),
-                                    "region": region
-                                }
-                                metrics_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
-                                metrics_written += 1
-                            
-                            # Store maximum value
-                            if data.maximum is not None:
-                                entity = {
-                                    "PartitionKey": customer_id,
-                                    "RowKey": f"azure_{resource_id.replace('/', '_')}_max_{metric_name}_{data.time_stamp.isoformat()}".replace(':', '_').replace('.', '_'),
-                                    "provider": "azure",
-                                    "resource_id": resource_id,
-                                    "metric_name": metric_name,
-                                    "value": data.maximum,
-                                    "statistic": "Maximum",
-                                    "timestamp": data.time_stamp.isoformat(),
-                                    "region": region
-                                }
-                                metrics_client.upsert_entity(entity=entity, mode=UpdateMode.REPLACE)
-                                metrics_written += 1
-                                
-            except Exception as e:
-                logging.warning(f"Failed to fetch Azure metrics for {resource_id}: {e}")
+        async with credential, MonitorManagementClient(credential, subscription_id, **azure_client_options('monitor'), **AZURE_CLIENT_OPTIONS) as monitor_client:
+            # Fetch all Azure resources for this customer
+            resources_client = table_service_client.get_table_client(table_name="AzureResources")
+            filter_query = f"PartitionKey eq '{customer_id}'"
+            resources = [resource async for resource in resources_client.query_entities(filter_query)]
+            reasons = Counter()
+            # Azure credentials are subscription-wide, so one breaker covers every resource
+            breakers = await AsyncCircuitBreakers.load(table_service_client, customer_id, 'azure')
+
+            async def refresh_resource(resource):
+                # Deallocated VMs report nothing; skip them after one last pass
+                collect, reason = plan_collection(resource)
+                if collect and not await breakers.allow(GLOBAL):
+                    collect, reason = False, 'circuit_open'
+                reasons[reason] += 1
+                if not collect:
+                    return 0
+
+                resource_id = resource.get("id")
+                region = resource.get("region")
+
+                try:
+                    metrics_data = await limited_call_async(
+                        azure_key(resource_id), monitor_client.metrics.list,
+                        resource_id,
+                        timespan="PT2H",  # Last 2 hours
+                        interval=azure_interval(STORED_PERIOD_SECONDS),
+                        metricnames=",".join(azure_metric_names(resource_id)),
+                        aggregation="Average,Maximum"
+                    )
+
+                    entities = []
+                    for item in metrics_data.value:
+                        metric_name = item.name.value
+                        for timeseries in item.timeseries:
+                            for data in timeseries.data:
+                                # Store average value
+                                if data.average is not None:
+                                    entities.append({
+                                        "PartitionKey": customer_id,
+                                        "RowKey": metric_row_key('azure', resource_id, 'avg', metric_name, data.time_stamp.isoformat()),
+                                        "provider": "azure",
+                                        "resource_id": resource_id,
+                                        "metric_name": metric_name,
+                                        "value": data.average,
+                                        "statistic": "Average",
+                                        "timestamp": data.time_stamp.isoformat(),
+                                        "region": region,
+                                        "unit": str(item.unit),
+                                        "display_name": item.name.localized_value or metric_name
+                                    })
+
+                                # Store maximum value
+                                if data.maximum is not None:
+                                    entities.append({
+                                        "PartitionKey": customer_id,
+                                        "RowKey": metric_row_key('azure', resource_id, 'max', metric_name, data.time_stamp.isoformat()),
+                                        "provider": "azure",
+                                        "resource_id": resource_id,
+                                        "metric_name": metric_name,
+                                        "value": data.maximum,
+                                        "statistic": "Maximum",
+                                        "timestamp": data.time_stamp.isoformat(),
+                                        "region": region,
+                                        "unit": str(item.unit),
+                                        "display_name": item.name.localized_value or metric_name
+                                    })
+
+                    written = await write_metrics(metrics_client, entities)
+                    await record_collection_async(resources_client, resource, reason)
+                    await breakers.record_success(GLOBAL)
+                    return written
+
+                except Exception as e:
+                    logging.warning(f"Failed to fetch Azure metrics for {resource_id}: {e}")
+                    await breakers.record_failure(GLOBAL, e)
+                    return 0
+
+            metrics_written = await for_each_resource(resources, refresh_resource)
+            log_schedule('azure', customer_id, reasons)
                 
     except Exception as e:
         logging.error(f"Error setting up Azure Monitor client: {e}")
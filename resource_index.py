@@ -0,0 +1,230 @@
+import base64
+import json
+import logging
+from collections import defaultdict
+from azure.data.tables import TableTransactionError, UpdateMode
+from azure.core.exceptions import ResourceNotFoundError, ResourceExistsError
+from resource_listing import RESOURCE_TABLES
+from table_transactions import transaction_batches
+
+logger = logging.getLogger(__name__)
+
+# Index table -> the resource properties that make up its PartitionKey
+INDEX_TABLES = {
+    'ResourcesByRegion': ('provider', 'region'),
+    'ResourcesByTypeStatus': ('type', 'status'),
+    'ResourcesByStatus': ('status',)
+}
+
+# Properties copied onto every index row so ops views need no second read
+INDEXED_PROPERTIES = ('name', 'type', 'region', 'status')
+
+# Normalised copies stored as <prop>_key so non-key criteria can be filtered exactly
+FILTER_PROPERTIES = ('type', 'region', 'status')
+
+def _key_part(value):
+    """Normalise a property for use in an index key; Table keys may not contain / \\ # or ?."""
+    value = str(value or 'unknown').strip().lower()
+    for ch in '/\\#?':
+        value = value.replace(ch, '_')
+    return value
+
+def index_partition_key(table_name, values):
+    return '|'.join(_key_part(values.get(prop)) for prop in INDEX_TABLES[table_name])
+
+def _index_row_key(customer_id, provider, row_key):
+    return f"{customer_id}|{provider}|{row_key}"
+
+def _submit(table_client, operations):
+    """Submit one partition's operations in 100-entity transactions, creating the table on first use."""
+    for batch in transaction_batches(operations):
+        try:
+            table_client.submit_transaction(batch)
+        except ResourceNotFoundError:
+            try:
+                table_client.create_table()
+            except ResourceExistsError:
+                pass  # Another writer created it first
+            table_client.submit_transaction(batch)
+
+class ResourceIndexer:
+    """
+    Maintains the cross-customer index tables for one customer's provider inventory.
+
+    Create it before the inventory writes so it can snapshot the index keys the
+    resources had before this refresh, add() each entity as it is written, then
+    flush() once. Index rows whose keys changed (e.g. a status change) are deleted
+    from their old partition one by one after the upserts, so a row that is
+    already gone cannot fail a transaction.
+    The snapshot is also exposed through changes() and state() for rollups.
+    """
+
+    def __init__(self, table_service_client, customer_id, provider):
+        self.table_service_client = table_service_client
+        self.customer_id = customer_id
+        self.provider = provider
+        self._entities = {}
+        self._previous = self._load_previous()
+
+    def _load_previous(self):
+        table_client = self.table_service_client.get_table_client(table_name=RESOURCE_TABLES[self.provider])
+        previous = {}
+        try:
+            for entity in table_client.query_entities(
+                "PartitionKey eq @customer_id",
+                parameters={'customer_id': self.customer_id},
+                select=['RowKey', 'region', 'type', 'status']
+            ):
+                previous[entity['RowKey']] = self._key_values(entity)
+        except ResourceNotFoundError:
+            pass  # First refresh for this provider
+        return previous
+
+    def _key_values(self, entity):
+        return {prop: _key_part(entity.get(prop)) for prop in FILTER_PROPERTIES}
+
+    def _partition_keys(self, values):
+        values = dict(values, provider=self.provider)
+        return {table_name: index_partition_key(table_name, values) for table_name in INDEX_TABLES}
+
+    def add(self, entity):
+        self._entities[entity['RowKey']] = entity
+
+    def discard(self, row_key):
+        """Forget an added entity, e.g. one whose inventory write failed."""
+        self._entities.pop(row_key, None)
+
+    def changes(self):
+        """(previous, current) normalised type/region/status per added resource; previous is None for new ones."""
+        return [(self._previous.get(row_key), self._key_values(entity)) for row_key, entity in self._entities.items()]
+
+    def state(self):
+        """Normalised type/region/status of every resource in the partition once this refresh is written."""
+        merged = dict(self._previous)
+        merged.update((row_key, self._key_values(entity)) for row_key, entity in self._entities.items())
+        return list(merged.values())
+
+    def flush(self):
+        """Write index rows for every added entity and remove the stale ones; returns rows touched."""
+        upserts = defaultdict(list)  # (table, PartitionKey) -> operations
+        deletes = []  # (table, PartitionKey, RowKey) of rows left behind in an old partition
+        for row_key, entity in self._entities.items():
+            index_row_key = _index_row_key(self.customer_id, self.provider, row_key)
+            values = self._key_values(entity)
+            current = self._partition_keys(values)
+            previous = self._partition_keys(self._previous[row_key]) if row_key in self._previous else {}
+            for table_name, partition_key in current.items():
+                index_entity = {
+                    "PartitionKey": partition_key,
+                    "RowKey": index_row_key,
+                    "customer_id": self.customer_id,
+                    "provider": self.provider,
+                    "resource_key": row_key
+                }
+                for prop in INDEXED_PROPERTIES:
+                    if entity.get(prop) is not None:
+                        index_entity[prop] = entity[prop]
+                for prop in FILTER_PROPERTIES:
+                    index_entity[f"{prop}_key"] = values[prop]
+                upserts[(table_name, partition_key)].append(('upsert', index_entity, {'mode': UpdateMode.REPLACE}))
+
+                old_partition_key = previous.get(table_name)
+                if old_partition_key and old_partition_key != partition_key:
+                    deletes.append((table_name, old_partition_key, index_row_key))
+
+        written = 0
+        for (table_name, partition_key), partition_operations in upserts.items():
+            table_client = self.table_service_client.get_table_client(table_name=table_name)
+            try:
+                _submit(table_client, partition_operations)
+                written += len(partition_operations)
+            except TableTransactionError as e:
+                # One bad row fails the whole transaction; write the rest one by one
+                logger.warning(f"Transaction on {table_name} partition {partition_key} failed, retrying per row: {e}")
+                written += self._upsert_each(table_client, partition_operations)
+
+        for table_name, partition_key, index_row_key in deletes:
+            table_client = self.table_service_client.get_table_client(table_name=table_name)
+            try:
+                table_client.delete_entity(partition_key=partition_key, row_key=index_row_key)
+            except ResourceNotFoundError:
+                pass  # Already gone, which is the outcome we wanted
+            except Exception as e:
+                # Index rows are derived data; the next refresh retries the delete
+                logger.warning(f"Failed to delete stale {table_name} row {partition_key}/{index_row_key}: {e}")
+                continue
+            written += 1
+
+        logger.info(f"Updated {written} index rows for {self.provider} resources of customer {self.customer_id}.")
+        return written
+
+    def _upsert_each(self, table_client, operations):
+        written = 0
+        for _, index_entity, kwargs in operations:
+            try:
+                table_client.upsert_entity(index_entity, **kwargs)
+                written += 1
+            except Exception as e:
+                # Index rows are derived data; the next refresh rewrites them
+                logger.warning(f"Failed to write index row {index_entity['PartitionKey']}/{index_entity['RowKey']}: {e}")
+        return written
+
+def _encode_token(token):
+    return base64.urlsafe_b64encode(json.dumps(token, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+def _decode_token(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid continuation token")
+
+def query_index(table_service_client, provider=None, region=None, type=None, status=None,
+                page_size=100, continuation_token=None):
+    """
+    Read one page of resources across all customers from the narrowest index:
+    (provider, region), then (type, status), then status alone. Remaining
+    criteria are applied as filters inside that single partition.
+    """
+    criteria = {'provider': provider, 'region': region, 'type': type, 'status': status}
+    if provider and region:
+        table_name = 'ResourcesByRegion'
+    elif type and status:
+        table_name = 'ResourcesByTypeStatus'
+    elif status:
+        table_name = 'ResourcesByStatus'
+    else:
+        raise ValueError("Pass provider and region, type and status, or status")
+
+    indexed = INDEX_TABLES[table_name]
+    filters = ["PartitionKey eq @pk"]
+    parameters = {'pk': index_partition_key(table_name, criteria)}
+    for prop, value in criteria.items():
+        if value and prop not in indexed:
+            if prop == 'provider':
+                filters.append("provider eq @provider")
+                parameters['provider'] = _key_part(value)
+            else:
+                filters.append(f"{prop}_key eq @{prop}")
+                parameters[prop] = _key_part(value)
+
+    table_client = table_service_client.get_table_client(table_name=table_name)
+    pages = table_client.query_entities(
+        ' and '.join(filters),
+        parameters=parameters,
+        results_per_page=page_size
+    ).by_page(continuation_token=_decode_token(continuation_token) if continuation_token else None)
+    try:
+        entities = list(next(pages))
+    except (StopIteration, ResourceNotFoundError):
+        return {'resources': [], 'continuation_token': None}
+
+    for entity in entities:
+        entity.pop('PartitionKey', None)
+        entity.pop('RowKey', None)
+        for prop in FILTER_PROPERTIES:
+            entity.pop(f"{prop}_key", None)
+    next_token = pages.continuation_token
+    return {
+        'resources': entities,
+        'continuation_token': _encode_token(next_token) if next_token else None
+    }
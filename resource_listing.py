@@ -0,0 +1,151 @@
+import base64
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import ResourceNotFoundError
+from instrumentation import bind
+
+logger = logging.getLogger(__name__)
+
+# Cached inventory table for each provider, in the order results are merged
+RESOURCE_TABLES = {
+    'aws': 'AwsResources',
+    'azure': 'AzureResources',
+    'alibaba': 'AlibabaResources',
+    'digitalocean': 'DigitalOceanResources'
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def parse_providers(value):
+    """Turn a comma separated provider list (or 'all') into known provider names."""
+    if not value or value.lower() == 'all':
+        return list(RESOURCE_TABLES)
+    providers = [p.strip().lower() for p in value.split(',') if p.strip()]
+    unknown = [p for p in providers if p not in RESOURCE_TABLES]
+    if unknown:
+        raise ValueError(f"Unsupported provider(s): {', '.join(unknown)}")
+    # Keep merge order stable regardless of how the caller listed them
+    return [p for p in RESOURCE_TABLES if p in providers]
+
+def parse_select(value):
+    """Turn a comma separated property list into a select list for the table query."""
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    # RowKey is always fetched so every item keeps its id
+    return ['RowKey'] + [f for f in fields if f not in ('RowKey', 'PartitionKey', 'id')]
+
+def encode_continuation_token(state):
+    """Wrap per-provider table continuation tokens into one opaque string."""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_continuation_token(token):
+    """Inverse of encode_continuation_token; raises ValueError on anything we did not issue."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid continuation token")
+    if not isinstance(state, dict) or not state or not set(state) <= set(RESOURCE_TABLES):
+        raise ValueError("Invalid continuation token")
+    return state
+
+def _fetch_page(table_service_client, provider, customer_id, select, page_size, continuation_token):
+    """Read a single page of one provider's partition and return (entities, next_token)."""
+    table_client = table_service_client.get_table_client(table_name=RESOURCE_TABLES[provider])
+    pages = table_client.query_entities(
+        "PartitionKey eq @customer_id",
+        parameters={'customer_id': customer_id},
+        select=select,
+        results_per_page=page_size
+    ).by_page(continuation_token=continuation_token)
+    try:
+        entities = list(next(pages))
+    except StopIteration:
+        return [], None
+    except ResourceNotFoundError:
+        # The table doesn't exist yet, which is expected before the first refresh.
+        logger.info(f"{RESOURCE_TABLES[provider]} table not found, skipping.")
+        return [], None
+
+    for entity in entities:
+        # Reuse the entity dict instead of copying it just to drop the keys
+        entity.pop('PartitionKey', None)
+        row_key = entity.pop('RowKey', None)
+        if 'id' not in entity:
+            entity['id'] = row_key
+        entity['provider'] = provider
+    return entities, pages.continuation_token
+
+def _sequential_page(table_service_client, customer_id, active, state, select, page_size):
+    """
+    Fill a page from one provider after another, each asked for the room left,
+    for pages smaller than the number of unfinished providers. Providers the page
+    never reaches keep their table token in the returned state.
+    """
+    resources = []
+    next_state = {}
+    for provider in active:
+        room = page_size - len(resources)
+        if room == 0:
+            next_state[provider] = state[provider]
+            continue
+        entities, next_token = _fetch_page(table_service_client, provider, customer_id, select, room, state[provider])
+        resources.extend(entities)
+        if next_token:
+            next_state[provider] = next_token
+    return resources, next_state
+
+def list_resources_page(table_service_client, customer_id, providers, select=None,
+                        page_size=DEFAULT_PAGE_SIZE, continuation_token=None):
+    """
+    Return one merged page of cached resources across providers.
+
+    Each provider table is queried concurrently for its share of page_size, so at
+    most one page per provider is held in memory and the page never exceeds
+    page_size. When page_size is smaller than the number of unfinished providers,
+    the providers are read in turn instead, so each gets the room the ones
+    before it left. The returned continuation token carries every unfinished
+    provider's table token and is None on the last page.
+    """
+    if continuation_token:
+        state = decode_continuation_token(continuation_token)
+    else:
+        state = {provider: None for provider in providers}
+
+    active = [p for p in RESOURCE_TABLES if p in state]
+    if page_size < len(active):
+        resources, next_state = _sequential_page(table_service_client, customer_id, active, state, select, page_size)
+        return {
+            'resources': resources,
+            'continuation_token': encode_continuation_token(next_state) if next_state else None
+        }
+
+    # The first page_size % len(active) providers take one extra item each
+    share, extra = divmod(page_size, len(active))
+    sizes = {provider: share + (1 if i < extra else 0) for i, provider in enumerate(active)}
+
+    with ThreadPoolExecutor(max_workers=len(active)) as executor:
+        futures = {
+            provider: executor.submit(
+                bind(_fetch_page), table_service_client, provider, customer_id,
+                select, sizes[provider], state[provider]
+            )
+            for provider in active
+        }
+        results = {provider: future.result() for provider, future in futures.items()}
+
+    resources = []
+    next_state = {}
+    for provider in active:
+        entities, next_token = results[provider]
+        resources.extend(entities)
+        if next_token:
+            next_state[provider] = next_token
+
+    return {
+        'resources': resources,
+        'continuation_token': encode_continuation_token(next_state) if next_state else None
+    }
@@ -0,0 +1,43 @@
+import json
+import os
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is the fallback
+    orjson = None
+
+# Table Storage keys that never belong in an API response
+TABLE_KEYS = ('PartitionKey', 'RowKey')
+
+def _default(obj):
+    """Fallback for types neither encoder handles natively (SDK enums, Decimals, ...)."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+def dumps_stdlib(obj):
+    """Encode with the standard library; datetimes become ISO 8601 strings."""
+    return json.dumps(obj, default=_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def dumps_orjson(obj):
+    """Encode with orjson, which formats datetimes natively without a Python round trip."""
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+# JSON_BACKEND=stdlib forces the fallback, e.g. to compare output
+if orjson is not None and os.getenv('JSON_BACKEND', 'orjson').lower() != 'stdlib':
+    BACKEND = 'orjson'
+    _dumps = dumps_orjson
+else:
+    BACKEND = 'stdlib'
+    _dumps = dumps_stdlib
+
+def dumps(obj):
+    """Serialize a response payload to UTF-8 JSON bytes using the fastest available backend."""
+    return _dumps(obj)
+
+def shape_entity(entity):
+    """Drop table keys from an entity in place so it can be serialized without a copy."""
+    for key in TABLE_KEYS:
+        entity.pop(key, None)
+    return entity
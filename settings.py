@@ -1,40 +1,114 @@
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from azure.keyvault.secrets import SecretClient
 from azure.identity import DefaultAzureCredential
 from azure.data.tables import TableServiceClient
+from instrumentation import azure_client_options, bind
+from table_schema import CREDENTIALS_TABLE, ensure_tables
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Key Vault secrets are cached per process for this long; rotate with invalidate_secrets()
+DEFAULT_SECRET_CACHE_TTL_SECONDS = 300
+SECRET_CACHE_MAX_ENTRIES = 512
+SECRET_FETCH_WORKERS = 4
+
+_key_vault_client = None
+_key_vault_lock = threading.Lock()
+_secret_cache = OrderedDict()  # secret name -> (expires_at, value), least recently used first
+_secret_cache_lock = threading.Lock()
+
 # Load environment variables
 def load_environment():
     load_dotenv()
-    create_cloud_credentials_table_if_not_exists()
-    # No additional checks needed for Table Storage
+    try:
+        ensure_tables(get_table_service_client())
+    except ValueError as e:
+        logger.error(f"Failed to provision tables: {str(e)}")
 
 def get_key_vault_client():
-    """Get Azure Key Vault client for accessing secrets"""
-    try:
-        credential = DefaultAzureCredential()
-        key_vault_name = os.getenv('AZURE_KEY_VAULT_NAME')
-        key_vault_url = f"https://{key_vault_name}.vault.azure.net"
-        return SecretClient(vault_url=key_vault_url, credential=credential)
-    except Exception as e:
-        logger.error(f"Failed to initialize Key Vault client: {str(e)}")
-        raise
+    """
+    Get the process-wide Azure Key Vault client. DefaultAzureCredential probes
+    several auth sources when it is built, so that happens once per process.
+    """
+    global _key_vault_client
+    if _key_vault_client is None:
+        with _key_vault_lock:
+            if _key_vault_client is None:
+                try:
+                    credential = DefaultAzureCredential()
+                    key_vault_name = os.getenv('AZURE_KEY_VAULT_NAME')
+                    key_vault_url = f"https://{key_vault_name}.vault.azure.net"
+                    _key_vault_client = SecretClient(
+                        vault_url=key_vault_url, credential=credential, **azure_client_options('keyvault')
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to initialize Key Vault client: {str(e)}")
+                    raise
+    return _key_vault_client
+
+def secret_cache_ttl():
+    return float(os.getenv('SECRET_CACHE_TTL_SECONDS', DEFAULT_SECRET_CACHE_TTL_SECONDS))
+
+def _cached_secret(name):
+    with _secret_cache_lock:
+        cached = _secret_cache.get(name)
+        if cached and cached[0] > time.monotonic():
+            _secret_cache.move_to_end(name)
+            return cached
+        return None
+
+def get_secret(name):
+    """Read one Key Vault secret value through the TTL cache."""
+    cached = _cached_secret(name)
+    if cached:
+        return cached[1]
+    value = get_key_vault_client().get_secret(name).value
+    with _secret_cache_lock:
+        _secret_cache[name] = (time.monotonic() + secret_cache_ttl(), value)
+        _secret_cache.move_to_end(name)
+        while len(_secret_cache) > SECRET_CACHE_MAX_ENTRIES:
+            _secret_cache.popitem(last=False)
+    return value
+
+def get_secrets(names):
+    """Read several secrets; cache misses are fetched from Key Vault concurrently. Returns {name: value}."""
+    values = {}
+    missing = []
+    for name in names:
+        cached = _cached_secret(name)
+        if cached:
+            values[name] = cached[1]
+        else:
+            missing.append(name)
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(len(missing), SECRET_FETCH_WORKERS)) as executor:
+            values.update(zip(missing, executor.map(bind(get_secret), missing)))
+    return values
+
+def invalidate_secrets(customer_id=None):
+    """Drop cached secrets: all of them, or only one customer's (names end in -<customer_id>)."""
+    with _secret_cache_lock:
+        if customer_id is None:
+            _secret_cache.clear()
+            return
+        for name in [name for name in _secret_cache if name.endswith(f"-{customer_id}")]:
+            del _secret_cache[name]
 
 def get_table_service_client():
     connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
     if not connection_string:
         raise ValueError("AZURE_STORAGE_CONNECTION_STRING is not set in environment variables.")
-    return TableServiceClient.from_connection_string(conn_str=connection_string)
+    return TableServiceClient.from_connection_string(conn_str=connection_string, **azure_client_options('tables'))
 
 def create_cloud_credentials_table_if_not_exists():
     try:
-        table_service = get_table_service_client()
-        table_service.create_table_if_not_exists('CloudCredentials')
-        logger.info("CloudCredentials table checked/created.")
+        ensure_tables(get_table_service_client(), (CREDENTIALS_TABLE,))
     except Exception as e:
         logger.error(f"Failed to create/check CloudCredentials table: {str(e)}")
 
@@ -57,17 +131,17 @@ def get_cloud_credentials(customer_id, provider):
 def get_aws_credentials(customer_id):
     """Retrieve customer-specific AWS credentials from Key Vault"""
     try:
-        key_vault_client = get_key_vault_client()
-        
         # Get secrets from Key Vault
-        aws_access_key = key_vault_client.get_secret(f"aws-access-key-{customer_id}").value
-        aws_secret_key = key_vault_client.get_secret(f"aws-secret-key-{customer_id}").value
-        aws_region = key_vault_client.get_secret(f"aws-region-{customer_id}").value
+        secrets = get_secrets([
+            f"aws-access-key-{customer_id}",
+            f"aws-secret-key-{customer_id}",
+            f"aws-region-{customer_id}"
+        ])
         
         return {
-            'aws_access_key_id': aws_access_key,
-            'aws_secret_access_key': aws_secret_key,
-            'region_name': aws_region
+            'aws_access_key_id': secrets[f"aws-access-key-{customer_id}"],
+            'aws_secret_access_key': secrets[f"aws-secret-key-{customer_id}"],
+            'region_name': secrets[f"aws-region-{customer_id}"]
         }
     except Exception as e:
         logger.error(f"Failed to retrieve AWS credentials for customer {customer_id}: {str(e)}")
@@ -81,19 +155,19 @@ def get_aws_credentials(customer_id):
 def get_azure_credentials(customer_id):
     """Retrieve customer-specific Azure credentials from Key Vault"""
     try:
-        key_vault_client = get_key_vault_client()
-        
         # Get secrets from Key Vault
-        subscription_id = key_vault_client.get_secret(f"azure-subscription-id-{customer_id}").value
-        tenant_id = key_vault_client.get_secret(f"azure-tenant-id-{customer_id}").value
-        client_id = key_vault_client.get_secret(f"azure-client-id-{customer_id}").value
-        client_secret = key_vault_client.get_secret(f"azure-client-secret-{customer_id}").value
+        secrets = get_secrets([
+            f"azure-subscription-id-{customer_id}",
+            f"azure-tenant-id-{customer_id}",
+            f"azure-client-id-{customer_id}",
+            f"azure-client-secret-{customer_id}"
+        ])
         
         return {
-            'subscription_id': subscription_id,
-            'tenant_id': tenant_id,
-            'client_id': client_id,
-            'client_secret': client_secret
+            'subscription_id': secrets[f"azure-subscription-id-{customer_id}"],
+            'tenant_id': secrets[f"azure-tenant-id-{customer_id}"],
+            'client_id': secrets[f"azure-client-id-{customer_id}"],
+            'client_secret': secrets[f"azure-client-secret-{customer_id}"]
         }
     except Exception as e:
         logger.error(f"Failed to retrieve Azure credentials for customer {customer_id}: {str(e)}")
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _AsyncCall(_Call):
+    def __init__(self):
+        super().__init__()
+        self.done = asyncio.Event()
+
+class SingleFlight:
+    """
+    In-process request coalescing.
+
+    do(key, fn) runs fn once for all callers that arrive with the same key while
+    it is in flight; the others wait and share its result (or exception). A
+    successful result is also memoized for memo_ttl seconds to absorb bursts
+    that arrive just after it completes. Results are shared between callers, so
+    treat them as read-only.
+    """
+
+    def __init__(self, name, memo_ttl=5.0, max_memo_entries=256):
+        self.name = name
+        self.memo_ttl = memo_ttl
+        self.max_memo_entries = max_memo_entries
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._memo = OrderedDict()  # key -> (expires_at, result), oldest first
+        self._stats = {'executed': 0, 'coalesced': 0, 'memo_hits': 0, 'errors': 0}
+
+    def _join(self, key, new_call):
+        """Under the lock: (memo, call, leader). memo is (result,) on a memo hit; otherwise call is the one in flight, started here if leader."""
+        with self._lock:
+            memo = self._memo.get(key)
+            if memo and memo[0] > time.monotonic():
+                self._stats['memo_hits'] += 1
+                return (memo[1],), None, False
+            elif memo:
+                del self._memo[key]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = new_call()
+                self._stats['executed'] += 1
+            else:
+                self._stats['coalesced'] += 1
+            return None, call, leader
+
+    def _finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+            if call.error is None and self.memo_ttl > 0:
+                self._memo[key] = (time.monotonic() + self.memo_ttl, call.result)
+                self._memo.move_to_end(key)
+                while len(self._memo) > self.max_memo_entries:
+                    self._memo.popitem(last=False)
+            elif call.error is not None:
+                self._stats['errors'] += 1
+        call.done.set()
+
+    def do(self, key, fn):
+        """Return (result, outcome) where outcome is 'executed', 'coalesced' or 'memo'."""
+        memo, call, leader = self._join(key, _Call)
+        if memo:
+            return memo[0], 'memo'
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, 'coalesced'
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result, 'executed'
+
+    def stats(self):
+        """Counters since process start; 'coalesced' and 'memo_hits' are provider fetches saved."""
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls), memo_entries=len(self._memo))
+
+    def log_stats(self):
+        logger.info(f"Single-flight '{self.name}' stats: {self.stats()}")
+
+class AsyncSingleFlight(SingleFlight):
+    """SingleFlight for async handlers: do(key, fn) awaits fn(), and waiting callers await its result."""
+
+    async def do(self, key, fn):
+        memo, call, leader = self._join(key, _AsyncCall)
+        if memo:
+            return memo[0], 'memo'
+
+        if not leader:
+            await call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, 'coalesced'
+
+        try:
+            call.result = await fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result, 'executed'
@@ -0,0 +1,93 @@
+import logging
+import threading
+from azure.core.exceptions import HttpResponseError, ResourceExistsError
+from circuit_breaker import CIRCUIT_BREAKERS_TABLE
+from fleet_summary import FLEET_SUMMARY_TABLE
+from inventory_version import INVENTORY_VERSIONS_TABLE
+from metric_cache import METRICS_TABLE
+from profiling import PROFILES_TABLE
+from resource_index import INDEX_TABLES
+from resource_listing import RESOURCE_TABLES
+
+logger = logging.getLogger(__name__)
+
+CREDENTIALS_TABLE = 'CloudCredentials'
+
+# Every table the functions read or write: inventories, their index and rollup tables, metrics, profiles, breakers
+PROJECT_TABLES = (
+    CREDENTIALS_TABLE,
+    *RESOURCE_TABLES.values(),
+    *INDEX_TABLES,
+    FLEET_SUMMARY_TABLE,
+    INVENTORY_VERSIONS_TABLE,
+    METRICS_TABLE,
+    PROFILES_TABLE,
+    CIRCUIT_BREAKERS_TABLE
+)
+
+_ensured = set()  # (account url, table name) known to exist in this process
+_ensure_lock = threading.Lock()
+
+def ensure_tables(table_service_client, tables=PROJECT_TABLES):
+    """
+    Make sure the tables exist, once per process and storage account. The first
+    call lists the account's tables and creates the missing ones; later calls
+    return from memory without touching storage. A table another worker creates
+    at the same time is fine. On a storage error nothing is remembered, so the
+    next call tries again, and callers fall back to their ResourceNotFoundError
+    handling. Returns the tables created by this call.
+    """
+    account = getattr(table_service_client, 'url', None)
+    pending = [table for table in dict.fromkeys(tables) if (account, table) not in _ensured]
+    if not pending:
+        return []
+
+    with _ensure_lock:
+        pending = [table for table in pending if (account, table) not in _ensured]
+        if not pending:
+            return []
+        created = []
+        try:
+            existing = {table.name for table in table_service_client.list_tables()}
+            for table in pending:
+                if table not in existing:
+                    try:
+                        table_service_client.create_table(table)
+                        created.append(table)
+                    except ResourceExistsError:
+                        pass  # Another worker created it first
+                _ensured.add((account, table))
+        except HttpResponseError as e:
+            logger.warning(f"Could not ensure tables {pending}: {e}")
+        if created:
+            logger.info(f"Created tables: {', '.join(created)}")
+        return created
+
+async def ensure_tables_async(table_service_client, tables=PROJECT_TABLES):
+    """
+    ensure_tables for azure.data.tables.aio clients, sharing what it remembers.
+    Nothing is locked across awaits, so concurrent first requests may each list
+    the tables; creating one that already exists is tolerated as above.
+    """
+    account = getattr(table_service_client, 'url', None)
+    pending = [table for table in dict.fromkeys(tables) if (account, table) not in _ensured]
+    if not pending:
+        return []
+
+    created = []
+    try:
+        existing = {table.name async for table in table_service_client.list_tables()}
+        for table in pending:
+            if table not in existing:
+                try:
+                    await table_service_client.create_table(table)
+                    created.append(table)
+                except ResourceExistsError:
+                    pass  # Another worker created it first
+        with _ensure_lock:
+            _ensured.update((account, table) for table in pending)
+    except HttpResponseError as e:
+        logger.warning(f"Could not ensure tables {pending}: {e}")
+    if created:
+        logger.info(f"Created tables: {', '.join(created)}")
+    return created
@@ -0,0 +1,12 @@
+# Table Storage rejects more than 100 operations in one transaction
+MAX_BATCH_SIZE = 100
+
+def transaction_batches(operations):
+    """Split one partition's operations into lists small enough for a single transaction."""
+    operations = list(operations)
+    return [operations[start:start + MAX_BATCH_SIZE] for start in range(0, len(operations), MAX_BATCH_SIZE)]
+
+async def submit_in_batches_async(table_client, operations):
+    """Submit one partition's operations through an aio table client as consecutive transactions."""
+    for batch in transaction_batches(operations):
+        await table_client.submit_transaction(batch)
@@ -0,0 +1,108 @@
+"""
+Alibaba Cloud region scan against a stubbed EcsClient: DescribeRegions
+discovery, NextToken paging and a failing region. Inventory writes go to the
+in-memory table service the benchmarks use.
+"""
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from alibaba_inventory import PAGE_SIZE, collect_instances
+from fakes import InMemoryTableService
+from get_alibaba_resources import refresh_alibaba_inventory
+
+# region -> instances DescribeInstances reports there; None makes the region fail
+FLEET = {
+    'cn-hangzhou': 250,
+    'eu-central-1': 30,
+    'ap-southeast-1': None
+}
+
+class FakeEcsClient:
+    """Answers DescribeRegions and DescribeInstances for one region of FLEET, recording every call."""
+
+    def __init__(self, region_id, calls):
+        self.region_id = region_id
+        self.calls = calls
+
+    def describe_regions(self, request):
+        self.calls.append(('DescribeRegions', self.region_id, None))
+        regions = [SimpleNamespace(region_id=region_id) for region_id in FLEET]
+        return SimpleNamespace(body=SimpleNamespace(regions=SimpleNamespace(region=regions)))
+
+    def describe_instances(self, request):
+        self.calls.append(('DescribeInstances', request.region_id, request.next_token))
+        count = FLEET[request.region_id]
+        if count is None:
+            raise RuntimeError('Forbidden.RAM: not authorized in this region')
+        start = int(request.next_token or 0)
+        end = min(count, start + request.max_results)
+        instances = [
+            SimpleNamespace(instance_id=f"{request.region_id}-{i}", instance_name=f"ecs-{i}",
+                            region_id=request.region_id, status='Running', instance_type='ecs.g6.large')
+            for i in range(start, end)
+        ]
+        return SimpleNamespace(body=SimpleNamespace(
+            instances=SimpleNamespace(instance=instances),
+            next_token=str(end) if end < count else ''
+        ))
+
+class CollectInstancesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def create_client(self, region_id):
+        return FakeEcsClient(region_id, self.calls)
+
+    def test_scans_discovered_regions_page_by_page(self):
+        pages = []
+        errors = collect_instances(self.create_client, lambda region_id, instances: pages.append((region_id, instances)))
+
+        self.assertEqual(self.calls[0], ('DescribeRegions', 'cn-hangzhou', None))
+        scanned = {region_id for name, region_id, _ in self.calls if name == 'DescribeInstances'}
+        self.assertEqual(scanned, set(FLEET))
+
+        hangzhou = [instances for region_id, instances in pages if region_id == 'cn-hangzhou']
+        self.assertEqual([len(instances) for instances in hangzhou], [PAGE_SIZE, PAGE_SIZE, 50])
+        tokens = [token for name, region_id, token in self.calls if region_id == 'cn-hangzhou' and name == 'DescribeInstances']
+        self.assertEqual(tokens, [None, '100', '200'])
+        ids = [instance.instance_id for instances in hangzhou for instance in instances]
+        self.assertEqual(len(ids), 250)
+        self.assertEqual(len(set(ids)), 250)
+
+        self.assertEqual(sum(len(instances) for region_id, instances in pages if region_id == 'eu-central-1'), 30)
+        self.assertEqual(list(errors), ['ap-southeast-1'])
+        self.assertIn('Forbidden.RAM', errors['ap-southeast-1'])
+
+    def test_falls_back_to_home_region_when_discovery_fails(self):
+        def create_client(region_id):
+            client = FakeEcsClient(region_id, self.calls)
+            client.describe_regions = lambda request: (_ for _ in ()).throw(RuntimeError('DescribeRegions denied'))
+            return client
+
+        pages = []
+        errors = collect_instances(create_client, lambda region_id, instances: pages.append(region_id), 'eu-central-1')
+        self.assertEqual(errors, {})
+        self.assertEqual(pages, ['eu-central-1'])
+
+class RefreshAlibabaInventoryTest(unittest.TestCase):
+
+    def test_failing_region_does_not_stop_the_others_reaching_the_sink(self):
+        service = InMemoryTableService()
+        calls = []
+        resources, errors = refresh_alibaba_inventory(service, 'c1', lambda region_id: FakeEcsClient(region_id, calls))
+
+        self.assertEqual(list(errors), ['ap-southeast-1'])
+        self.assertEqual(len(resources), 280)
+        stored = list(service.get_table_client('AlibabaResources').query_entities("PartitionKey eq 'c1'"))
+        self.assertEqual(len(stored), 280)
+        self.assertEqual({row['region'] for row in stored}, {'cn-hangzhou', 'eu-central-1'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Rows refresh_metrics stores are the ones the detail lookups read back:
+EC2 and Lightsail datapoints written by the refresher round-trip through
+stored_and_plan, Lightsail keyed by its inventory ARN. Tables are the
+in-memory service the benchmarks use.
+"""
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fakes import InMemoryTableService
+from metric_cache import METRICS_TABLE
+from metric_windows import resolve_window
+from provider_metrics import EC2_METRICS, LIGHTSAIL_METRICS, lightsail_instance_name, lightsail_inventory_key, stored_and_plan
+from refresh_metrics import fetch_ec2_metrics, fetch_lightsail_metrics
+
+CUSTOMER_ID = 'customer-1'
+REGION = 'us-east-1'
+LIGHTSAIL_ARN = 'arn:aws:lightsail:us-east-1:123456789012:Instance/0d3c9a1e-5f4b-4c1e-9a7e-2b6f1c8d4e21'
+
+class FakeAwsClient:
+    """Answers CloudWatch GetMetricStatistics and Lightsail GetInstanceMetricData with 5-minute points up to now."""
+
+    def __init__(self, service, calls):
+        self.meta = SimpleNamespace(service_model=SimpleNamespace(service_name=service), region_name=REGION)
+        self.calls = calls
+
+    @staticmethod
+    def _timestamps():
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        return [now - timedelta(minutes=5 * k) for k in range(1, 13)]
+
+    def get_metric_statistics(self, **params):
+        self.calls.append(params)
+        return {'Datapoints': [
+            {'Timestamp': ts, 'Average': float(i), 'Maximum': float(i + 1)}
+            for i, ts in enumerate(self._timestamps())
+        ]}
+
+    def get_instance_metric_data(self, **params):
+        self.calls.append(params)
+        return {'metricName': params['metricName'], 'metricData': [
+            {'timestamp': ts, 'average': float(i), 'unit': params['unit']}
+            for i, ts in enumerate(self._timestamps())
+        ]}
+
+class MetricRoundTripTest(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.table_service = InMemoryTableService()
+        self.table_service.create_table(METRICS_TABLE)
+        self.metrics_client = self.table_service.get_table_client(METRICS_TABLE)
+        self.end_time = datetime.now(timezone.utc)
+        self.start_time = self.end_time - timedelta(hours=2)
+
+    def client(self, service, region):
+        return FakeAwsClient(service, self.calls)
+
+    def store(self, entities):
+        for entity in entities:
+            self.assertFalse(set(entity['RowKey']) & set('/\\#?'), entity['RowKey'])
+            self.metrics_client.upsert_entity(entity)
+
+    def test_lightsail_rows_are_read_back_by_inventory_arn(self):
+        self.store(fetch_lightsail_metrics(
+            self.client, REGION, 'web-1', LIGHTSAIL_ARN, CUSTOMER_ID, self.start_time, self.end_time
+        ))
+        self.assertEqual([call['metricName'] for call in self.calls], LIGHTSAIL_METRICS)
+        self.assertTrue(all(call['statistics'] == ['Average'] for call in self.calls))
+
+        stored, plan = stored_and_plan(
+            self.metrics_client, CUSTOMER_ID, 'aws', LIGHTSAIL_ARN, LIGHTSAIL_METRICS, resolve_window('aws')
+        )
+        self.assertEqual(sorted(stored), sorted(LIGHTSAIL_METRICS))
+        self.assertEqual(plan, {})
+
+    def test_ec2_rows_are_read_back(self):
+        self.store(fetch_ec2_metrics(
+            self.client, REGION, 'i-0abc', CUSTOMER_ID, self.start_time, self.end_time
+        ))
+
+        stored, plan = stored_and_plan(
+            self.metrics_client, CUSTOMER_ID, 'aws', 'i-0abc', EC2_METRICS, resolve_window('aws')
+        )
+        self.assertEqual(sorted(stored), sorted(EC2_METRICS))
+        self.assertEqual(plan, {})
+        # Maximum rows share the RowKey range but are not served as averages
+        self.assertEqual(len(stored['CPUUtilization']['data']), 12)
+
+    def test_lightsail_arn_resolves_to_instance_name(self):
+        self.table_service.create_table('AwsResources')
+        resources_client = self.table_service.get_table_client('AwsResources')
+        resources_client.upsert_entity({
+            'PartitionKey': CUSTOMER_ID, 'RowKey': lightsail_inventory_key(LIGHTSAIL_ARN),
+            'id': LIGHTSAIL_ARN, 'name': 'web-1', 'type': 'Lightsail Instance'
+        })
+
+        self.assertEqual(lightsail_instance_name(resources_client, CUSTOMER_ID, LIGHTSAIL_ARN), 'web-1')
+        self.assertEqual(lightsail_instance_name(resources_client, CUSTOMER_ID, 'ls-web-2'), 'ls-web-2')
+        self.assertIsNone(lightsail_instance_name(resources_client, CUSTOMER_ID, LIGHTSAIL_ARN + '-gone'))
+
+if __name__ == '__main__':
+    unittest.main()